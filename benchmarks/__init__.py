@@ -0,0 +1,8 @@
+"""
+Benchmarks of the pipeline stages on synthetic pointclouds.
+
+Run from the root of the repository; see benchmarks/run.py:
+
+    python -m benchmarks.run -s 10000,100000,1000000 -o results.json
+    python -m benchmarks.run -c results.json
+"""
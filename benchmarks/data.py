@@ -0,0 +1,91 @@
+"""
+Synthetic sites for the benchmarks.
+
+A site is a flat ground with a rectangular building and a red stick, with a
+constant density of points per square meter: larger sites cover a larger
+area, so the number of neighbours per point (and the work per point of
+DBSCAN, voxel filtering and ICP) does not depend on the size.
+"""
+from __future__ import division
+import numpy as np
+import pcl
+
+from patty import force_srs
+
+SRS = "EPSG:32633"
+OFFSET = [100000.0, 400000.0, 0.0]
+
+# fractions of the points on the ground, the walls and the stick
+GROUND = 0.6
+WALLS = 0.39
+STICK = 0.01
+
+
+def make_site(size, density=1000.0, seed=0):
+    """Points of a synthetic site.
+
+    Arguments:
+        size : int
+            Number of points.
+        density : float
+            Points per square meter of the ground.
+        seed : int
+            Seed of the random generator; the same seed gives the same site.
+
+    Returns:
+        points : np.array([size, 6]), float64
+            XYZ (relative to OFFSET) and RGB (0-255) of the points.
+        footprint : np.array([4, 3])
+            Corners of the building.
+    """
+    rng = np.random.RandomState(seed)
+    n_walls = int(size * WALLS)
+    n_stick = max(int(size * STICK), 1)
+    n_ground = size - n_walls - n_stick
+
+    side = np.sqrt(n_ground / density)
+    height = 0.2 * side
+    x0, y0 = 0.25 * side, 0.35 * side
+    x1, y1 = 0.75 * side, 0.65 * side
+    footprint = np.array([[x0, y0, 0], [x1, y0, 0], [x1, y1, 0], [x0, y1, 0]])
+
+    ground = np.zeros((n_ground, 6))
+    ground[:, 0:2] = rng.rand(n_ground, 2) * side
+    ground[:, 2] = rng.normal(0, 0.02, n_ground)
+    ground[:, 3:6] = [90, 110, 80] + rng.rand(n_ground, 3) * 40
+
+    # distance along the perimeter of the footprint
+    width, depth = x1 - x0, y1 - y0
+    along = rng.rand(n_walls) * 2 * (width + depth)
+    walls = np.zeros((n_walls, 6))
+    walls[:, 0] = x0 + np.clip(along, 0, width) - np.clip(
+        along - width - depth, 0, width)
+    walls[:, 1] = y0 + np.clip(along - width, 0, depth) - np.clip(
+        along - 2 * width - depth, 0, depth)
+    walls[:, 2] = rng.rand(n_walls) * height
+    walls[:, 3:6] = [160, 140, 120] + rng.rand(n_walls, 3) * 40
+
+    stick = np.zeros((n_stick, 6))
+    stick[:, 0:2] = [0.15 * side, 0.25 * side] + rng.normal(
+        0, 0.01, (n_stick, 2))
+    stick[:, 2] = rng.rand(n_stick)
+    stick[:, 3:6] = [220, 30, 50] + rng.rand(n_stick, 3) * 20
+
+    return np.vstack([ground, walls, stick]), footprint
+
+
+def make_pointcloud(points, rgb=True):
+    """Registered pcl.PointCloudXYZRGB (or pcl.PointCloud) of the points,
+    with offset OFFSET."""
+    points = np.asarray(points, dtype=np.float32)
+    if rgb:
+        pointcloud = pcl.PointCloudXYZRGB(points[:, 0:6])
+    else:
+        pointcloud = pcl.PointCloud(points[:, 0:3])
+    force_srs(pointcloud, srs=SRS, offset=OFFSET)
+    return pointcloud
+
+
+def make_footprint(footprint):
+    """Registered pcl.PointCloud of the footprint corners."""
+    return make_pointcloud(footprint, rgb=False)
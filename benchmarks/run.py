@@ -0,0 +1,96 @@
+#!/usr/bin/env python2.7
+"""Benchmarks of the pipeline stages on synthetic pointclouds.
+
+Times each stage at several sizes, and records the throughput and peak
+memory; compares with the results of an earlier run. Run from the root of
+the repository; all data is generated, no network or input files needed.
+
+Usage:
+  run.py [-h] [-s <sizes>] [-b <names>] [-r <repeat>] [-o <file>] [-c <file>] [-t <threshold>] [-d <dir>] [-N]
+
+Options:
+  -s <sizes>      Numbers of points, comma separated, eg.
+                  10000,100000,1000000,10000000 [default: 10000,100000]
+  -b <names>      Benchmarks to run, comma separated; default all:
+                  load_las, red_mask, dbscan_labels, boundary_of_drivemap,
+                  downsample_voxel, fine_registration.
+  -r <repeat>     Number of timed runs, the fastest is kept [default: 3]
+  -o <file>       Write the results to this JSON file, eg. a baseline.
+  -c <file>       Compare with the results in this JSON file (the baseline),
+                  and exit with status 1 if a benchmark got slower or uses
+                  more memory beyond the threshold.
+  -t <threshold>  Allowed relative increase of the time and memory
+                  [default: 0.5]
+  -d <dir>        Keep the generated LAS files in this directory, and reuse
+                  them in later runs; default a temporary directory.
+  -N              Do not trace the memory allocations (peak memory).
+
+Example:
+  python -m benchmarks.run -s 10000,100000,1000000 -o baseline.json
+  python -m benchmarks.run -s 10000,100000,1000000 -c baseline.json
+"""
+
+from __future__ import print_function
+from docopt import docopt
+
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from patty import log
+from benchmarks.suite import BENCHMARKS, compare, run_benchmarks
+
+
+def main(args):
+    sizes = [int(size) for size in args['-s'].split(',')]
+    if args['-b']:
+        names = [name.strip() for name in args['-b'].split(',')]
+    else:
+        names = list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit("Unknown benchmarks: %s; choose from %s" % (
+            ', '.join(unknown), ', '.join(BENCHMARKS)))
+
+    workdir = args['-d'] or tempfile.mkdtemp(prefix='patty-benchmarks-')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    try:
+        results = run_benchmarks(names, sizes, workdir,
+                                 repeat=int(args['-r']),
+                                 trace_memory=not args['-N'], log=log)
+    finally:
+        if not args['-d']:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args['-o']:
+        with open(args['-o'], 'w') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args['-c']:
+        with open(args['-c']) as f:
+            baseline = json.load(f)['results']
+        report, regressions = compare(results, baseline,
+                                      threshold=float(args['-t']))
+        log("Compared with %s:\n%s" % (args['-c'], '\n'.join(report)))
+        if regressions:
+            log("%d regressions:\n%s" % (len(regressions),
+                                         '\n'.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(docopt(__doc__)))
@@ -0,0 +1,277 @@
+"""
+The benchmarks, and measuring and comparing their results.
+
+Every benchmark times one pipeline stage on a synthetic site (see
+benchmarks.data) with a given number of points. The time is the fastest of
+a few runs; the memory is measured in a separate run, as tracing the
+allocations slows the stage down.
+
+Results are lists of dicts, with keys benchmark, size, seconds,
+points_per_second, max_rss_mb, max_rss_growth_mb and, with tracemalloc
+(Python 3.9+), traced_peak_mb: the largest memory allocated by the stage on
+top of what was allocated before.
+"""
+from __future__ import division
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from patty import downsample_voxel, memory
+from patty.segmentation import (boundary_of_drivemap, dbscan_labels,
+                                get_red_mask)
+from patty.registration import fine_registration
+from patty.utils import _load_las, save
+
+from benchmarks.data import make_footprint, make_pointcloud, make_site
+
+# differences in seconds below this are noise, not regressions
+MIN_SECONDS = 0.01
+# differences in memory below this are noise, not regressions
+MIN_MB = 1.0
+
+
+class Benchmark(object):
+    '''A pipeline stage, timed on a synthetic site.
+
+    Subclasses set the name and implement run(); setup() makes the input
+    once per size, prepare() is called before every run, untimed, for stages
+    that change their input or cache something on it.
+
+    Constructor usage: Benchmark(size, workdir), with workdir a directory
+    for files made by setup().
+    '''
+    name = None
+
+    def __init__(self, size, workdir):
+        self.size = size
+        self.workdir = workdir
+
+    def setup(self):
+        self.points, self.footprint = make_site(self.size)
+
+    def prepare(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+
+class LoadLas(Benchmark):
+    name = 'load_las'
+
+    def setup(self):
+        # writing is slow, so the files are kept in the workdir
+        self.path = os.path.join(self.workdir, 'site_%d.las' % self.size)
+        if not os.path.exists(self.path):
+            super(LoadLas, self).setup()
+            save(make_pointcloud(self.points), self.path)
+
+    def run(self):
+        _load_las(self.path)
+
+
+class RedMask(Benchmark):
+    name = 'red_mask'
+
+    def setup(self):
+        super(RedMask, self).setup()
+        self.pointcloud = make_pointcloud(self.points)
+
+    def run(self):
+        get_red_mask(self.pointcloud)
+
+
+class DbscanLabels(Benchmark):
+    name = 'dbscan_labels'
+
+    def setup(self):
+        super(DbscanLabels, self).setup()
+        self.pointcloud = make_pointcloud(self.points, rgb=False)
+
+    def run(self):
+        dbscan_labels(self.pointcloud, 0.1, 10)
+
+
+class BoundaryOfDrivemap(Benchmark):
+    name = 'boundary_of_drivemap'
+
+    def setup(self):
+        super(BoundaryOfDrivemap, self).setup()
+        self.drivemap = make_pointcloud(self.points, rgb=False)
+        self.footprint = make_footprint(self.footprint)
+
+    def run(self):
+        boundary_of_drivemap(self.drivemap, self.footprint)
+
+
+class DownsampleVoxel(Benchmark):
+    name = 'downsample_voxel'
+
+    def setup(self):
+        super(DownsampleVoxel, self).setup()
+        self.pointcloud = make_pointcloud(self.points)
+
+    def run(self):
+        downsample_voxel(self.pointcloud, 0.1)
+
+
+class FineRegistration(Benchmark):
+    '''ICP of the site, slightly rotated and moved, on a drivemap with a
+    tenth of the points; serially, with the numpy ICP engine.'''
+    name = 'fine_registration'
+
+    def setup(self):
+        super(FineRegistration, self).setup()
+        self.drivemap = make_pointcloud(self.points[::10], rgb=False)
+        self.center = self.points[:, 0:3].mean(axis=0)
+
+        angle = np.radians(2.0)
+        rotation = np.array([[np.cos(angle), -np.sin(angle), 0],
+                             [np.sin(angle), np.cos(angle), 0],
+                             [0, 0, 1]])
+        self.source = np.array(self.points)
+        self.source[:, 0:3] = (np.dot(self.points[:, 0:3] - self.center,
+                                      rotation.T) +
+                               self.center + [0.1, -0.1, 0])
+
+    def prepare(self):
+        # registration moves the points
+        self.pointcloud = make_pointcloud(self.source, rgb=False)
+
+    def run(self):
+        fine_registration(self.pointcloud, self.drivemap, self.center,
+                          voxelsize=0.1, n_jobs=1, method='icp')
+
+
+BENCHMARKS = OrderedDict((benchmark.name, benchmark) for benchmark in [
+    LoadLas, RedMask, DbscanLabels, BoundaryOfDrivemap, DownsampleVoxel,
+    FineRegistration])
+
+
+def measure(benchmark, repeat=3, trace_memory=True):
+    """Time benchmark, set up already, and measure its memory use.
+
+    Returns:
+        result : dict
+    """
+    max_rss = memory.max_rss()
+    seconds = []
+    for _ in range(repeat):
+        benchmark.prepare()
+        start = time.time()
+        benchmark.run()
+        seconds.append(time.time() - start)
+
+    result = {
+        'benchmark': benchmark.name,
+        'size': benchmark.size,
+        'seconds': min(seconds),
+        'points_per_second': benchmark.size / max(min(seconds), 1e-9),
+    }
+    if max_rss is not None:
+        result['max_rss_mb'] = memory.max_rss() / memory.MB
+        result['max_rss_growth_mb'] = (memory.max_rss() - max_rss) / memory.MB
+
+    if trace_memory and memory.tracing_available():
+        was_tracing = memory.tracing()
+        memory.start_tracing()
+        try:
+            benchmark.prepare()
+            before, _ = memory.tracemalloc.get_traced_memory()
+            memory.tracemalloc.reset_peak()
+            benchmark.run()
+            _, peak = memory.tracemalloc.get_traced_memory()
+        finally:
+            if not was_tracing:
+                memory.stop_tracing()
+        result['traced_peak_mb'] = (peak - before) / memory.MB
+
+    return result
+
+
+def run_benchmarks(names, sizes, workdir, repeat=3, trace_memory=True,
+                   log=None):
+    """Run the named benchmarks at the sizes, smallest first.
+
+    A benchmark that fails is recorded with its error, and not retried at
+    larger sizes.
+
+    Returns:
+        results : list of dict
+    """
+    results = []
+    for name in names:
+        for size in sorted(sizes):
+            benchmark = BENCHMARKS[name](size, workdir)
+            try:
+                benchmark.setup()
+                result = measure(benchmark, repeat, trace_memory)
+            except Exception as e:
+                result = {'benchmark': name, 'size': size,
+                          'error': '%s: %s' % (type(e).__name__, e)}
+            results.append(result)
+            if log is not None:
+                log(format_result(result))
+            if 'error' in result:
+                break
+    return results
+
+
+def format_result(result):
+    if 'error' in result:
+        return '%-22s %10d  FAILED %s' % (
+            result['benchmark'], result['size'], result['error'])
+    return '%-22s %10d %10.3f s %12.0f points/s %9.1f MB' % (
+        result['benchmark'], result['size'], result['seconds'],
+        result['points_per_second'], result.get('traced_peak_mb', 0))
+
+
+def compare(results, baseline, threshold=0.5):
+    """Compare results with the baseline results.
+
+    A benchmark regressed when it takes more than 1 + threshold times the
+    seconds of the baseline, or traces more than 1 + threshold times the
+    peak memory; differences smaller than MIN_SECONDS and MIN_MB are
+    ignored. Benchmarks missing from the baseline are skipped.
+
+    Returns:
+        report : list of string
+            A line per benchmark found in the baseline.
+        regressions : list of string
+            The lines of the benchmarks that regressed.
+    """
+    reference = dict(((r['benchmark'], r['size']), r) for r in baseline
+                     if 'error' not in r)
+    report = []
+    regressions = []
+    for result in results:
+        base = reference.get((result['benchmark'], result['size']))
+        if base is None:
+            continue
+        if 'error' in result:
+            line = '%-22s %10d  FAILED' % (result['benchmark'],
+                                           result['size'])
+            report.append(line)
+            regressions.append(line)
+            continue
+
+        slower = (result['seconds'] > base['seconds'] * (1 + threshold) and
+                  result['seconds'] - base['seconds'] > MIN_SECONDS)
+        line = '%-22s %10d %10.3f s %10.3f s %6.2fx' % (
+            result['benchmark'], result['size'], result['seconds'],
+            base['seconds'], result['seconds'] / max(base['seconds'], 1e-9))
+
+        larger = False
+        if 'traced_peak_mb' in result and 'traced_peak_mb' in base:
+            peak, base_peak = result['traced_peak_mb'], base['traced_peak_mb']
+            larger = (peak > base_peak * (1 + threshold) and
+                      peak - base_peak > MIN_MB)
+            line += ' %9.1f MB %9.1f MB' % (peak, base_peak)
+
+        if slower or larger:
+            line += '  REGRESSION'
+            regressions.append(line)
+        report.append(line)
+    return report, regressions
@@ -1,9 +1,13 @@
 from .utils import (
     load,
+    load_las_sample,
     save,
+    transform_las,
     clone,
+    downsample_poisson,
     downsample_random,
     downsample_voxel,
+    extract_indices,
     extract_mask,
     make_las_header,
     measure_length,
@@ -11,6 +15,22 @@ from .utils import (
     log,
     )
 
+from .moments import (
+    Moments,
+    )
+
+from .affine import (
+    Affine,
+    )
+
+from .subset import (
+    PointSubset,
+    )
+
+from .voxelgrid import (
+    VoxelGrid,
+    )
+
 from .srs import (
     set_srs,
     force_srs,
@@ -19,18 +39,26 @@ from .srs import (
     )
 
 __all__ = [
+    'Affine',
     'BoundingBox',
     'clone',
+    'downsample_poisson',
     'downsample_random',
     'downsample_voxel',
     'set_srs',
     'force_srs',
     'same_srs',
+    'extract_indices',
     'extract_mask',
     'is_registered',
     'load',
+    'load_las_sample',
     'make_las_header',
+    'Moments',
+    'PointSubset',
     'save',
+    'transform_las',
+    'VoxelGrid',
     'measure_length',
     'log',
 ]
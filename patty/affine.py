@@ -0,0 +1,113 @@
+"""
+Composable affine transforms for pointclouds.
+
+An Affine accumulates a chain of rotations, scalings, translations and
+transforms as a single 4x4 matrix in float64, with the same semantics as the
+corresponding pcl.PointCloud methods. The chain can then be applied to a
+pointcloud in one pass, or exported as a 4x4 matrix:
+
+    affine = Affine().rotate(rotation, origin=center).scale(2.0)
+    affine.translate([1, 0, 0])
+    affine.apply(pointcloud)
+"""
+import numpy as np
+
+from patty.moments import DEFAULT_CHUNK_SIZE, iter_chunks
+from patty.spatialindex import invalidate_spatial_index
+
+
+def _translation(vector):
+    matrix = np.eye(4)
+    matrix[0:3, 3] = vector
+    return matrix
+
+
+class Affine(object):
+    '''Affine transform of 3D points, as a 4x4 float64 matrix.
+
+    The methods rotate(), scale(), translate() and transform() append a
+    step to the chain, that is they act on the points as transformed by the
+    steps before, and return the Affine itself so calls can be chained.
+
+    Constructor usage: Affine() for the identity, or Affine(matrix) with a
+    4x4 matrix.
+
+    Attributes:
+        matrix : np.array([4, 4]), float64
+    '''
+
+    def __init__(self, matrix=None):
+        if matrix is None:
+            self.matrix = np.eye(4)
+        else:
+            self.matrix = np.array(matrix, dtype=np.float64)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.matrix, dtype=dtype)
+
+    def __repr__(self):
+        return 'Affine(%r)' % self.matrix.tolist()
+
+    def copy(self):
+        return Affine(self.matrix)
+
+    def transform(self, matrix):
+        '''Append a 4x4 transform (array or Affine).'''
+        self.matrix = np.dot(np.asarray(matrix, dtype=np.float64),
+                             self.matrix)
+        return self
+
+    def rotate(self, rotation, origin=None):
+        '''Append a rotation around origin (default [0,0,0]), as
+        pcl.PointCloud.rotate; of a 4x4 matrix the 3x3 part is used.'''
+        step = np.eye(4)
+        step[0:3, 0:3] = np.asarray(rotation, dtype=np.float64)[0:3, 0:3]
+        return self._about(step, origin)
+
+    def scale(self, factor, origin=None):
+        '''Append a scaling around origin (default [0,0,0]), as
+        pcl.PointCloud.scale; factor is a scalar or one factor per axis.'''
+        step = np.eye(4)
+        step[0:3, 0:3] *= np.asarray(factor, dtype=np.float64)
+        return self._about(step, origin)
+
+    def translate(self, vector):
+        '''Append a translation.'''
+        return self.transform(_translation(vector))
+
+    def _about(self, step, origin):
+        if origin is not None:
+            origin = np.asarray(origin, dtype=np.float64)
+            step = np.dot(_translation(origin),
+                          np.dot(step, _translation(-origin)))
+        return self.transform(step)
+
+    def inverse(self):
+        return Affine(np.linalg.inv(self.matrix))
+
+    def transform_points(self, points):
+        '''Transformed copy of the xyz coordinates, np.array([N, 3]).'''
+        points = np.asarray(points)[:, 0:3]
+        return np.dot(points, self.matrix[0:3, 0:3].T) + self.matrix[0:3, 3]
+
+    def transformed_bounds(self, points, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''Minimum and maximum (np.array([3]) each) of the transformed
+        points, without transforming them all at once.'''
+        lower = np.inf
+        upper = -np.inf
+        for chunk in iter_chunks(np.asarray(points), chunk_size):
+            transformed = self.transform_points(chunk)
+            lower = np.minimum(lower, transformed.min(axis=0))
+            upper = np.maximum(upper, transformed.max(axis=0))
+        return lower, upper
+
+    def apply(self, pointcloud, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''Transform a pointcloud (or an array of points) in-place.
+
+        The points are transformed chunk-wise in float64; only the xyz
+        columns are changed. Returns the pointcloud, for convenience.'''
+        points = np.asarray(pointcloud)
+        for chunk in iter_chunks(points, chunk_size):
+            chunk[:, 0:3] = self.transform_points(chunk)
+        invalidate_spatial_index(pointcloud)
+        return pointcloud
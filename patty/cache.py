@@ -0,0 +1,165 @@
+"""
+Content-addressed on-disk cache for the outputs of pipeline stages.
+
+A stage output is stored under a key computed from the stage name, the
+contents of the input arrays (including the offset and SRS of registered
+pointclouds), and the stage parameters. Rerunning a stage with unchanged
+inputs then reads the stored output instead of recomputing it.
+
+Example:
+
+    cache = StageCache('/tmp/patty-cache')
+    key = cache.key('stick_scale', pointcloud, eps=0.1)
+    result = cache.get(key)
+    if result is None:
+        result = get_stick_scale(pointcloud, eps=0.1)
+        cache.put(key, result)
+
+or shorter, with cached():
+
+    result = cached(cache, lambda: get_stick_scale(pointcloud, eps=0.1),
+                    'stick_scale', pointcloud, eps=0.1)
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from patty.srs import is_registered
+from patty.instrument import count
+from patty.utils import log
+
+
+class StageCache(object):
+    '''Pickled stage outputs in a directory, with size-bounded LRU eviction.
+
+    Every hit updates the modification time of the entry; when the total size
+    of the entries exceeds max_bytes, the least recently used entries are
+    removed.
+
+    Constructor usage: StageCache(directory, max_bytes=2 ** 30). The directory
+    is created when it does not exist.
+    '''
+
+    suffix = '.stage'
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, stage, *inputs, **params):
+        '''Hex digest of the stage name, inputs and parameters.
+
+        Inputs can be pointclouds, arrays, or anything with a stable repr();
+        arrays are hashed by content. An input with a content_digest
+        attribute, like patty.registration.DrivemapIndex, is represented by
+        that digest, so it is not hashed again for every key.
+        '''
+        digest = hashlib.md5()
+        digest.update(stage.encode('utf-8'))
+        for value in inputs:
+            update_digest(digest, value)
+        for name in sorted(params):
+            digest.update(name.encode('utf-8'))
+            update_digest(digest, params[name])
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key, default=None):
+        '''Stored value for key, or default when not cached.'''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return default
+
+        # mark as recently used
+        os.utime(path, None)
+        return value
+
+    def put(self, key, value):
+        '''Store value under key, and evict old entries when needed.'''
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        '''Remove least recently used entries until below max_bytes.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def cached(cache, function, stage, *inputs, **params):
+    """Return function(), or its stored result if the cache has it already.
+
+    The result is stored under cache.key(stage, *inputs, **params). With
+    cache None, just call function.
+    """
+    if cache is None:
+        return function()
+
+    key = cache.key(stage, *inputs, **params)
+    stored = cache.get(key)
+    if stored is not None:
+        log(" - Using cached %s" % stage)
+        count('cache_hits')
+        return stored[0]
+
+    count('cache_misses')
+    value = function()
+    # wrapped, so a result of None can be told apart from a miss
+    cache.put(key, (value,))
+    return value
+
+
+def update_digest(digest, value):
+    """Add a value to the digest: arrays by content, others by repr."""
+    content_digest = getattr(value, 'content_digest', None)
+    if content_digest is not None:
+        digest.update(content_digest.encode('utf-8'))
+        return
+
+    if value is None or isinstance(value, (bool, int, float, str, tuple)):
+        digest.update(repr(value).encode('utf-8'))
+        return
+
+    array = np.ascontiguousarray(value)
+    digest.update(('%s%s' % (array.dtype.str, array.shape)).encode('utf-8'))
+    digest.update(array.reshape(-1).view(np.uint8))
+
+    if is_registered(value):
+        digest.update(np.asarray(value.offset, dtype=np.float64).tobytes())
+        digest.update(value.srs.ExportToWkt().encode('utf-8'))
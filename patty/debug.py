@@ -0,0 +1,123 @@
+"""
+Opt-in debug artifacts for the registration pipeline.
+
+Intermediate pointclouds (boundaries, ICP attempts, ...) can be written for
+inspection. This is disabled by default; enable it by setting the
+environment variable PATTY_DEBUG_DIR to a directory, or by calling
+configure_debug(). The points are copied when debug_save() is called, and
+written to numpy .npz files by a background thread, so the pipeline does not
+wait for the disk.
+
+Files are named <run>.<pid>.<name>.npz, so parallel runs writing to the same
+directory do not overwrite each other's files. Each file holds the arrays
+'points' and 'offset', and the string 'srs' (WKT) when known:
+
+    data = np.load(path)
+    absolute = data['points'][:, 0:3] + data['offset']
+"""
+
+import atexit
+import os
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+
+from patty.srs import is_registered
+from patty.utils import log
+
+_config = {
+    'directory': os.environ.get('PATTY_DEBUG_DIR') or None,
+    'run': os.environ.get('PATTY_DEBUG_RUN') or 'patty',
+}
+# writer thread and its queue, per process
+_writer = {'pid': None, 'queue': None}
+
+
+def configure_debug(directory=None, run=None):
+    """Enable debug artifacts in directory, or disable them with None.
+
+    Arguments:
+        directory : string or None
+            Directory to write to; created when it does not exist.
+        run : string, optional
+            Name of the run, used as prefix of the filenames.
+    """
+    flush_debug()
+    _config['directory'] = directory
+    if run is not None:
+        _config['run'] = run
+
+
+def debug_enabled():
+    """True when debug artifacts are written."""
+    return _config['directory'] is not None
+
+
+def debug_save(name, points, same_as=None):
+    """Queue a pointcloud to be written as debug artifact <name>.
+
+    Does nothing when debug artifacts are disabled.
+
+    Arguments:
+        name : string
+            Name of the artifact, eg. 'aligned_bound'.
+        points : pcl.PointCloud or np.array([N, >=3])
+        same_as : pcl.PointCloud, optional
+            Registered pointcloud to take the offset and SRS from; default
+            the points themselves.
+    """
+    if not debug_enabled():
+        return
+
+    if same_as is None:
+        same_as = points
+
+    arrays = {'points': np.array(points, dtype=np.float32)}
+    if is_registered(same_as):
+        arrays['offset'] = np.array(same_as.offset, dtype=np.float64)
+        arrays['srs'] = same_as.srs.ExportToWkt()
+    else:
+        arrays['offset'] = np.zeros(3)
+
+    filename = '%s.%d.%s.npz' % (_config['run'], os.getpid(), name)
+    _writer_queue().put((_config['directory'], filename, arrays))
+
+
+def flush_debug():
+    """Wait until all queued debug artifacts are written."""
+    if _writer['pid'] == os.getpid():
+        _writer['queue'].join()
+
+
+def _writer_queue():
+    """Queue of the writer thread, started on first use in every process
+    (a forked child does not inherit the thread of its parent)."""
+    if _writer['pid'] != os.getpid():
+        _writer['queue'] = queue.Queue()
+        _writer['pid'] = os.getpid()
+        thread = threading.Thread(target=_write_loop, name='patty-debug',
+                                  args=(_writer['queue'],))
+        thread.daemon = True
+        thread.start()
+    return _writer['queue']
+
+
+def _write_loop(jobs):
+    while True:
+        directory, filename, arrays = jobs.get()
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            np.savez(os.path.join(directory, filename), **arrays)
+        except Exception as e:
+            log("WARNING, CAN'T WRITE DEBUG ARTIFACT %s: %s" % (filename, e))
+        finally:
+            jobs.task_done()
+
+
+atexit.register(flush_debug)
@@ -0,0 +1,308 @@
+"""
+Opt-in timing spans and counters for the registration pipeline.
+
+Pipeline functions are wrapped in named spans, which record their wall time,
+the number of points going in and out, and counters. Spans nest, and are
+identified by their path, eg. 'coarse_registration/boundary_of_center_object'.
+This is disabled by default, and then costs a single check per call; enable
+it by setting the environment variable PATTY_METRICS to a file, or by
+calling configure_metrics().
+
+Every span also records the memory use of the process at its end (rss_mb)
+and the growth of the largest RSS so far (max_rss_growth_mb; non-zero for
+the stages that set a new high-water mark). With trace_memory, the peak of
+the allocated memory during the span (traced_peak_mb, including memory that
+was allocated before) is added, and for the outermost spans the source
+lines holding the most memory in NumPy arrays at their end
+(largest_allocations); see patty.memory.
+
+Every finished span is appended as one JSON line to the file, so parallel
+processes can share it; metrics_summary() makes a table of the spans of this
+process, or of a file read with read_metrics():
+
+    with span('tiling') as s:
+        tiles = make_tiles(pointcloud)
+        s.set(points_in=len(pointcloud), tiles=len(tiles))
+
+    @timed('segmentation')
+    def segment(pointcloud):
+        ...
+"""
+
+from __future__ import division
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from patty import memory
+from patty.profiling import profiled, profiling_enabled
+
+_config = {
+    'enabled': bool(os.environ.get('PATTY_METRICS')),
+    'path': os.environ.get('PATTY_METRICS') or None,
+    'run': os.environ.get('PATTY_METRICS_RUN') or 'patty',
+    'trace_memory': bool(os.environ.get('PATTY_TRACE_MEMORY')),
+}
+# spans of this process; the stack of open spans is per thread
+_state = {'pid': None, 'records': []}
+_local = threading.local()
+_lock = threading.Lock()
+
+if (_config['enabled'] and _config['trace_memory'] and
+        memory.tracing_available()):
+    memory.start_tracing()
+
+
+def configure_metrics(path=None, enabled=True, run=None, trace_memory=None):
+    """Enable or disable timing spans.
+
+    Arguments:
+        path : string or None
+            JSON lines file to append the finished spans to; when None, they
+            are only kept in memory, see metrics_summary().
+        enabled : Boolean
+        run : string, optional
+            Name of the run, stored with every span.
+        trace_memory : Boolean, optional
+            Trace allocations with tracemalloc, to record the peak memory
+            per span; needs Python 3.9+, and slows down the pipeline.
+            Default from the environment variable PATTY_TRACE_MEMORY.
+    """
+    _config['enabled'] = enabled
+    _config['path'] = path
+    if run is not None:
+        _config['run'] = run
+    if trace_memory is not None:
+        _config['trace_memory'] = trace_memory
+    if enabled and _config['trace_memory']:
+        memory.start_tracing()
+    elif memory.tracing():
+        memory.stop_tracing()
+
+
+def metrics_enabled():
+    """True when timing spans are recorded."""
+    return _config['enabled']
+
+
+def _records():
+    """Finished spans of this process; a forked child starts empty."""
+    if _state['pid'] != os.getpid():
+        _state.update(pid=os.getpid(), records=[])
+    return _state['records']
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def point_count(value):
+    """Number of points of a pointcloud or PointSubset, else None."""
+    if hasattr(value, 'extract') and hasattr(value, '__len__'):
+        return len(value)
+    return None
+
+
+class Span(object):
+    '''A named, timed part of the pipeline; use span() to make one.
+
+    Fields set with set() are stored with the span, counters added with
+    count() are summed.
+    '''
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.counters = {}
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def __enter__(self):
+        stack = _stack()
+        self.path = '/'.join([s.name for s in stack] + [self.name])
+        self._parent = stack[-1] if stack else None
+        stack.append(self)
+
+        self._max_rss = memory.max_rss()
+        self._traced_peak = 0
+        if memory.tracing():
+            self._restart_peak()
+        self.start = time.time()
+        return self
+
+    def _restart_peak(self):
+        """Report the traced peak so far to the enclosing span, and start
+        measuring anew; tracemalloc keeps a single peak."""
+        _, peak = memory.tracemalloc.get_traced_memory()
+        if self._parent is not None:
+            self._parent._traced_peak = max(self._parent._traced_peak, peak)
+        memory.tracemalloc.reset_peak()
+        return peak
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.time() - self.start
+        _stack().pop()
+
+        record = dict(self.fields)
+        record.update(span=self.path, seconds=seconds, pid=os.getpid(),
+                      run=_config['run'], start=self.start)
+        if self.counters:
+            record['counters'] = self.counters
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+
+        rss, max_rss = memory.current_rss(), memory.max_rss()
+        if rss is not None:
+            record['rss_mb'] = rss / memory.MB
+        if max_rss is not None:
+            record['max_rss_mb'] = max_rss / memory.MB
+            record['max_rss_growth_mb'] = (max_rss - self._max_rss) / memory.MB
+        if memory.tracing():
+            peak = max(self._traced_peak, self._restart_peak())
+            record['traced_peak_mb'] = peak / memory.MB
+            if self._parent is None:
+                # snapshots are slow, only for the outermost spans
+                record['largest_allocations'] = [
+                    [site, size / memory.MB]
+                    for site, size in memory.largest_allocations()]
+
+        _emit(record)
+        return False
+
+
+class _NullSpan(object):
+    '''Stand-in for Span when metrics are disabled.'''
+
+    def set(self, **fields):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **fields):
+    """Context manager timing the enclosed block as span name."""
+    if not _config['enabled']:
+        return _NULL_SPAN
+    return Span(name, **fields)
+
+
+def count(name, n=1):
+    """Add n to counter name of the innermost open span, if any."""
+    if not _config['enabled']:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].count(name, n)
+
+
+def timed(name=None):
+    """Decorator timing every call of the function as a span.
+
+    The number of points of the first argument and of the result (when
+    they are pointclouds) are stored as points_in and points_out. The
+    function is also a stage that can be profiled, see patty.profiling.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _config['enabled'] and not profiling_enabled():
+                return function(*args, **kwargs)
+            with profiled(span_name), span(span_name) as s:
+                if args:
+                    s.set(points_in=point_count(args[0]))
+                result = function(*args, **kwargs)
+                s.set(points_out=point_count(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def _emit(record):
+    with _lock:
+        _records().append(record)
+        if _config['path'] is not None:
+            line = json.dumps(record, default=_json_default, sort_keys=True)
+            with open(_config['path'], 'a') as f:
+                f.write(line + '\n')
+
+
+def read_metrics(path):
+    """The spans in a JSON lines file, as a list of dicts."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def metrics_records():
+    """The spans finished in this process, as a list of dicts."""
+    return list(_records())
+
+
+def metrics_summary(records=None):
+    """Table with the number of calls, total and mean time, points in and
+    out, and the largest RSS and traced peak memory, per span path; of this
+    process, or of the given records."""
+    if records is None:
+        records = _records()
+
+    totals = {}
+    counters = {}
+    for record in records:
+        for key, n in record.get('counters', {}).items():
+            counters[key] = counters.get(key, 0) + n
+        total = totals.setdefault(record['span'], {
+            'calls': 0, 'seconds': 0.0, 'points_in': 0, 'points_out': 0,
+            'start': record.get('start', 0), 'max_rss_mb': 0.0,
+            'traced_peak_mb': 0.0})
+        total['calls'] += 1
+        total['seconds'] += record['seconds']
+        for key in ('max_rss_mb', 'traced_peak_mb'):
+            total[key] = max(total[key], record.get(key) or 0)
+        total['start'] = min(total['start'], record.get('start', 0))
+        for key in ('points_in', 'points_out'):
+            total[key] += record.get(key) or 0
+
+    width = max([len(path) for path in totals] +
+                [len(key) + 8 for key in counters] + [4])
+    rows = ['%-*s %6s %10s %10s %11s %11s %13s %11s' % (
+        width, 'span', 'calls', 'total [s]', 'mean [s]', 'points in',
+        'points out', 'max rss [MB]', 'peak [MB]')]
+    for path in sorted(totals, key=lambda p: totals[p]['start']):
+        total = totals[path]
+        rows.append('%-*s %6d %10.3f %10.3f %11d %11d %13.1f %11.1f' % (
+            width, path, total['calls'], total['seconds'],
+            total['seconds'] / total['calls'], total['points_in'],
+            total['points_out'], total['max_rss_mb'],
+            total['traced_peak_mb']))
+    for key in sorted(counters):
+        rows.append('counter %-*s %6d' % (width - 8, key, counters[key]))
+    return '\n'.join(rows)
@@ -0,0 +1,107 @@
+"""
+Memory use of the process, for the timing spans of patty.instrument.
+
+The resident set size (RSS) is read from /proc on Linux (or with psutil,
+when installed), and the high-water mark of the RSS from getrusage; both
+are cheap, and recorded with every span. Allocations made through Python,
+including the data of NumPy arrays, can be traced with tracemalloc (Python
+3.4+); tracing slows the pipeline down, so it is enabled separately, see
+patty.instrument.configure_metrics.
+"""
+import os
+import sys
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024.0 * 1024.0
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+def max_rss():
+    """Largest resident set size of this process so far in bytes, or None
+    if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+def tracing_available():
+    """True when tracemalloc can measure peaks per span (Python 3.9+)."""
+    return tracemalloc is not None and hasattr(tracemalloc, 'reset_peak')
+
+
+def start_tracing():
+    """Start tracing allocations, if not tracing already."""
+    if not tracing_available():
+        raise RuntimeError("Tracing memory needs tracemalloc.reset_peak, "
+                           "Python 3.9 or newer")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACED_FRAMES)
+
+
+def stop_tracing():
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def tracing():
+    """True when allocations are traced."""
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+# tracemalloc domain of the data of NumPy arrays
+NUMPY_DOMAIN = 389047
+# frames stored per allocation, to look past the functions of NumPy
+TRACED_FRAMES = 4
+
+
+def largest_allocations(n=3):
+    """The n source lines with the most memory in NumPy arrays still
+    allocated, as a list of ('file:line', bytes). Arrays are attributed to
+    the innermost line outside NumPy itself that created them.
+
+    Takes a snapshot of all traced allocations, which is slow."""
+    if not tracing():
+        return []
+    numpy_dir = os.path.dirname(np.__file__)
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.DomainFilter(True, NUMPY_DOMAIN)])
+
+    sizes = {}
+    for trace in snapshot.traces:
+        frames = list(reversed(list(trace.traceback)))  # most recent first
+        frame = next((f for f in frames
+                      if not f.filename.startswith(numpy_dir)), frames[0])
+        site = '%s:%s' % (frame.filename, frame.lineno)
+        sizes[site] = sizes.get(site, 0) + trace.size
+    return sorted(sizes.items(), key=lambda item: -item[1])[:n]
@@ -0,0 +1,119 @@
+"""
+Streaming first and second order moments of a set of points.
+
+The accumulator works on chunks of points, keeping only the count, mean and
+scatter matrix in float64. Accumulators of different chunks (or different
+processes) can be merged, which makes PCA-like estimates possible in a single
+read-only pass over a large pointcloud.
+"""
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+
+def iter_chunks(points, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield consecutive row slices (views) of points."""
+    for start in range(0, len(points), chunk_size):
+        yield points[start:start + chunk_size]
+
+
+class Moments(object):
+    '''Accumulator of the count, mean and covariance of points.
+
+    Points are added chunk-wise with update(); accumulators can be combined
+    with merge() using the pairwise update formulas of Chan et al. All
+    statistics are kept in float64, regardless of the input precision.
+
+    Constructor usage: give the dimension, or an array of points (any object
+    that is converted to an NxD array by np.asarray) to accumulate directly.
+
+    Example:
+
+        moments = Moments(dim=3)
+        for chunk in chunks:
+            moments.update(chunk[:, 0:3])
+        variances, axes = moments.principal_axes()
+    '''
+
+    def __init__(self, points=None, dim=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        if points is not None:
+            points = np.asarray(points)
+            dim = points.shape[1]
+        elif dim is None:
+            raise TypeError("Need to give points or dim")
+
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self.scatter = np.zeros((dim, dim), dtype=np.float64)
+
+        if points is not None:
+            for chunk in iter_chunks(points, chunk_size):
+                self.update(chunk)
+
+    @property
+    def dim(self):
+        return len(self.mean)
+
+    @property
+    def covariance(self):
+        ''' Population covariance matrix of the points seen so far. '''
+        if self.count == 0:
+            return np.zeros_like(self.scatter)
+        return self.scatter / self.count
+
+    def update(self, points):
+        '''Add a chunk of points, array of shape [N, dim].'''
+        chunk = np.asarray(points, dtype=np.float64)
+        if len(chunk) == 0:
+            return self
+
+        other = Moments(dim=self.dim)
+        other.count = len(chunk)
+        other.mean = chunk.mean(axis=0)
+        centered = chunk - other.mean
+        other.scatter = np.dot(centered.T, centered)
+
+        return self.merge(other)
+
+    def merge(self, other):
+        '''Combine the moments of another accumulator into this one.'''
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count = other.count
+            self.mean = np.array(other.mean, dtype=np.float64)
+            self.scatter = np.array(other.scatter, dtype=np.float64)
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+
+        self.scatter = (self.scatter + other.scatter +
+                        np.outer(delta, delta) *
+                        (float(self.count) * other.count / count))
+        self.mean = self.mean + delta * (float(other.count) / count)
+        self.count = count
+
+        return self
+
+    def principal_axes(self):
+        '''Principal axes of the points, like a PCA.
+
+        Returns:
+            variances : np.array([dim])
+                Variance along each axis, in descending order.
+            axes : np.array([dim, dim])
+                Unit vectors as rows, sorted by variance. The sign is
+                chosen such that the largest component of each axis is
+                positive.
+        '''
+        eigenvalues, eigenvectors = np.linalg.eigh(self.covariance)
+        variances = eigenvalues[::-1]
+        axes = eigenvectors[:, ::-1].T
+
+        largest = np.argmax(np.abs(axes), axis=1)
+        signs = np.sign(axes[np.arange(len(axes)), largest])
+        signs[signs == 0] = 1.0
+        axes *= signs[:, np.newaxis]
+
+        return variances, axes
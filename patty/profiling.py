@@ -0,0 +1,139 @@
+"""
+Opt-in cProfile of named pipeline stages.
+
+The stages are the functions wrapped with patty.instrument.timed, named as
+their timing spans: initial_registration, coarse_registration,
+boundary_of_center_object, dbscan_labels, fine_attempt, ... This is disabled
+by default; enable it by setting the environment variable PATTY_PROFILE to a
+directory (and optionally PATTY_PROFILE_STAGES to a comma separated list of
+stages, default all), or by calling configure_profiling().
+
+Every call of a profiled stage writes <run>.<pid>.<stage>.<n>.pstats, for
+pstats or snakeviz, and a text summary with the top functions by cumulative
+time, <run>.<pid>.<stage>.<n>.txt. Only one profiler can be active at a time,
+so while a nested stage is profiled, the enclosing stage is paused: its
+profile excludes the time of the nested profiled stages.
+
+    python -m pstats patty.1234.coarse_registration.0.pstats
+"""
+
+import cProfile
+import os
+import pstats
+import threading
+
+_config = {
+    'directory': os.environ.get('PATTY_PROFILE') or None,
+    'stages': os.environ.get('PATTY_PROFILE_STAGES') or None,
+    'run': os.environ.get('PATTY_PROFILE_RUN') or 'patty',
+    'top': 30,
+}
+# number of profiles written per stage, per process
+_state = {'pid': None, 'calls': {}}
+_local = threading.local()
+
+
+def configure_profiling(directory=None, stages=None, top=30, run=None):
+    """Enable profiling to directory, or disable it with None.
+
+    Arguments:
+        directory : string or None
+            Directory to write to; created when it does not exist.
+        stages : string or sequence of strings, optional
+            Names of the stages to profile, comma separated or a list;
+            default all.
+        top : int
+            Number of functions in the text summaries.
+        run : string, optional
+            Name of the run, used as prefix of the filenames.
+    """
+    _config['directory'] = directory
+    _config['stages'] = stages
+    _config['top'] = top
+    if run is not None:
+        _config['run'] = run
+    _state.update(pid=None, calls={})
+
+
+def profiling_enabled(stage=None):
+    """True when profiling is enabled, for stage if given."""
+    if _config['directory'] is None:
+        return False
+    if stage is None or not _config['stages']:
+        return True
+    stages = _config['stages']
+    if isinstance(stages, str):
+        stages = [name.strip() for name in stages.split(',')]
+    return stage in stages
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _filename(stage):
+    if _state['pid'] != os.getpid():
+        _state.update(pid=os.getpid(), calls={})
+    n = _state['calls'].get(stage, 0)
+    _state['calls'][stage] = n + 1
+    return os.path.join(_config['directory'], '%s.%d.%s.%d' % (
+        _config['run'], os.getpid(), stage, n))
+
+
+class _Profiled(object):
+    '''Context manager profiling the enclosed block as stage.'''
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        stack = _stack()
+        if stack:
+            stack[-1].disable()
+        stack.append(self.profile)
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profile.disable()
+        stack = _stack()
+        stack.pop()
+        if stack:
+            stack[-1].enable()
+
+        try:
+            if not os.path.isdir(_config['directory']):
+                os.makedirs(_config['directory'])
+            filename = _filename(self.stage)
+            self.profile.dump_stats(filename + '.pstats')
+            with open(filename + '.txt', 'w') as f:
+                stats = pstats.Stats(self.profile, stream=f)
+                stats.sort_stats('cumulative').print_stats(_config['top'])
+        except Exception as e:
+            # not imported at the top: patty.utils imports this module
+            from patty.utils import log
+            log("WARNING, CAN'T WRITE PROFILE OF %s: %s" % (self.stage, e))
+        return False
+
+
+class _NotProfiled(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOT_PROFILED = _NotProfiled()
+
+
+def profiled(stage):
+    """Context manager profiling the enclosed block as stage, when
+    profiling is enabled for it."""
+    if not profiling_enabled(stage):
+        return _NOT_PROFILED
+    return _Profiled(stage)
@@ -8,6 +8,22 @@ from .registration import (
     rotate_upwards,
     )
 
+from .chamfer import (
+    match_chamfer,
+    )
+
+from .drivemapindex import (
+    DrivemapIndex,
+    )
+
+from .icp import (
+    point_to_plane_icp,
+    )
+
+from .orientation import (
+    score_rotations,
+    )
+
 from .stickscale import (
     get_stick_scale,
     )
@@ -15,11 +31,16 @@ from .stickscale import (
 __all__ = [
     'get_stick_scale',
 
+    'DrivemapIndex',
+
     'align_footprints',
     'coarse_registration',
     'estimate_pancake_up',
     'find_rotation_xy',
     'fine_registration',
     'initial_registration',
-    'rotate_upwards'
+    'match_chamfer',
+    'point_to_plane_icp',
+    'rotate_upwards',
+    'score_rotations',
 ]
@@ -0,0 +1,163 @@
+"""
+2D footprint registration by chamfer matching.
+
+The distance to the nearest fixed footprint point is precomputed on a raster
+(a distance transform); the cost of a placement of the loose footprint is
+the mean, truncated, distance looked up at its points. Rotation, scale and
+translation are optimized on this cost.
+"""
+
+from __future__ import division
+from collections import namedtuple
+
+import numpy as np
+from scipy.ndimage import distance_transform_edt, map_coordinates
+from scipy.optimize import minimize
+
+from .orientation import occupancy_grid
+
+DistanceField = namedtuple('DistanceField', ['grid', 'origin', 'cellsize'])
+DistanceField.__doc__ = '''Distance to the nearest point of a footprint,
+sampled at the centers of raster cells; cell (0, 0) has its corner at
+origin.'''
+
+
+def distance_field(points, cellsize=0.05, margin=1.0):
+    """
+    Distance transform of points on the xy plane.
+
+    Arguments:
+        points : np.array([N, >=2])
+        cellsize : float, size of the raster cells in [m]
+        margin : float, extent in [m] of the raster around the points
+
+    Returns:
+        field : DistanceField
+    """
+    points = np.asarray(points, dtype=np.float64)[:, 0:2]
+    origin = points.min(axis=0) - margin
+    shape = tuple(np.ceil((points.max(axis=0) + margin - origin) /
+                          cellsize).astype(int) + 1)
+
+    occupied = occupancy_grid(points, origin, cellsize, shape)
+    grid = distance_transform_edt(occupied == 0) * cellsize
+    return DistanceField(grid, origin, cellsize)
+
+
+def polygon_outline(vertices, spacing=0.05):
+    """
+    Points along the edges of a polygon, at most spacing apart.
+
+    A footprint read from a CSV file holds only the corners; its distance
+    field should measure the distance to the edges, not to the corners.
+
+    Arguments:
+        vertices : np.array([N, D]), corners in order; the polygon is closed
+                   when the last vertex differs from the first
+        spacing : float, maximum distance in [m] between outline points
+
+    Returns:
+        outline : np.array([M, D]), starting at the first vertex
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    if len(vertices) < 2:
+        return vertices
+    if np.any(vertices[0, 0:2] != vertices[-1, 0:2]):
+        vertices = np.vstack([vertices, vertices[0:1]])
+
+    starts = vertices[:-1]
+    deltas = np.diff(vertices, axis=0)
+    lengths = np.sqrt(np.sum(deltas[:, 0:2] ** 2, axis=1))
+    counts = np.maximum(np.ceil(lengths / spacing).astype(np.intp), 1)
+
+    # edge of every outline point, and its position along that edge
+    edge = np.repeat(np.arange(len(starts)), counts)
+    step = np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = step / counts[edge]
+    return starts[edge] + t[:, np.newaxis] * deltas[edge]
+
+
+def chamfer_cost(field, points, max_distance=1.0):
+    """
+    Mean distance from points to the footprint of the distance field.
+
+    Distances are interpolated bilinearly, and truncated at max_distance so
+    outliers have a bounded influence.
+    """
+    coords = ((np.asarray(points)[:, 0:2] - field.origin) / field.cellsize -
+              0.5)
+    distances = map_coordinates(field.grid, coords.T, order=1,
+                                mode='nearest')
+    return np.mean(np.minimum(distances, max_distance))
+
+
+def _placement(params):
+    """Rotation (2x2), scale and translation (2) from the parameters
+    [angle, log(scale), tx, ty]."""
+    angle, log_scale, tx, ty = params
+    rotation = np.array([[np.cos(angle), -np.sin(angle)],
+                         [np.sin(angle), np.cos(angle)]])
+    return rotation, np.exp(log_scale), np.array([tx, ty])
+
+
+def match_chamfer(loose, fixed, center,
+                  allow_scaling=True,
+                  allow_rotation=True,
+                  allow_translation=True,
+                  cellsize=0.05,
+                  max_distance=1.0,
+                  max_scale_change=0.5):
+    """
+    Find the rotation and scale around center, and the translation, that
+    place the loose footprint on the fixed footprint with the smallest
+    chamfer cost.
+
+    The search is local, so loose should already be roughly aligned, for
+    instance by the principal axes (see align_footprints).
+
+    Arguments:
+        loose : np.array([N, >=2])
+        fixed : np.array([M, >=2])
+        center : np.array([>=2])
+        allow_scaling, allow_rotation, allow_translation : Boolean
+        cellsize : float, size of the raster cells of the distance transform
+        max_distance : float, distances are truncated at this value
+        max_scale_change : float, the scale stays within a factor
+                           1 + max_scale_change of 1; the cost alone would
+                           favour shrinking onto a small part of the fixed
+                           footprint
+
+    Returns:
+        rot_matrix : np.array([3, 3]), rotation around the z-axis
+        scale : float
+        translation : np.array([3]), with zero z-component
+        cost : float, the chamfer cost of the placement
+    """
+    field = distance_field(fixed, cellsize=cellsize, margin=max_distance)
+    center = np.asarray(center, dtype=np.float64)[0:2]
+    loose = np.asarray(loose, dtype=np.float64)[:, 0:2] - center
+
+    free = np.array([allow_rotation, allow_scaling,
+                     allow_translation, allow_translation])
+    max_log_scale = np.log(1.0 + max_scale_change)
+
+    def cost(free_params):
+        params = np.zeros(4)
+        params[free] = free_params
+        params[1] = np.clip(params[1], -max_log_scale, max_log_scale)
+        rotation, scale, translation = _placement(params)
+        placed = scale * np.dot(loose, rotation.T) + center + translation
+        return chamfer_cost(field, placed, max_distance)
+
+    params = np.zeros(4)
+    if np.any(free):
+        result = minimize(cost, np.zeros(np.count_nonzero(free)),
+                          method='Powell')
+        params[free] = np.atleast_1d(result.x)
+        params[1] = np.clip(params[1], -max_log_scale, max_log_scale)
+    rotation, scale, translation = _placement(params)
+
+    rot_matrix = np.eye(3)
+    rot_matrix[0:2, 0:2] = rotation
+    return (rot_matrix, scale, np.array([translation[0], translation[1], 0]),
+            cost(params[free]))
@@ -0,0 +1,183 @@
+"""
+Spatial index of a drivemap, to be reused when registering many sites
+against the same drivemap.
+"""
+
+import hashlib
+
+import numpy as np
+import pcl
+from scipy.spatial import cKDTree
+
+from patty.cache import update_digest
+from patty.srs import force_srs, is_registered
+from patty.utils import BoundingBox
+from .icp import local_covariances, normals_from_covariances
+
+
+class DrivemapIndex(object):
+    '''KD-tree, local covariances and normals, and basemap height of a
+    drivemap.
+
+    The KD-tree, covariances and normals are computed on first use, or all at
+    once with build('icp'); registering with gicp does not need them. The
+    index can be stored with save() and read with DrivemapIndex.load(); it
+    can also be pickled, to send it to worker processes; the pickle holds
+    what has been built so far, including the KD-tree, so the workers do not
+    build it again. Only the pcl.PointCloud is left out, and rebuilt from the
+    points on first use. save() does not store the KD-tree.
+
+    fine_registration, initial_registration and boundary_of_drivemap accept
+    an index in place of the drivemap pointcloud. As cache key input (see
+    patty.cache), an index is represented by its content_digest, which is
+    computed only once.
+
+    Constructor usage: DrivemapIndex(drivemap), with drivemap a
+    (registered) pcl.PointCloud.
+
+    Attributes:
+        points : np.array([N, D])
+            Points of the drivemap (as in np.asarray(drivemap)).
+        offset : np.array([3]) or None
+            Offset of the drivemap.
+        srs : string or None
+            Spatial reference system of the drivemap, as WKT.
+        basemap_height : float
+            Height of the lowest drivemap point.
+        k_normals : int
+            Number of neighbours used for the covariances and normals.
+    '''
+
+    def __init__(self, drivemap, k_normals=10, n_jobs=-1):
+        self.points = np.asarray(drivemap)
+        self.offset = None
+        self.srs = None
+        if is_registered(drivemap):
+            self.offset = np.array(drivemap.offset, dtype=np.float64)
+            self.srs = drivemap.srs.ExportToWkt()
+
+        self.basemap_height = float(self.points[:, 2].min())
+        self.k_normals = k_normals
+        self.n_jobs = n_jobs
+
+        self._pointcloud = drivemap
+        self._tree = None
+        self._covariances = None
+        self._normals = None
+        self._digest = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['points'] = np.array(self.points)
+        # pcl pointclouds cannot be pickled
+        state['_pointcloud'] = None
+        return state
+
+    @property
+    def xyz(self):
+        ''' Point coordinates, np.array([N, 3]) '''
+        return self.points[:, 0:3]
+
+    @property
+    def bounding_box(self):
+        return BoundingBox(points=self.xyz)
+
+    @property
+    def pointcloud(self):
+        ''' The drivemap as registered pcl.PointCloud '''
+        if self._pointcloud is None:
+            points = np.asarray(self.points, dtype=np.float32)
+            if points.shape[1] == 6:
+                pointcloud = pcl.PointCloudXYZRGB(points)
+            else:
+                pointcloud = pcl.PointCloud(points[:, 0:3])
+            if self.srs is not None or self.offset is not None:
+                force_srs(pointcloud, srs=self.srs, offset=self.offset)
+            self._pointcloud = pointcloud
+        return self._pointcloud
+
+    @property
+    def tree(self):
+        ''' scipy.spatial.cKDTree of the points '''
+        if self._tree is None:
+            self._tree = cKDTree(np.asarray(self.xyz, dtype=np.float64))
+        return self._tree
+
+    @property
+    def covariances(self):
+        ''' Covariance of the k_normals nearest neighbours of each point '''
+        if self._covariances is None:
+            self._covariances = local_covariances(
+                self.xyz, self.tree, k=self.k_normals, n_jobs=self.n_jobs)
+        return self._covariances
+
+    @property
+    def normals(self):
+        ''' Unit normal of each point, from the local covariances '''
+        if self._normals is None:
+            self._normals = normals_from_covariances(self.covariances)
+        return self._normals
+
+    @property
+    def content_digest(self):
+        ''' Hex digest of the points, offset and SRS, computed once '''
+        if self._digest is None:
+            digest = hashlib.md5()
+            update_digest(digest, self.points)
+            update_digest(digest, self.offset)
+            update_digest(digest, self.srs)
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def build(self, method='icp'):
+        '''Compute now what fine_registration needs for the ICP method.
+
+        For 'icp', the KD-tree, covariances and normals are computed;
+        'gicp' uses only the points, so nothing is computed for it.'''
+        if method == 'icp':
+            self.normals
+        elif method != 'gicp':
+            raise ValueError("Unknown ICP method %r" % method)
+        return self
+
+    def save(self, path):
+        '''Write the index to a numpy .npz file; the covariances and
+        normals are included when they have been computed.'''
+        arrays = {
+            'points': np.asarray(self.points),
+            'basemap_height': self.basemap_height,
+            'k_normals': self.k_normals,
+        }
+        if self._covariances is not None:
+            arrays['covariances'] = self._covariances
+        if self._normals is not None:
+            arrays['normals'] = self._normals
+        if self.offset is not None:
+            arrays['offset'] = self.offset
+        if self.srs is not None:
+            arrays['srs'] = self.srs
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, n_jobs=-1):
+        '''Read an index written by save().'''
+        index = cls.__new__(cls)
+        with np.load(path) as data:
+            index.points = data['points']
+            index.offset = data['offset'] if 'offset' in data.files else None
+            index.srs = str(data['srs']) if 'srs' in data.files else None
+            index.basemap_height = float(data['basemap_height'])
+            index.k_normals = int(data['k_normals'])
+            index._covariances = (data['covariances']
+                                  if 'covariances' in data.files else None)
+            index._normals = (data['normals']
+                              if 'normals' in data.files else None)
+        index.n_jobs = n_jobs
+
+        index._pointcloud = None
+        index._tree = None
+        index._digest = None
+        return index
@@ -0,0 +1,202 @@
+"""
+Point-to-plane ICP on top of numpy and scipy.
+
+An alternative to pcl.registration.gicp that can use multiple cores for the
+nearest neighbour queries, stops on a small transform update or when a wall
+clock budget is spent, and can reuse a prebuilt KD-tree and normals of the
+target.
+"""
+
+from __future__ import division
+import time
+
+import numpy as np
+import pcl
+from scipy.spatial import cKDTree
+
+
+def query_tree(tree, points, k=1, distance_upper_bound=np.inf, n_jobs=-1):
+    """cKDTree.query using n_jobs worker threads.
+
+    Newer scipy calls the argument 'workers', older versions 'n_jobs'.
+    """
+    try:
+        return tree.query(points, k=k,
+                          distance_upper_bound=distance_upper_bound,
+                          workers=n_jobs)
+    except TypeError:
+        return tree.query(points, k=k,
+                          distance_upper_bound=distance_upper_bound,
+                          n_jobs=n_jobs)
+
+
+def local_covariances(points, tree=None, k=10, n_jobs=-1, chunk_size=100000):
+    """
+    Covariance matrix of the k nearest neighbours of every point.
+
+    Arguments:
+        points : np.array([N, 3])
+        tree : scipy.spatial.cKDTree, optional
+            KD-tree of the points, built when not given.
+        k : int
+            Number of neighbours, including the point itself.
+        n_jobs : int
+            Number of threads for the KD-tree queries, -1 for all cpus.
+        chunk_size : int
+            Number of points processed at a time, bounds the memory use.
+
+    Returns:
+        covariances : np.array([N, 3, 3])
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if tree is None:
+        tree = cKDTree(points)
+    k = min(k, len(points))
+
+    covariances = np.empty((len(points), 3, 3), dtype=np.float64)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        _, idx = query_tree(tree, chunk, k=k, n_jobs=n_jobs)
+        neighbours = points[np.reshape(idx, (len(chunk), k))]
+        centered = neighbours - neighbours.mean(axis=1)[:, np.newaxis, :]
+        covariances[start:start + len(chunk)] = np.einsum(
+            'nki,nkj->nij', centered, centered) / k
+
+    return covariances
+
+
+def normals_from_covariances(covariances):
+    """Unit normals: the direction of least variance of each covariance."""
+    _, eigenvectors = np.linalg.eigh(covariances)
+    return eigenvectors[:, :, 0]
+
+
+def _small_rotation(angles):
+    """Rotation matrix for rotations around the x, y and z axis."""
+    a, b, c = angles
+    rot_x = np.array([[1, 0, 0], [0, np.cos(a), -np.sin(a)],
+                      [0, np.sin(a), np.cos(a)]])
+    rot_y = np.array([[np.cos(b), 0, np.sin(b)], [0, 1, 0],
+                      [-np.sin(b), 0, np.cos(b)]])
+    rot_z = np.array([[np.cos(c), -np.sin(c), 0],
+                      [np.sin(c), np.cos(c), 0], [0, 0, 1]])
+    return np.dot(rot_z, np.dot(rot_y, rot_x))
+
+
+def _huber_weights(residuals, scale=None):
+    """Huber weights; scale defaults to a robust estimate (MAD)."""
+    abs_res = np.abs(residuals)
+    if scale is None:
+        scale = 1.4826 * np.median(abs_res)
+    threshold = 1.345 * max(scale, 1e-12)
+    weights = np.ones_like(abs_res)
+    large = abs_res > threshold
+    weights[large] = threshold / abs_res[large]
+    return weights
+
+
+def point_to_plane_icp(source, target, max_iterations=50,
+                       max_correspondence_distance=1.0, tolerance=1e-6,
+                       time_budget=None, k_normals=10, target_tree=None,
+                       target_normals=None, robust_scale=None, n_jobs=-1):
+    """
+    Register source onto target with point-to-plane ICP.
+
+    Every iteration matches each source point to its nearest target point,
+    and solves the linearized, Huber weighted, point-to-plane least squares
+    problem for a small rigid motion.
+
+    Arguments:
+        source : pcl.PointCloud or np.array([N, >=3])
+        target : pcl.PointCloud or np.array([M, >=3])
+        max_iterations : int
+        max_correspondence_distance : float
+            Source points farther than this from the target are ignored.
+        tolerance : float
+            Converged when the update of the rotation angles (radians) and
+            translation is smaller than this.
+        time_budget : float, optional
+            Stop after this many seconds of wall clock time; the result is
+            then reported as not converged.
+        k_normals : int
+            Neighbours used to estimate the target normals.
+        target_tree : scipy.spatial.cKDTree, optional
+            Prebuilt KD-tree of the target points.
+        target_normals : np.array([M, 3]), optional
+            Precomputed unit normals of the target points.
+        robust_scale : float, optional
+            Scale of the Huber weights, default estimated from the residuals.
+        n_jobs : int
+            Threads for the KD-tree queries, -1 for all cpus.
+
+    Returns:
+        converged : Boolean
+        transf : np.array([4,4])
+            transform that maps source onto target
+        estimate : pcl.PointCloud
+            the transformed source
+        fitness : float
+            mean squared distance of the matched points, smaller is better
+    """
+    start_time = time.time()
+
+    source = np.asarray(source, dtype=np.float64)[:, 0:3]
+    target = np.asarray(target, dtype=np.float64)[:, 0:3]
+
+    if target_tree is None:
+        target_tree = cKDTree(target)
+    if target_normals is None:
+        target_normals = normals_from_covariances(local_covariances(
+            target, target_tree, k=k_normals, n_jobs=n_jobs))
+
+    transf = np.eye(4)
+    current = source.copy()
+    converged = False
+    fitness = 1e30
+
+    max_dist = max_correspondence_distance
+    for _ in range(max_iterations):
+        if time_budget is not None and time.time() - start_time > time_budget:
+            break
+
+        dist, idx = query_tree(target_tree, current,
+                               distance_upper_bound=max_dist, n_jobs=n_jobs)
+        valid = np.isfinite(dist)
+        if np.count_nonzero(valid) < 6:
+            break
+        fitness = np.mean(dist[valid] ** 2)
+
+        points = current[valid]
+        normals = target_normals[idx[valid]]
+        residuals = np.einsum('ij,ij->i', points - target[idx[valid]],
+                              normals)
+        weights = _huber_weights(residuals, robust_scale)
+
+        # residual(x) ~ residuals + (p x n) . angles + n . translation
+        jacobian = np.hstack([np.cross(points, normals), normals])
+        weighted = jacobian * weights[:, np.newaxis]
+        lhs = np.dot(weighted.T, jacobian)
+        rhs = -np.dot(weighted.T, residuals)
+        try:
+            update = np.linalg.solve(lhs, rhs)
+        except np.linalg.LinAlgError:
+            update = np.linalg.lstsq(lhs, rhs, rcond=-1)[0]
+
+        step = np.eye(4)
+        step[0:3, 0:3] = _small_rotation(update[0:3])
+        step[0:3, 3] = update[3:6]
+        transf = np.dot(step, transf)
+        current = np.dot(source, transf[0:3, 0:3].T) + transf[0:3, 3]
+
+        if np.max(np.abs(update)) < tolerance:
+            converged = True
+            break
+
+    dist, _ = query_tree(target_tree, current,
+                         distance_upper_bound=max_dist, n_jobs=n_jobs)
+    valid = np.isfinite(dist)
+    if np.any(valid):
+        fitness = np.mean(dist[valid] ** 2)
+
+    estimate = pcl.PointCloud(current.astype(np.float32))
+    return converged, transf, estimate, fitness
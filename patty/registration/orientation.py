@@ -0,0 +1,112 @@
+"""
+Score candidate orientations of a pointcloud footprint against the drivemap
+in 2D, before running ICP.
+
+Both footprints are rasterized into occupancy grids on the xy plane; the
+overlap for every translation is found at once by FFT cross-correlation.
+"""
+
+from __future__ import division
+import numpy as np
+
+
+def occupancy_grid(points, origin, cellsize, shape):
+    """
+    Rasterize points on the xy plane.
+
+    Arguments:
+        points : np.array([N, >=2])
+        origin : np.array([2]), corner of cell (0, 0)
+        cellsize : float
+        shape : tuple (nx, ny)
+
+    Returns:
+        grid : np.array(shape), 1.0 for the cells containing a point, else 0.0
+            Points outside the grid are ignored.
+    """
+    cells = np.floor((np.asarray(points)[:, 0:2] - origin) /
+                     cellsize).astype(np.intp)
+    inside = np.all((cells >= 0) & (cells < shape), axis=1)
+
+    grid = np.zeros(shape)
+    grid[cells[inside, 0], cells[inside, 1]] = 1.0
+    return grid
+
+
+def _rotation_xy(angle):
+    return np.array([[np.cos(angle), -np.sin(angle)],
+                     [np.sin(angle), np.cos(angle)]])
+
+
+def score_rotations(loose, fixed, center, angles, cellsize=0.25,
+                    max_shift=1.0):
+    """
+    Score rotations of the loose footprint around center by their overlap
+    with the fixed footprint.
+
+    For each angle, the loose points are rotated on the xy plane and
+    rasterized; the best overlap over all translations up to max_shift is
+    found by FFT cross-correlation with the (once transformed) raster of the
+    fixed points. Pass a few candidate angles, or a full sweep such as
+    np.linspace(0, 2 * np.pi, 72, endpoint=False).
+
+    Arguments:
+        loose : np.array([N, >=2])
+        fixed : np.array([M, >=2])
+        center : np.array([>=2]), center of rotation
+        angles : sequence of float, counterclockwise rotation in radians
+        cellsize : float, size of the raster cells in [m]
+        max_shift : float, largest translation in [m] considered along x
+                    and y
+
+    Returns:
+        scores : np.array([len(angles)])
+            Fraction of the occupied loose cells that overlap the fixed
+            footprint, at the best translation; larger is better.
+        shifts : np.array([len(angles), 2])
+            The translation that moves the rotated loose footprint onto
+            the fixed one best, for each angle.
+    """
+    center = np.asarray(center, dtype=np.float64)[0:2]
+    loose = np.asarray(loose, dtype=np.float64)[:, 0:2] - center
+    fixed = np.asarray(fixed, dtype=np.float64)[:, 0:2]
+
+    # a grid holding the fixed footprint and every rotation of the loose
+    # one, with a margin so the correlation does not wrap around
+    radius = np.sqrt((loose ** 2).sum(axis=1).max())
+    lower = np.minimum(fixed.min(axis=0), center - radius) - max_shift
+    upper = np.maximum(fixed.max(axis=0), center + radius) + max_shift
+    shape = tuple(np.ceil((upper - lower) / cellsize).astype(int) + 1)
+
+    fixed_fft = np.fft.rfft2(occupancy_grid(fixed, lower, cellsize, shape))
+
+    # the zero shift sits in the middle after fftshift
+    middle = np.array(shape) // 2
+    reach = int(np.ceil(max_shift / cellsize))
+    window = tuple(slice(m - reach, m + reach + 1) for m in middle)
+
+    scores = np.zeros(len(angles))
+    shifts = np.zeros((len(angles), 2))
+    for i, angle in enumerate(angles):
+        rotated = np.dot(loose, _rotation_xy(angle).T) + center
+        grid = occupancy_grid(rotated, lower, cellsize, shape)
+        occupied = grid.sum()
+        if occupied == 0:
+            continue
+
+        # correlation[s] = sum_x grid[x] * fixed_grid[x + s]
+        correlation = np.fft.irfft2(np.conj(np.fft.rfft2(grid)) * fixed_fft,
+                                    s=shape)
+        correlation = np.fft.fftshift(correlation)[window]
+
+        best = np.unravel_index(np.argmax(correlation), correlation.shape)
+        scores[i] = correlation[best] / occupied
+        shifts[i] = (np.array(best) - reach) * cellsize
+
+    return scores, shifts
+
+
+def best_orientations(scores, keep=2):
+    """Indices of the keep best scores, best first."""
+    return [int(i) for i in np.argsort(-np.asarray(scores),
+                                       kind='mergesort')[:keep]]
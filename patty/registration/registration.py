@@ -5,16 +5,24 @@ Registration algorithms and utility functions
 """
 
 from __future__ import print_function
+import multiprocessing
 import numpy as np
-from .. import BoundingBox, force_srs, extract_mask, clone
+import pcl
+from .. import BoundingBox, force_srs, clone, Moments, Affine
 from .stickscale import get_stick_scale
+from .icp import point_to_plane_icp
+from .drivemapindex import DrivemapIndex
+from .orientation import score_rotations, best_orientations
+from .chamfer import match_chamfer, polygon_outline
 from pcl.registration import gicp
 
 from patty.utils import (
     log,
-    save,
     downsample_voxel,
 )
+from patty.debug import debug_enabled, debug_save
+from patty.cache import cached
+from patty.instrument import count, timed
 
 from patty.segmentation import (
     boundary_of_center_object,
@@ -22,13 +30,14 @@ from patty.segmentation import (
     boundary_of_lowest_points,
 )
 
-from sklearn.decomposition import PCA
-
 
+@timed()
 def align_footprints(loose_pc, fixed_pc,
                      allow_scaling=True,
                      allow_rotation=True,
-                     allow_translation=True):
+                     allow_translation=True,
+                     method='pca',
+                     fixed_polygon=False):
     '''
     Align a pointcloud 'loose_pc' by placing it on top of
     'fixed_pc' as good as poosible. Done by aligning the
@@ -47,6 +56,18 @@ def align_footprints(loose_pc, fixed_pc,
     (allow_scaling=True)
         Finally, the pointcloud is scaled to have the same extent.
 
+    (method='chamfer')
+        The principal axis alignment is refined by minimizing the chamfer
+        distance of the loose boundary to the fixed one, see match_chamfer.
+        Less sensitive to outliers than the extent and center of mass.
+
+    (fixed_polygon=True)
+        fixed_pc holds only the corners of the footprint polygon, as read
+        from the footprint CSV file. With method='chamfer', the pointcloud
+        is aligned to points along the edges of the polygon instead (see
+        polygon_outline), as the distance to the corners is not a measure
+        of the fit.
+
     Arguments:
         loose_pc          : pcl.PointCloud
         fixed_pc          : pcl.PointCloud
@@ -54,12 +75,18 @@ def align_footprints(loose_pc, fixed_pc,
         allow_scaling     : Bolean
         allow_rotation    : Bolean
         allow_translation : Bolean
+        method            : 'pca' or 'chamfer'
+        fixed_polygon     : Bolean
 
     Returns:
         rot_matrix, rot_center, scale, translation : np.array()
 
     '''
 
+    if method == 'chamfer' and fixed_polygon:
+        outline = polygon_outline(np.asarray(fixed_pc)[:, 0:3])
+        fixed_pc = pcl.PointCloud(outline.astype(np.float32))
+
     rot_center = loose_pc.center()
 
     if allow_rotation:
@@ -91,28 +118,46 @@ def align_footprints(loose_pc, fixed_pc,
         log(" - Skipping translation")
         translation = np.array([0.0, 0.0, 0.0])
 
+    if method == 'chamfer':
+        # refine around the current center; as the pointcloud is centered
+        # there, the refinement composes with the principal axis alignment
+        # as R2 R, s2 s and t + t2 around the same rot_center
+        log(" - Refining with chamfer matching")
+        center = rot_center + translation
+        rot2, scale2, translation2, cost = match_chamfer(
+            np.asarray(loose_pc), np.asarray(fixed_pc), center,
+            allow_scaling=allow_scaling,
+            allow_rotation=allow_rotation,
+            allow_translation=allow_translation)
+        log(" - Chamfer cost: %s" % cost)
+
+        loose_pc.rotate(rot2, origin=center)
+        loose_pc.scale(scale2, origin=center)
+        loose_pc.translate(translation2)
+
+        rot_matrix = np.dot(rot2, rot_matrix)
+        scale = scale2 * scale
+        translation = translation + translation2
+    elif method != 'pca':
+        raise ValueError("Unknown footprint alignment method: %s" % method)
+
     return rot_matrix, rot_center, scale, translation
 
 
 def estimate_pancake_up(pointcloud):
     '''
     Assuming a pancake like pointcloud, the up direction is the third PCA.
+    Computed in one chunked pass over the points, see patty.Moments.
     '''
-    pca = PCA(n_components=3)
-
     points = np.asarray(pointcloud)
-    pca.fit(points[:, 0:3])
+    _, axes = Moments(points[:, 0:3]).principal_axes()
 
-    return pca.components_[2]
+    return axes[2]
 
 
 def _find_rotation_xy_helper(pointcloud):
-    pca = PCA(n_components=2)
-
     points = np.asarray(pointcloud)
-    pca.fit(points[:, 0:2])
-
-    rotxy = np.array(pca.components_)
+    _, rotxy = Moments(points[:, 0:2]).principal_axes()
 
     # make sure the rotation is a proper rotation, ie det = +1
     if np.linalg.det(rotxy) < 0:
@@ -159,7 +204,13 @@ def rotate_upwards(pc, up):
         pc : pcl.PointCloud the input pointcloud, for convenience.
 
     '''
+    pc.rotate(_upwards_rotation(up), origin=pc.center())
+
+    return pc
+
 
+def _upwards_rotation(up):
+    '''Rotation matrix that makes the 'up' vector point along [0,0,1]'''
     newz = np.array(up)
 
     # Right-handed coordiante system:
@@ -201,14 +252,13 @@ def rotate_upwards(pc, up):
     rotation[1, 2] = newz[1]
     rotation[2, 2] = newz[2]
 
-    rotation = np.linalg.inv(rotation)
-    pc.rotate(rotation, origin=pc.center())
-
-    return pc
+    return np.linalg.inv(rotation)
 
 
+@timed()
 def initial_registration(pointcloud, up, drivemap,
-                         initial_scale=None, trust_up=True):
+                         initial_scale=None, trust_up=True, cache=None,
+                         affine=None):
     """
     Initial registration adds an spatial reference system to the pointcloud,
     and place the pointlcoud on top of the drivemap. The pointcloud is rotated
@@ -224,8 +274,10 @@ def initial_registration(pointcloud, up, drivemap,
             If None, assume the object is pancake shaped, and chose the
             upvector such that it is perpendicullar to the pancake.
 
-        drivemap : pcl.PointCloud
+        drivemap : pcl.PointCloud or DrivemapIndex
             A small part of the low-res drivemap on which to register.
+            With a cache, pass a DrivemapIndex when registering several
+            pointclouds, so the drivemap is hashed only once.
 
         initial_scale : float
             if given, scale pointcloud using this value; estimate scale factor
@@ -236,12 +288,58 @@ def initial_registration(pointcloud, up, drivemap,
             False: Calculate 'up' as if it was None, but orient it such that
                    np.dot( up, pancake_up ) > 0
 
+        cache : patty.cache.StageCache, default None
+            If given, reuse the transform from an earlier run on the same
+            pointcloud, drivemap and parameters.
+
+        affine : patty.Affine, default None
+            If given, the transform applied to the pointcloud is appended.
+
+    Returns:
+        transf : np.array([4,4])
+            The transform that was applied to the pointcloud.
+
     NOTE: Modifies the input pointcloud in-place, and leaves
     it in a undefined state.
 
     """
     log("Starting initial registration")
 
+    if cache is not None:
+        key = cache.key('initial_registration', pointcloud, up, drivemap,
+                        initial_scale=initial_scale, trust_up=trust_up)
+
+    if isinstance(drivemap, DrivemapIndex):
+        drivemap = drivemap.pointcloud
+
+    if cache is not None:
+        stored = cache.get(key)
+        if stored is not None:
+            log(" - Using cached initial_registration")
+            force_srs(pointcloud, same_as=drivemap)
+            Affine(stored[0]).apply(pointcloud)
+            return _append(affine, stored[0])
+
+    transf = _initial_registration(pointcloud, up, drivemap,
+                                   initial_scale, trust_up)
+
+    if cache is not None:
+        cache.put(key, (transf,))
+
+    return _append(affine, transf)
+
+
+def _append(affine, transf):
+    """Append transf to affine, if given; returns transf."""
+    if affine is not None:
+        affine.transform(transf)
+    return transf
+
+
+def _initial_registration(pointcloud, up, drivemap, initial_scale, trust_up):
+    """initial_registration without the cache; returns the applied
+    transform."""
+
     #####
     # set scale and offset of pointcloud, drivemap, and footprint
     # as the pointcloud is unregisterd, the coordinate system is undefined,
@@ -254,25 +352,29 @@ def initial_registration(pointcloud, up, drivemap,
     force_srs(pointcloud, same_as=drivemap)
     log(" - New offset forced to: %s" % pointcloud.offset)
 
+    stage = Affine()
     if up is not None:
         log(" - Rotating the pointcloud so up points along [0,0,1]")
 
         if trust_up:
-            rotate_upwards(pointcloud, up)
             log(" - Using trusted up: %s" % up)
         else:
             pancake_up = estimate_pancake_up(pointcloud)
             if np.dot(up, pancake_up) < 0.0:
                 pancake_up *= -1.0
             log(" - Using estimated up: %s" % pancake_up)
-            rotate_upwards(pointcloud, pancake_up)
+            up = pancake_up
+
+        stage.rotate(_upwards_rotation(up), origin=pointcloud.center())
 
     else:
         log(" - No upvector, skipping")
 
     if initial_scale is None:
         bbDrivemap = BoundingBox(points=np.asarray(drivemap))
-        bbObject = BoundingBox(points=np.asarray(pointcloud))
+        # bounding box of the rotated pointcloud
+        lower, upper = stage.transformed_bounds(pointcloud)
+        bbObject = BoundingBox(min=lower, max=upper)
         scale = bbDrivemap.size[0:2] / bbObject.size[0:2]  # ignore z-direction
 
         # take the average scale factor for x and y dimensions
@@ -282,10 +384,18 @@ def initial_registration(pointcloud, up, drivemap,
         scale = initial_scale
 
     log(" - Applying rough estimation of scale factor", scale)
-    pointcloud.scale(scale)  # dont care about origin of scaling
+    stage.scale(scale)  # dont care about origin of scaling
 
+    # rotate and scale in a single pass
+    stage.apply(pointcloud)
 
-def coarse_registration(pointcloud, drivemap, footprint, downsample=None):
+    return stage.matrix
+
+
+@timed()
+def coarse_registration(pointcloud, drivemap, footprint, downsample=None,
+                        stick_scale=None, cache=None, align_method='pca',
+                        affine=None, min_distance=None):
     """
     Improve the initial registration.
     Find the proper scale by looking for the red meter sticks, and calculate
@@ -295,7 +405,7 @@ def coarse_registration(pointcloud, drivemap, footprint, downsample=None):
         pointcloud: pcl.PointCloud
                     The high-res object to register.
 
-        drivemap:   pcl.PointCloud
+        drivemap:   pcl.PointCloud or DrivemapIndex
                     A small part of the low-res drivemap on which to register
 
         footprint:  pcl.PointCloud
@@ -304,6 +414,30 @@ def coarse_registration(pointcloud, drivemap, footprint, downsample=None):
         downsample: float, default=None, no resampling
                     Downsample the high-res pointcloud before footprint
                     calculation.
+
+        min_distance: float, default=None
+                    If given, downsample the high-res pointcloud to points at
+                    least this far apart instead, see
+                    patty.utils.downsample_poisson.
+
+        stick_scale: tuple (scale, confidence), default None
+                    Red stick scale as returned by get_stick_scale; it is
+                    estimated from the pointcloud when not given.
+
+        cache:      patty.cache.StageCache, default None
+                    If given, reuse the red stick scale and the pointcloud
+                    boundary from an earlier run on the same pointcloud.
+
+        align_method: 'pca' or 'chamfer', default 'pca'
+                    How to align the footprints, see align_footprints.
+
+        affine:     patty.Affine, default None
+                    If given, the transforms applied to the pointcloud are
+                    appended.
+
+    Returns:
+        rot_center : np.array([3])
+                    Center of the aligned footprint.
     """
     log("Starting coarse registration")
 
@@ -313,12 +447,17 @@ def coarse_registration(pointcloud, drivemap, footprint, downsample=None):
 
     allow_scaling = True
 
-    scale, confidence = get_stick_scale(pointcloud)
+    if stick_scale is None:
+        stick_scale = cached(cache, lambda: get_stick_scale(pointcloud),
+                             'stick_scale', pointcloud)
+    scale, confidence = stick_scale
     log(" - Red stick scale=%s confidence=%s" % (scale, confidence))
 
     if (confidence > 0.5):
         log(" - Applying red stick scale")
-        pointcloud.scale(1.0 / scale)  # dont care about origin of scaling
+        stick = Affine().scale(1.0 / scale)  # dont care about origin
+        stick.apply(pointcloud)
+        _append(affine, stick.matrix)
         allow_scaling = False
     else:
         log(" - Not applying red stick scale, confidence too low")
@@ -336,13 +475,25 @@ def coarse_registration(pointcloud, drivemap, footprint, downsample=None):
     fp_array = np.asarray(fixed_boundary)
     fp_array[:, 2] = dm_bb.min[2]
 
-    save(fixed_boundary, "fixed_bound.las")
+    debug_save("fixed_bound", fixed_boundary)
 
     #####
     # find all the boundary points of the pointcloud
 
-    loose_boundary = boundary_of_center_object(pointcloud, downsample)
-    if loose_boundary is None:
+    def find_boundary():
+        boundary = boundary_of_center_object(pointcloud, downsample,
+                                             min_distance=min_distance)
+        return None if boundary is None else np.array(boundary)
+
+    boundary = cached(cache, find_boundary, 'boundary_of_center_object',
+                      pointcloud, downsample=downsample,
+                      min_distance=min_distance)
+    if boundary is not None:
+        # the cached boundary holds only the xyz coordinates
+        loose_boundary = pcl.PointCloud(
+            np.asarray(boundary[:, 0:3], dtype=np.float32))
+        force_srs(loose_boundary, same_as=pointcloud)
+    else:
         log(" - boundary estimation failed, using lowest 30 percent of points")
         loose_boundary = boundary_of_lowest_points(pointcloud,
                                                    height_fraction=0.3)
@@ -355,25 +506,41 @@ def coarse_registration(pointcloud, drivemap, footprint, downsample=None):
         loose_boundary, fixed_boundary,
         allow_scaling=allow_scaling,
         allow_rotation=True,
-        allow_translation=True)
+        allow_translation=True,
+        method=align_method,
+        fixed_polygon=True)
 
-    save(loose_boundary, "aligned_bound.las")
+    debug_save("aligned_bound", loose_boundary)
 
     ####
-    # Apply to the main pointcloud
+    # Apply to the main pointcloud, in a single pass
 
-    pointcloud.rotate(rot_matrix, origin=rot_center)
-    pointcloud.scale(scale, origin=rot_center)
-    pointcloud.translate(translation)
+    alignment = Affine().rotate(rot_matrix, origin=rot_center)
+    alignment.scale(scale, origin=rot_center).translate(translation)
+    alignment.apply(pointcloud)
+    _append(affine, alignment.matrix)
     rot_center += translation
 
     return rot_center
 
 
-def _fine_registration_helper(pointcloud, drivemap, voxelsize=0.05, attempt=0):
+@timed('fine_attempt')
+def _fine_registration_helper(args):
     """
     Perform ICP on pointcloud with drivemap, and return convergence indicator.
-    Reject large translatoins.
+
+    Runs in a worker process: pcl pointclouds cannot be pickled, so the
+    arguments and results are plain arrays.
+
+    The drivemap is not passed with every attempt, but set once per worker
+    by _init_attempt_worker.
+
+    Arguments:
+        args : tuple (attempt, source, method, keep_estimate)
+            attempt number, xyz array of the (downsampled, clipped)
+            pointcloud, the ICP engine to use:
+            'gicp' (pcl.registration.gicp) or 'icp' (point_to_plane_icp),
+            and whether to return the transformed points.
 
     Returns:
         transf : np.array([4,4])
@@ -382,103 +549,309 @@ def _fine_registration_helper(pointcloud, drivemap, voxelsize=0.05, attempt=0):
             if icp was successful
         fitness : float
             sort of sum of square differences, ie. smaller is better
+        estimate : np.array([N,3]) or None
+            the transformed source points, if keep_estimate
     """
-    ####
-    # Downsample to speed up
-    # use voxel filter to keep evenly distributed spatial extent
-
-    log(" - Downsampling with voxel filter: %s" % voxelsize)
-    pc = downsample_voxel(pointcloud, voxelsize)
+    attempt, source, method, keep_estimate = args
+    index = _attempt_target['index']
 
     ####
-    # Clip to drivemap to prevent outliers confusing the ICP algorithm
-
-    log(" - Clipping to drivemap")
-    bb = BoundingBox(drivemap)
-    z = bb.center[2]
-    extracted = extract_mask(pc, [bb.contains([point[0], point[1], z])
-                                  for point in pc])
+    # ICP
+
+    if method == 'gicp':
+        if 'pointcloud' not in _attempt_target:
+            _attempt_target['pointcloud'] = pcl.PointCloud(
+                _xyz_array(index.xyz))
+        converged, transf, estimate, fitness = gicp(
+            pcl.PointCloud(source), _attempt_target['pointcloud'])
+    elif method == 'icp':
+        converged, transf, estimate, fitness = point_to_plane_icp(
+            source, index.xyz, target_tree=index.tree,
+            target_normals=index.normals, n_jobs=1)
+    else:
+        raise ValueError("Unknown ICP method %r" % method)
 
-    log(" - Remaining points: %s" % len(extracted))
+    if keep_estimate:
+        return transf, converged, fitness, np.asarray(estimate)
+    return transf, converged, fitness, None
 
-    ####
-    # GICP
 
-    converged, transf, estimate, fitness = gicp(extracted, drivemap)
+def _accept_attempt(attempt, transf, start, fitness):
+    """
+    Reject large translations: the ICP levels of an attempt together may
+    not move the pointcloud more than 5 m from where the attempt started.
 
-    ####
-    # Dont accept large translations
+    Arguments:
+        attempt : int
+            attempt number, for logging
+        transf : np.array([4,4])
+            transform of the attempt after the current level
+        start : np.array([4,4])
+            transform the attempt started from, ie. the orientation
+        fitness : float
+            fitness of the current level
 
-    translation = transf[0:3, 3]
+    Returns:
+        success : Boolean
+        fitness : float
+    """
+    translation = np.dot(transf, np.linalg.inv(start))[0:3, 3]
     if np.dot(translation, translation) > 5 ** 2:
-        log(" - Translation too large, considering it a failure.")
-        converged = False
-        fitness = 1e30
-    else:
-        log(" - Success, fitness: ", converged, fitness)
-
-    force_srs(estimate, same_as=pointcloud)
-    save(estimate, "attempt%s.las" % attempt)
-
-    return transf, converged, fitness
-
-
-def fine_registration(pointcloud, drivemap, center, voxelsize=0.05):
+        log(" - attempt %s: Translation too large, considering it a failure."
+            % attempt)
+        return False, 1e30
+
+    log(" - attempt %s: Success, fitness: " % attempt, fitness)
+    return True, fitness
+
+
+def _xyz_array(pointcloud):
+    """Contiguous float32 xyz copy of a pointcloud, for sending to workers."""
+    return np.ascontiguousarray(np.asarray(pointcloud)[:, 0:3],
+                                dtype=np.float32)
+
+
+# registration target of the attempts run in this process
+_attempt_target = {}
+
+
+def _init_attempt_worker(index):
+    """Set the DrivemapIndex used by _fine_registration_helper."""
+    _attempt_target.clear()
+    _attempt_target['index'] = index
+
+
+class _AttemptRunner(object):
+    """Map _fine_registration_helper over attempts, in a process pool when
+    n_jobs != 1. The pool, and the target in each worker, are reused for
+    all calls."""
+
+    def __init__(self, index, n_jobs=None):
+        if n_jobs is None:
+            n_jobs = multiprocessing.cpu_count()
+        self.pool = None
+        _init_attempt_worker(index)
+        if n_jobs != 1:
+            self.pool = multiprocessing.Pool(
+                processes=min(n_jobs, 4),
+                initializer=_init_attempt_worker, initargs=(index,))
+
+    def map(self, tasks):
+        if self.pool is None or len(tasks) <= 1:
+            return [_fine_registration_helper(task) for task in tasks]
+        return self.pool.map(_fine_registration_helper, tasks)
+
+    def close(self):
+        _attempt_target.clear()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+def _select_orientations(proxy, index, footprint, center, keep):
+    """The keep best quarter turns of the proxy around center, by the 2D
+    overlap of its lowest points with the drivemap boundary."""
+    fixed = np.asarray(boundary_of_drivemap(index, footprint))
+    points = np.asarray(proxy)
+    bb = BoundingBox(points=points)
+    loose = points[points[:, 2] < bb.min[2] + 0.3 * (bb.max[2] - bb.min[2])]
+    if len(fixed) == 0 or len(loose) == 0:
+        log(" - Cannot score orientations, trying all")
+        return list(range(4))
+
+    scores, _ = score_rotations(loose, fixed, center,
+                                np.arange(4) * np.pi / 2)
+    log(" - Orientation scores: %s" % scores)
+    return sorted(best_orientations(scores, keep))
+
+
+@timed()
+def fine_registration(pointcloud, drivemap, center, voxelsize=0.05,
+                      n_jobs=None, method='gicp',
+                      coarse_voxelsizes=(0.5, 0.2), prune_ratio=2.0,
+                      footprint=None, n_orientations=2, affine=None):
     """
     Final registration step using ICP.
 
     Find the local optimal postion of the pointcloud on the drivemap; due to
-    our coarse_registration algorithm, we have to try two orientations:
-    original, and rotated by 180 degrees around the z-axis.
+    our coarse_registration algorithm, we have to try four orientations:
+    the original, and rotated by 90, 180 and 270 degrees around the z-axis.
+
+    The pointcloud is voxel filtered once; only this small proxy is rotated
+    and clipped for the four orientations, and the ICP attempts are run
+    concurrently in a process pool. The best result is combined into a
+    single 4x4 transform that is applied to the full pointcloud once.
+
+    ICP runs coarse-to-fine: first on the proxy downsampled further to the
+    coarse_voxelsizes, then at voxelsize, each level starting from the
+    transform found at the previous level. After each coarse level, attempts
+    whose fitness is more than prune_ratio times the best fitness are
+    dropped.
+
+    When the footprint is given, the four orientations are first scored in
+    2D: the lowest points of the proxy are compared with the drivemap
+    boundary along the footprint (see score_rotations), and only the
+    n_orientations best are passed to ICP.
 
     Arguments:
         pointcloud: pcl.PointCloud
                     The high-res object to register.
 
-        drivemap: pcl.PointCloud
-                    A small part of the low-res drivemap on which to register
+        drivemap: pcl.PointCloud or DrivemapIndex
+                    A small part of the low-res drivemap on which to register.
+                    Pass a DrivemapIndex to reuse its KD-tree and normals
+                    when registering several pointclouds.
 
         center: np.array([3])
                     Vector giving the centerpoint of the pointcloud, used to do
-                    the 180 degree rotations.
+                    the 90 degree rotations.
 
         voxelsize: float default : 0.05
                     Size in [m] of the voxel grid used for downsampling
+
+        n_jobs: int, default None
+                    Number of worker processes for the ICP attempts; None
+                    uses all cpus, 1 runs the attempts serially in this
+                    process.
+
+        method: string, default 'gicp'
+                    ICP engine: 'gicp' for pcl.registration.gicp, or 'icp'
+                    for point_to_plane_icp.
+
+        coarse_voxelsizes: sequence of float, default (0.5, 0.2)
+                    Voxel sizes in [m] of the coarse levels; sizes not larger
+                    than voxelsize are ignored. Use () for a single level.
+
+        prune_ratio: float, default 2.0
+                    Drop attempts whose fitness at a coarse level is worse
+                    than prune_ratio times the best fitness at that level.
+
+        footprint: pcl.PointCloud, default None
+                    Footprint of the object, registered to the drivemap; if
+                    given, used to select the orientations to try.
+
+        n_orientations: int, default 2
+                    Number of orientations passed to ICP when the footprint
+                    is given.
+
+        affine: patty.Affine, default None
+                    If given, the transform applied to the pointcloud is
+                    appended.
+
+    Returns:
+        transf : np.array([4,4])
+            The transform applied to the pointcloud; identity if ICP failed.
+        success : Boolean
+            if icp was successful
+        fitness : float
+            fitness of the best attempt, smaller is better
     """
     log("Starting fine registration")
 
     # for rotation around z-axis
     rot = np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]])
+    center = np.asarray(center, dtype=np.float64)
 
     ####
-    # do a ICP step for 4 orientations
+    # Downsample once to speed up
+    # use voxel filter to keep evenly distributed spatial extent
+
+    log(" - Downsampling with voxel filter: %s" % voxelsize)
+    proxy = downsample_voxel(pointcloud, voxelsize)
+    log(" - Proxy points: %s" % len(proxy))
+
+    levels = sorted([size for size in coarse_voxelsizes if size > voxelsize],
+                    reverse=True)
+    levels.append(voxelsize)
 
+    if isinstance(drivemap, DrivemapIndex):
+        index = drivemap
+    else:
+        index = DrivemapIndex(drivemap)
+    # for icp, compute the normals once, instead of in every worker
+    index.build(method)
+
+    bb = index.bounding_box
+    runner = _AttemptRunner(index, n_jobs=n_jobs)
+
+    # start the 4 orientations from rotations of the proxy
+    start = {}
     transf = {}
     success = {}
     fitness = {}
     for i in range(4):
-        log(" - attempt: %s" % i)
-        transf[i], success[i], fitness[i] = _fine_registration_helper(
-            pointcloud,
-            drivemap,
-            attempt=i,
-            voxelsize=voxelsize)
-        pointcloud.rotate(rot, origin=center)
+        start[i] = Affine().rotate(np.linalg.matrix_power(rot, i),
+                                   origin=center).matrix
+        transf[i] = start[i]
+    attempts = list(range(4))
+
+    if footprint is not None:
+        attempts = _select_orientations(proxy, index, footprint, center,
+                                        n_orientations)
+
+    try:
+        for level, level_voxelsize in enumerate(levels):
+            final_level = level == len(levels) - 1
+            if final_level:
+                points = proxy
+            else:
+                points = downsample_voxel(proxy, level_voxelsize)
+            points = np.asarray(points, dtype=np.float64)[:, 0:3]
+            log(" - Level %s: voxel size %s, %s points, attempts %s" % (
+                level, level_voxelsize, len(points), attempts))
+
+            ####
+            # move the proxy to the current estimate of each attempt, and
+            # clip to drivemap to prevent outliers confusing the ICP algorithm
+
+            tasks = []
+            for i in attempts:
+                source = (np.dot(points, transf[i][0:3, 0:3].T) +
+                          transf[i][0:3, 3])
+                source = source[bb.contains_xy(source)]
+                log(" - attempt %s: remaining points: %s" % (i, len(source)))
+                tasks.append((i, source.astype(np.float32), method,
+                              final_level and debug_enabled()))
+
+            ####
+            # do a ICP step for the remaining orientations
+
+            count('fine_attempts', len(tasks))
+            results = runner.map(tasks)
+
+            for i, (level_transf, success[i], fitness[i], estimate) in zip(
+                    attempts, results):
+                if success[i]:
+                    candidate = np.dot(level_transf, transf[i])
+                    success[i], fitness[i] = _accept_attempt(
+                        i, candidate, start[i], fitness[i])
+                    if success[i]:
+                        transf[i] = candidate
+                if estimate is not None:
+                    debug_save("attempt%s" % i, estimate, same_as=pointcloud)
+
+            ####
+            # prune attempts that are clearly worse than the best one
+
+            if not final_level:
+                best_fitness = min(fitness[i] for i in attempts)
+                attempts = [i for i in attempts
+                            if fitness[i] <= prune_ratio * best_fitness]
+    finally:
+        runner.close()
 
     ####
     # pick best
 
-    best, value = min(fitness.iteritems(), key=lambda x: x[1])
+    best = min(attempts, key=lambda i: fitness[i])
     if success[best]:
         log(" - Best attempt: %s" % best)
-        if best > 0:  # np.array()**0 does weird things
-            pointcloud.rotate(rot**best, origin=center)
-        pointcloud.transform(transf[best])
-        return
+        Affine(transf[best]).apply(pointcloud)
+        return _append(affine, transf[best]), True, fitness[best]
 
     # ICP failed:
     # return the pointcloud with just footprints aligned
     # no use to undo a rotation, as any orientationi is equally likely.
     log(" - Unable to do fine registration")
 
-    return
+    return np.eye(4), False, fitness[best]
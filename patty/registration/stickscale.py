@@ -1,19 +1,23 @@
 import numpy as np
-from patty.segmentation import segment_dbscan
+from patty.segmentation import cluster_statistics, dbscan_labels
 from patty.utils import extract_mask
-from patty.utils import measure_length
+from patty.subset import PointSubset
 from patty.segmentation.segRedStick import get_red_mask
+from patty.instrument import timed
 
 # according to Rens, sticks are .8m and contain 4 segments:
 SEGMENTS_PER_METER = 5.0
 
 
-def get_stick_scale(pointcloud, eps=0.1, min_samples=20):
+@timed()
+def get_stick_scale(pointcloud, eps=0.1, min_samples=20, red_indices=None):
     """Takes a point cloud, as a numpy array, looks for red segments
     of scale sticks and returns the scale estimation with most support.
     Method:
     pointcloud --dbscan--> clusters --lengthEstimation-->
         lengths --ransac--> best length
+    The lengths of all clusters are estimated in one pass, see
+    cluster_statistics.
     Arguments:
         pointcloud    Point cloud containing only measuring stick segments
                       (only the red, or only the white parts)
@@ -21,6 +25,9 @@ def get_stick_scale(pointcloud, eps=0.1, min_samples=20):
                       for them to be considered as in the same neighborhood.
         min_samples   DBSCAN parameter: The number of samples in a neighborhood
                       for a point to be considered as a core point.
+        red_indices   Indices of the red points, if already known (see
+                      patty.segmentation.RedPointCollector); saves a scan
+                      over all points.
     Returns:
         scale         Estimate of the size of one actual meter in expressed
                       in units of the pointcloud's coordinates.
@@ -35,17 +42,21 @@ def get_stick_scale(pointcloud, eps=0.1, min_samples=20):
         return 1, 0
 
     # find the red segments to measure
-    pc_reds = extract_mask(pointcloud, get_red_mask(pointcloud))
+    # as a view; the red points are only used as an array
+    if red_indices is None:
+        pc_reds = extract_mask(pointcloud, get_red_mask(pointcloud),
+                               view=True)
+    else:
+        pc_reds = PointSubset(pointcloud, red_indices)
     if len(pc_reds) == 0:
         # unit scale, zero confidence (ie. any other estimation is better)
         return 1.0, 0.0
 
-    cluster_generator = segment_dbscan(
-        pc_reds, eps, min_samples, algorithm='kd_tree')
+    labels = dbscan_labels(pc_reds, eps, min_samples, algorithm='kd_tree')
+    stats = cluster_statistics(pc_reds, labels)
 
-    sizes = [{'len': len(cluster),
-              'meter': measure_length(cluster) * SEGMENTS_PER_METER}
-             for cluster in cluster_generator]
+    sizes = [{'len': count, 'meter': length * SEGMENTS_PER_METER}
+             for count, length in zip(stats.count, stats.length)]
 
     if len(sizes) == 0:
         return 1.0, 0.0
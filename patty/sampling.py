@@ -0,0 +1,231 @@
+"""
+Streaming random samplers for chunked pointclouds.
+
+All samplers take the points chunk by chunk, so a pointcloud can be sampled
+while it is read, without holding it (or a permutation of its size) in
+memory. Every chunk gets its own random stream, seeded by the seed of the
+sampler and the number of the chunk, so results are reproducible for a given
+seed and chunk size.
+
+The samplers with an update(chunk, start) method can be passed as side
+outputs to patty.utils.load.
+"""
+from __future__ import division
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from patty.moments import DEFAULT_CHUNK_SIZE
+from patty.voxelgrid import voxel_keys
+
+
+def chunk_random_state(seed, chunk):
+    """Random number generator for chunk number chunk.
+
+    With seed None the generator is seeded from the operating system.
+    """
+    if seed is None:
+        return np.random.RandomState()
+    return np.random.RandomState([seed, chunk])
+
+
+class BernoulliSampler(object):
+    '''Keeps every point independently with probability fraction.
+
+    The size of the sample is random, with mean fraction * N.
+
+    Constructor usage: BernoulliSampler(fraction, seed=0)
+
+    Example:
+
+        sampler = BernoulliSampler(0.1)
+        sample = [chunk[sampler.mask(chunk)] for chunk in chunks]
+    '''
+
+    def __init__(self, fraction, seed=0):
+        self.fraction = fraction
+        self.seed = seed
+        self._chunk = 0
+
+    def mask(self, chunk):
+        '''Boolean mask of the points of chunk that are in the sample.'''
+        rng = chunk_random_state(self.seed, self._chunk)
+        self._chunk += 1
+        return rng.random_sample(len(chunk)) < self.fraction
+
+
+class ReservoirSampler(object):
+    '''Uniform sample of exactly size points (or all points, if fewer).
+
+    Every point gets a random priority; the points with the lowest
+    priorities are kept, which is a uniform sample without replacement.
+    Memory use is bounded by size plus the size of a chunk.
+
+    Constructor usage: ReservoirSampler(size, seed=0)
+
+    Example:
+
+        sampler = ReservoirSampler(1000)
+        pointcloud = load('cloud.las', side_outputs=[sampler])
+        indices, points = sampler.result()
+    '''
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seed = seed
+        self._chunk = 0
+        self._priorities = np.zeros(0)
+        self._indices = np.zeros(0, dtype=np.intp)
+        self._points = None
+
+    def update(self, chunk, start):
+        '''Add the points of chunk, the rows start, start + 1, ...'''
+        rng = chunk_random_state(self.seed, self._chunk)
+        self._chunk += 1
+
+        chunk = np.asarray(chunk)
+        priorities = np.concatenate([self._priorities,
+                                     rng.random_sample(len(chunk))])
+        indices = np.concatenate([self._indices,
+                                  np.arange(start, start + len(chunk))])
+        if self._points is None:
+            points = chunk.copy()
+        else:
+            points = np.vstack([self._points, chunk])
+
+        if len(priorities) > self.size:
+            keep = np.argpartition(priorities, self.size - 1)[:self.size]
+            priorities, indices, points = (priorities[keep], indices[keep],
+                                           points[keep])
+        self._priorities, self._indices, self._points = (priorities, indices,
+                                                         points)
+
+    def result(self):
+        '''Indices, np.array([K]), and the points, np.array([K, D]), of the
+        sample, in the order of the input.'''
+        order = np.argsort(self._indices)
+        points = self._points
+        if points is None:
+            points = np.zeros((0, 3))
+        return self._indices[order], points[order]
+
+
+def _lowest_per_key(keys, priorities):
+    """Indices of the entry with the lowest priority of every key."""
+    order = np.lexsort((priorities, keys))
+    keys = keys[order]
+    return order[np.concatenate([[True], keys[1:] != keys[:-1]])]
+
+
+def _greedy_independent(points, priorities, radius):
+    """Mask of the points kept by visiting them in order of priority, and
+    keeping each point further than radius from all points kept before.
+
+    Computed in parallel rounds: an undecided point is kept when it has the
+    lowest priority of its undecided neighbors, after which its neighbors
+    are dropped.
+    """
+    pairs = cKDTree(points[:, 0:3]).query_pairs(radius, output_type='ndarray')
+    pairs = pairs.astype(np.intp, copy=False).reshape(-1, 2)
+
+    undecided = np.ones(len(points), dtype=bool)
+    kept = np.zeros(len(points), dtype=bool)
+    while len(pairs):
+        first_lower = priorities[pairs[:, 0]] < priorities[pairs[:, 1]]
+        losers = np.where(first_lower, pairs[:, 1], pairs[:, 0])
+        winners = undecided.copy()
+        winners[losers] = False
+        kept |= winners
+        undecided &= ~winners
+
+        # neighbors of kept points are dropped
+        dropped = np.concatenate([pairs[winners[pairs[:, 0]], 1],
+                                  pairs[winners[pairs[:, 1]], 0]])
+        undecided[dropped] = False
+        pairs = pairs[undecided[pairs[:, 0]] & undecided[pairs[:, 1]]]
+
+    return kept | undecided
+
+
+class PoissonDiskSampler(object):
+    '''Sample of points that are at least radius apart (blue noise).
+
+    Points are hashed to voxels with edge radius / sqrt(3), which can hold
+    at most one point of the sample; per voxel only the candidate with the
+    lowest random priority is kept while reading. At the end, candidates
+    closer than radius are resolved greedily in order of priority, as in
+    dart throwing. Memory use is bounded by the number of occupied voxels.
+
+    Unlike a uniform sample, the result covers the pointcloud evenly:
+    dense regions are thinned, sparse regions are kept.
+
+    Constructor usage: PoissonDiskSampler(radius, origin, seed=0), with
+    origin the minimum of the points (see patty.voxelgrid.voxel_keys).
+    '''
+
+    def __init__(self, radius, origin, seed=0):
+        self.radius = radius
+        self.origin = np.asarray(origin, dtype=np.float64)[0:3]
+        self.seed = seed
+        self._chunk = 0
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._priorities = np.zeros(0)
+        self._indices = np.zeros(0, dtype=np.intp)
+        self._points = None
+
+    def update(self, chunk, start):
+        '''Add the points of chunk, the rows start, start + 1, ...'''
+        rng = chunk_random_state(self.seed, self._chunk)
+        self._chunk += 1
+
+        chunk = np.asarray(chunk)
+        keys = voxel_keys(chunk, self.origin, self.radius / np.sqrt(3))
+        keys = np.concatenate([self._keys, keys])
+        priorities = np.concatenate([self._priorities,
+                                     rng.random_sample(len(chunk))])
+        indices = np.concatenate([self._indices,
+                                  np.arange(start, start + len(chunk))])
+        if self._points is None:
+            points = chunk
+        else:
+            points = np.vstack([self._points, chunk])
+
+        keep = _lowest_per_key(keys, priorities)
+        self._keys, self._priorities, self._indices, self._points = (
+            keys[keep], priorities[keep], indices[keep], points[keep])
+
+    def result(self):
+        '''Indices, np.array([K]), and the points, np.array([K, D]), of the
+        sample, in the order of the input.'''
+        if self._points is None:
+            return self._indices, np.zeros((0, 3))
+        kept = _greedy_independent(self._points, self._priorities,
+                                   self.radius)
+        indices, points = self._indices[kept], self._points[kept]
+        order = np.argsort(indices)
+        return indices[order], points[order]
+
+
+def _sample_chunks(sampler, points, chunk_size):
+    points = np.asarray(points)
+    for start in range(0, len(points), chunk_size):
+        sampler.update(points[start:start + chunk_size], start)
+    return sampler.result()[0]
+
+
+def reservoir_sample(points, size, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Indices of a uniform random sample of size points, see
+    ReservoirSampler."""
+    return _sample_chunks(ReservoirSampler(size, seed), points, chunk_size)
+
+
+def poisson_disk_sample(points, radius, seed=0,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    """Indices of a sample of points at least radius apart, see
+    PoissonDiskSampler."""
+    points = np.asarray(points)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.intp)
+    origin = points[:, 0:3].min(axis=0)
+    return _sample_chunks(PoissonDiskSampler(radius, origin, seed), points,
+                          chunk_size)
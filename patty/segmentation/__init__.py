@@ -1,11 +1,20 @@
 from .dbscan import (
+    cluster_indices,
     dbscan_labels,
     get_largest_dbscan_clusters,
+    group_labels,
     segment_dbscan,
     )
 
+from .clusterstats import (
+    ClusterStatistics,
+    cluster_statistics,
+    )
+
 from .segRedStick import (
+    RedPointCollector,
     get_red_mask,
+    is_red,
     )
 
 from .boundary import (
@@ -15,11 +24,18 @@ from .boundary import (
     )
 
 __all__ = [
+    'cluster_indices',
     'dbscan_labels',
     'get_largest_dbscan_clusters',
+    'group_labels',
     'segment_dbscan',
 
+    'ClusterStatistics',
+    'cluster_statistics',
+
+    'RedPointCollector',
     'get_red_mask',
+    'is_red',
 
     'boundary_of_center_object',
     'boundary_of_drivemap',
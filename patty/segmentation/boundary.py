@@ -12,9 +12,12 @@ from shapely.geometry import asPoint
 
 from patty import utils
 from .dbscan import get_largest_dbscan_clusters
-from .. import extract_mask, BoundingBox, log, save
+from .. import extract_mask, BoundingBox, log
+from ..debug import debug_save
+from ..instrument import timed
 
 
+@timed()
 def boundary_of_drivemap(drivemap, footprint, height=1.0, edge_width=0.25):
     """
     Construct an object boundary using the manually recorded corner points.
@@ -23,7 +26,8 @@ def boundary_of_drivemap(drivemap, footprint, height=1.0, edge_width=0.25):
     Resulting pointcloud has the same SRS and offset as the input.
 
     Arguments:
-        drivemap   : pcl.PointCloud
+        drivemap   : pcl.PointCloud or patty.registration.DrivemapIndex
+                     An index reuses the precomputed basemap height.
         footprint  : pcl.PointCloud
         height     : Cut-off height, points more than this value above the
                      lowest point of the drivemap are considered trees,
@@ -37,20 +41,36 @@ def boundary_of_drivemap(drivemap, footprint, height=1.0, edge_width=0.25):
 
     # construct basemap as the bottom 'height' meters of the drivemap
 
-    drivemap_array = np.asarray(drivemap)
-    bb = BoundingBox(points=drivemap_array)
-    basemap = extract_mask(drivemap, drivemap_array[:, 2] < bb.min[2] + height)
-
-    # Cut band between +- edge_width around the footprint
+    if hasattr(drivemap, 'basemap_height'):
+        # a DrivemapIndex; not imported here to avoid a circular import
+        drivemap_array = drivemap.points
+        basemap_height = drivemap.basemap_height
+        drivemap = drivemap.pointcloud
+    else:
+        drivemap_array = np.asarray(drivemap)
+        basemap_height = BoundingBox(points=drivemap_array).min[2]
+    # the basemap and band are views on the drivemap, only the boundary
+    # points are copied
+    basemap = extract_mask(drivemap,
+                           drivemap_array[:, 2] < basemap_height + height,
+                           view=True)
+
+    # Cut band between +- edge_width around the footprint; only the points
+    # within the bounding box of the band are tested one by one
     edge = LinearRing(np.asarray(footprint)).buffer(edge_width)
-    boundary = extract_mask(basemap,
-                            [edge.contains(asPoint(pnt)) for pnt in basemap])
+    minx, miny, maxx, maxy = edge.bounds
+    basemap = BoundingBox(min=[minx, miny], max=[maxx, maxy]).crop(
+        basemap, xy_only=True)
+    boundary = extract_mask(basemap, [edge.contains(asPoint(pnt[0:2]))
+                                      for pnt in np.asarray(basemap)])
 
-    utils.force_srs(boundary, same_as=basemap)
+    # a copy with the registration of the drivemap
+    boundary = boundary.materialize()
 
     return boundary
 
 
+@timed()
 def boundary_of_lowest_points(pc, height_fraction=0.01):
     '''
     Construct an object boundary by taking the lowest (ie. min z coordinate)
@@ -75,8 +95,10 @@ def boundary_of_lowest_points(pc, height_fraction=0.01):
     return newpc
 
 
+@timed()
 def boundary_of_center_object(pc,
                               downsample=None,
+                              min_distance=None,
                               angle_threshold=0.1,
                               search_radius=0.1,
                               normal_search_radius=0.1):
@@ -92,6 +114,10 @@ def boundary_of_center_object(pc,
         downsample : If given, reduce the pointcloud to given percentage
                      values should be in [0,1]
 
+        min_distance : If given, reduce the pointcloud to points at least
+                       this far apart instead (Poisson-disk sampling), which
+                       keeps sparse parts of the object
+
         angle_threshold : float defaults to 0.1
 
         search_radius : float defaults to 0.1
@@ -102,7 +128,10 @@ def boundary_of_center_object(pc,
         boundary : pcl.PointCloud
     """
 
-    if downsample is not None:
+    if min_distance is not None:
+        log(' - Poisson-disk downsampling distance:', min_distance)
+        pc = utils.downsample_poisson(pc, min_distance)
+    elif downsample is not None:
         log(' - Random downsampling factor:', downsample)
         pc = utils.downsample_random(pc, downsample)
     else:
@@ -113,7 +142,7 @@ def boundary_of_center_object(pc,
     # Presumably, this is the main object.
     log(' - Starting dbscan on downsampled pointcloud')
     mainobject = get_largest_dbscan_clusters(pc, 0.7, .075, 250)
-    save(mainobject, 'mainobject.las')
+    debug_save('mainobject', mainobject)
 
     boundary = estimate_boundaries(mainobject,
                                    angle_threshold=angle_threshold,
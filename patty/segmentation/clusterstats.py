@@ -0,0 +1,103 @@
+"""
+Per-cluster statistics computed for all clusters at once.
+
+Instead of extracting every cluster and fitting a PCA per cluster, the points
+are sorted by label once, and all statistics are computed with grouped
+reductions (numpy.ufunc.reduceat) and a batched eigen decomposition.
+"""
+from collections import namedtuple
+import numpy as np
+
+from .dbscan import group_labels
+
+ClusterStatistics = namedtuple('ClusterStatistics', [
+    'labels',
+    'count',
+    'centroid',
+    'covariance',
+    'variances',
+    'axes',
+    'length',
+    'bbox_min',
+    'bbox_max',
+])
+
+
+def cluster_statistics(points, labels, skip_noise=True):
+    '''
+    Compute statistics for every cluster in a labelled pointcloud.
+
+    Parameters
+    ----------
+    points : pcl.PointCloud or array of shape [N, >=3]
+        Input points; only the xyz coordinates are used.
+    labels : array of int
+        Cluster label per point, as returned by dbscan_labels.
+    skip_noise : bool, optional
+        Leave out the points with label -1 (noise). Default True.
+
+    Returns
+    -------
+    stats : ClusterStatistics
+        Named tuple of arrays, one entry per cluster (K clusters):
+
+        labels     : [K] cluster label
+        count      : [K] number of points
+        centroid   : [K, 3] mean position
+        covariance : [K, 3, 3] (population) covariance matrix
+        variances  : [K, 3] variance along the principal axes, descending
+        axes       : [K, 3, 3] principal axes as rows, sorted by variance
+        length     : [K] extent along the main principal axis, as
+                     measure_length() would give for the cluster
+        bbox_min   : [K, 3] minimum corner of the bounding box
+        bbox_max   : [K, 3] maximum corner of the bounding box
+    '''
+    points = np.asarray(points)
+    points = points.reshape(len(points), -1)[:, 0:3]
+
+    unique_labels, order, bounds = group_labels(labels, skip_noise)
+    n_clusters = len(unique_labels)
+    if n_clusters == 0:
+        return ClusterStatistics(
+            labels=unique_labels, count=np.zeros(0, dtype=np.intp),
+            centroid=np.zeros((0, 3)), covariance=np.zeros((0, 3, 3)),
+            variances=np.zeros((0, 3)), axes=np.zeros((0, 3, 3)),
+            length=np.zeros(0), bbox_min=np.zeros((0, 3)),
+            bbox_max=np.zeros((0, 3)))
+
+    sorted_points = np.asarray(points[order], dtype=np.float64)
+    starts = bounds[:-1]
+    count = np.diff(bounds)
+
+    # cluster index for every point in sorted_points
+    group = np.repeat(np.arange(n_clusters), count)
+
+    centroid = np.add.reduceat(sorted_points, starts, axis=0)
+    centroid /= count[:, np.newaxis]
+    centered = sorted_points - centroid[group]
+
+    products = (centered[:, :, np.newaxis] *
+                centered[:, np.newaxis, :]).reshape(-1, 9)
+    covariance = np.add.reduceat(products, starts, axis=0).reshape(-1, 3, 3)
+    covariance /= count[:, np.newaxis, np.newaxis]
+
+    # eigh sorts ascending; we want the principal axes first
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    variances = eigenvalues[:, ::-1]
+    axes = eigenvectors[:, :, ::-1].transpose(0, 2, 1)
+
+    projection = np.einsum('ij,ij->i', centered, axes[group, 0])
+    length = (np.maximum.reduceat(projection, starts) -
+              np.minimum.reduceat(projection, starts))
+
+    return ClusterStatistics(
+        labels=unique_labels,
+        count=count,
+        centroid=centroid,
+        covariance=covariance,
+        variances=variances,
+        axes=axes,
+        length=length,
+        bbox_min=np.minimum.reduceat(sorted_points, starts, axis=0),
+        bbox_max=np.maximum.reduceat(sorted_points, starts, axis=0),
+    )
@@ -10,9 +10,12 @@ http://scikit-learn.org/stable/modules/generated/sklearn.cluster.DBSCAN.html.
 """
 import numpy as np
 from sklearn.cluster import dbscan
-from patty.utils import extract_mask
+from patty.utils import extract_indices, extract_mask
+from patty.spatialindex import radius_neighbors_graph
+from patty.instrument import timed
 
 
+@timed()
 def dbscan_labels(pointcloud, epsilon, minpoints, rgb_weight=0,
                   algorithm='ball_tree'):
     '''
@@ -31,6 +34,15 @@ def dbscan_labels(pointcloud, epsilon, minpoints, rgb_weight=0,
         specifies the relative weight of the RGB components to spatial
         coordinates in distance computations.
         (RGB values have wildly different scales than spatial coordinates.)
+        If zero, only the xyz coordinates are used, whatever the algorithm.
+    algorithm : string, optional
+        The nearest neighbors algorithm of sklearn to use ('ball_tree',
+        'kd_tree', ...); or 'spatial_index' to find the neighbors with the
+        cached KD-tree of the pointcloud (see patty.spatialindex). The
+        latter builds the tree only once when the same points are clustered
+        repeatedly, but holds all neighbor distances in memory at once, many
+        times more than sklearn needs; use it only for repeated clustering of
+        small pointclouds. Clustering with color always uses sklearn.
 
     Returns
     -------
@@ -43,15 +55,22 @@ def dbscan_labels(pointcloud, epsilon, minpoints, rgb_weight=0,
     if rgb_weight > 0:
         X = pointcloud.to_array()
         X[:, 3:] *= rgb_weight
+        if algorithm == 'spatial_index':
+            algorithm = 'auto'
+    elif algorithm == 'spatial_index':
+        graph = radius_neighbors_graph(pointcloud, epsilon)
+        _, labels = dbscan(graph, eps=epsilon, min_samples=minpoints,
+                           metric='precomputed')
+        return np.asarray(labels)
     else:
-        X = pointcloud
+        X = np.asarray(pointcloud)[:, 0:3]
 
     _, labels = dbscan(X, eps=epsilon, min_samples=minpoints,
                        algorithm=algorithm)
     return np.asarray(labels)
 
 
-def segment_dbscan(pointcloud, epsilon, minpoints, **kwargs):
+def segment_dbscan(pointcloud, epsilon, minpoints, labels=None, **kwargs):
     """Run the DBSCAN clustering+outlier detection algorithm on pointcloud.
 
     Parameters
@@ -62,21 +81,79 @@ def segment_dbscan(pointcloud, epsilon, minpoints, **kwargs):
         Neighborhood radius for DBSCAN.
     minpoints : integer
         Minimum neighborhood density for DBSCAN.
+    labels : array of int, optional
+        Labels as returned by dbscan_labels for the same parameters; the
+        clustering is skipped when given. The clusters are yielded in the
+        order of cluster_indices(labels), as cluster_statistics reports them.
     **kwargs : keyword arguments, optional
         arguments passed to _dbscan_labels
 
     Returns
     -------
-    clusters : iterable over registered PointCloud
+    clusters : iterable over PointCloud, registered if the input is
     """
-    labels = dbscan_labels(pointcloud, epsilon, minpoints, **kwargs)
+    if labels is None:
+        labels = dbscan_labels(pointcloud, epsilon, minpoints, **kwargs)
 
-    return (extract_mask(pointcloud, labels == label)
-            for label in np.unique(labels[labels != -1]))
+    return (extract_indices(pointcloud, indices)
+            for _, indices in cluster_indices(labels))
 
 
+def group_labels(labels, skip_noise=True):
+    """Group point indices per label, using a single stable sort.
+
+    Parameters
+    ----------
+    labels : array of int
+        Label per point, as returned by dbscan_labels.
+    skip_noise : bool, optional
+        Leave out the points with label -1 (noise). Default True.
+
+    Returns
+    -------
+    unique_labels : array of int
+        The labels found, in increasing order.
+    order : array of int
+        Point indices sorted by label; within a label, indices are in
+        increasing order.
+    bounds : array of int
+        Array of length len(unique_labels) + 1. The points with label
+        unique_labels[i] are order[bounds[i]:bounds[i + 1]].
+    """
+    labels = np.asarray(labels).ravel()
+    if len(labels) == 0:
+        return labels, np.zeros(0, dtype=np.intp), np.zeros(1, dtype=np.intp)
+
+    order = np.argsort(labels, kind='mergesort')
+    sorted_labels = labels[order]
+
+    starts = np.flatnonzero(sorted_labels[1:] != sorted_labels[:-1]) + 1
+    bounds = np.concatenate(([0], starts, [len(labels)])).astype(np.intp)
+    unique_labels = sorted_labels[bounds[:-1]]
+
+    if skip_noise and len(unique_labels) > 0 and unique_labels[0] == -1:
+        order = order[bounds[1]:]
+        bounds = bounds[1:] - bounds[1]
+        unique_labels = unique_labels[1:]
+
+    return unique_labels, order, bounds
+
+
+def cluster_indices(labels, skip_noise=True):
+    """Lazily yield (label, indices) pairs for every cluster.
+
+    The indices are views into a single sorted index array, see
+    group_labels; no per-cluster mask is built.
+    """
+    unique_labels, order, bounds = group_labels(labels, skip_noise)
+    for i, label in enumerate(unique_labels):
+        yield label, order[bounds[i]:bounds[i + 1]]
+
+
+@timed()
 def get_largest_dbscan_clusters(pointcloud, min_return_fragment=0.7,
-                                epsilon=0.1, minpoints=250, rgb_weight=0):
+                                epsilon=0.1, minpoints=250, rgb_weight=0,
+                                view=False):
     '''
     Finds the largest clusters containing together at least min_return_fragment
     of the complete point cloud. In case less points belong to clusters, all
@@ -97,6 +174,8 @@ def get_largest_dbscan_clusters(pointcloud, min_return_fragment=0.7,
         specifies the relative weight of the RGB components to spatial
         coordinates in distance computations.
         (RGB values have wildly different scales than spatial coordinates.)
+    view : bool, optional
+        Return a patty.PointSubset of the input instead of a copy.
 
     Returns
     -------
@@ -109,10 +188,14 @@ def get_largest_dbscan_clusters(pointcloud, min_return_fragment=0.7,
 
     # No clusters were found
     if selected_count < min_return_fragment * len(labels):
-        return extract_mask(pointcloud, np.ones(len(pointcloud), dtype=bool))
+        return extract_mask(pointcloud, np.ones(len(pointcloud), dtype=bool),
+                            view=view)
     else:
-        mask = [label in selection for label in labels]
-        return extract_mask(pointcloud, mask)
+        # lookup table indexed by label + 1, so outliers (-1) map to False
+        n_labels = labels.max() + 2 if len(labels) > 0 else 1
+        selected = np.zeros(n_labels, dtype=bool)
+        selected[np.asarray(selection, dtype=np.int64) + 1] = True
+        return extract_mask(pointcloud, selected[labels + 1], view=view)
 
 
 def _get_top_labels(labels, min_return_fragment):
@@ -1,19 +1,82 @@
-import colorsys
 import numpy as np
 
+from patty.utils import point_array
+
+
+def is_red(colors):
+    """Returns a mask for the red colors in an array of RGB values.
+
+    Red colors have hue larger than 0.9 and saturation larger than 0.5 in
+    HSV colorspace (as computed by colorsys.rgb_to_hsv).
+
+    Arguments:
+        colors : np.array([N, 3])
+    """
+    colors = np.asarray(colors, dtype=np.float32)
+    red, grn, blu = colors[:, 0], colors[:, 1], colors[:, 2]
+    maxc = colors.max(axis=1)
+    delta = maxc - colors.min(axis=1)
+
+    # avoid dividing by zero for grey colors, they have saturation 0
+    grey = delta == 0
+    safe_delta = np.where(grey, 1, delta)
+    sat = np.where(grey, 0, delta / np.where(maxc == 0, 1, maxc))
+
+    # hue as in colorsys: the sector of the largest component
+    hue = np.where(red == maxc, (grn - blu) / safe_delta,
+                   np.where(grn == maxc, 2.0 + (blu - red) / safe_delta,
+                            4.0 + (red - grn) / safe_delta))
+    hue = (hue / 6.0) % 1.0
+
+    return (hue > 0.9) & (sat > 0.5)
+
 
 def get_red_mask(pointcloud):
     """Returns a mask for the red parts of a pointcloud.
 
     Red points are points that have hue larger than 0.9
     and saturation larger than 0.5 in HSV colorspace.
+
+    Arguments:
+        pointcloud : pcl.PointCloudXYZRGB, or np.array([N, 6])
     """
+    return is_red(point_array(pointcloud)[:, 3:6])
+
+
+class RedPointCollector(object):
+    '''Collects the red points of a pointcloud while it is read.
+
+    Pass it as side output to patty.utils.load, to find the red (stick)
+    points in the same pass that decodes the file; get_stick_scale can then
+    work on just these points via their indices.
+
+    Attributes:
+        indices : np.array([K]), indices of the red points
+        points : np.array([K, 3]), their coordinates as read (absolute)
+    '''
+
+    def __init__(self):
+        self._indices = []
+        self._points = []
+
+    def update(self, chunk, start):
+        '''Add the red points of chunk, the rows start, start + 1, ...
+
+        Arguments:
+            chunk : np.array([N, 6]), XYZ and RGB
+            start : int, index of the first row of chunk
+        '''
+        if chunk.shape[1] < 6:
+            # no colors, no red points
+            return
+        mask = is_red(chunk[:, 3:6])
+        self._indices.append(np.flatnonzero(mask) + start)
+        self._points.append(chunk[mask, 0:3])
 
-    red_mask = np.empty(len(pointcloud), dtype=np.bool)
-    for i in xrange(len(pointcloud)):
-        red, grn, blu = pointcloud[i][3:6]
-        hue, sat, _ = colorsys.rgb_to_hsv(
-            np.float32(red), np.float32(grn), np.float32(blu))
-        red_mask[i] = hue > 0.9 and sat > 0.5
+    @property
+    def indices(self):
+        return np.concatenate(self._indices + [np.zeros(0, dtype=np.intp)])
 
-    return red_mask
+    @property
+    def points(self):
+        return np.vstack(self._points + [np.zeros((0, 3))])
@@ -0,0 +1,55 @@
+"""
+Cached KD-trees of pointclouds.
+
+spatial_index() builds a scipy.spatial.cKDTree of the xyz coordinates of a
+pointcloud on first use, and keeps it on the pointcloud for later spatial
+queries. The functions in patty that move points (set_srs, Affine.apply)
+drop the tree with invalidate_spatial_index(); code that changes the points
+in any other way, like the pcl methods rotate() or transform(), or writing
+to np.asarray(pointcloud), has to call invalidate_spatial_index() itself.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+_ATTRIBUTE = '_patty_spatial_index'
+
+
+def spatial_index(pointcloud):
+    """KD-tree (scipy.spatial.cKDTree) of the xyz coordinates of pointcloud,
+    reused until invalidate_spatial_index(pointcloud) is called.
+
+    The tree is kept on the pointcloud (a pcl.PointCloud or PointSubset);
+    for objects that do not take attributes, like numpy arrays, it is built
+    every time.
+    """
+    tree = getattr(pointcloud, _ATTRIBUTE, None)
+    if tree is not None:
+        return tree
+
+    points = np.asarray(pointcloud)
+    tree = cKDTree(np.asarray(points[:, 0:3], dtype=np.float64))
+    try:
+        setattr(pointcloud, _ATTRIBUTE, tree)
+    except AttributeError:
+        pass
+    return tree
+
+
+def invalidate_spatial_index(pointcloud):
+    """Drop the cached KD-tree of pointcloud, if any."""
+    if getattr(pointcloud, _ATTRIBUTE, None) is not None:
+        setattr(pointcloud, _ATTRIBUTE, None)
+
+
+def radius_neighbors_graph(pointcloud, radius):
+    """Sparse matrix of the distances between the points within radius of
+    each other (including each point itself), from the cached KD-tree.
+
+    Suitable as precomputed input for sklearn.cluster.dbscan.
+
+    Returns:
+        graph : scipy.sparse.csr_matrix([N, N])
+    """
+    tree = spatial_index(pointcloud)
+    return tree.sparse_distance_matrix(tree, radius,
+                                       output_type='coo_matrix').tocsr()
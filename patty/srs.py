@@ -2,6 +2,8 @@ from __future__ import print_function
 import numpy as np
 import osgeo.osr as osr
 
+from patty.spatialindex import invalidate_spatial_index
+
 
 def is_registered(pointcloud):
     """
@@ -177,6 +179,7 @@ def set_srs(pc, srs=None, offset=np.array([0, 0, 0], dtype=np.float64),
 
     # copy the float64 to the pointcloud
     data[...] = np.asarray(precise_points, dtype=np.float32)
+    invalidate_spatial_index(pc)
 
     return pc
 
@@ -0,0 +1,91 @@
+"""
+Index views on pointclouds.
+
+A PointSubset refers to some points of a parent pointcloud by index, and has
+the registration (offset and SRS) of its parent. Masking a subset gives a
+subset of the same parent, so chains of selections never copy points; the
+points are gathered only when they are used as an array, or when a new
+pcl.PointCloud is needed (materialize).
+"""
+import numpy as np
+
+from patty.srs import force_srs, is_registered
+
+
+class PointSubset(object):
+    '''The points of a pointcloud at the given indices.
+
+    Works where the points are used as an array (np.asarray, sklearn,
+    patty.utils functions on arrays); pass materialize() to functions that
+    need a pcl.PointCloud. Selecting points does not copy them, so changes
+    to the parent are visible in the subset. The points are gathered when
+    they are used: np.asarray(subset) and to_array() return a copy, and
+    writing to that copy does not change the parent.
+
+    Constructor usage: PointSubset(pointcloud, indices), with pointcloud a
+    pcl.PointCloud or another PointSubset.
+
+    Attributes:
+        parent : pcl.PointCloud
+        indices : np.array([N]), indices into the parent
+    '''
+
+    def __init__(self, pointcloud, indices):
+        indices = np.asarray(indices, dtype=np.intp)
+        if isinstance(pointcloud, PointSubset):
+            indices = pointcloud.indices[indices]
+            pointcloud = pointcloud.parent
+        self.parent = pointcloud
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def size(self):
+        return len(self.indices)
+
+    def __array__(self, dtype=None, copy=None):
+        points = np.asarray(self.parent)[self.indices]
+        if dtype is not None:
+            points = points.astype(dtype)
+        return points
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+    def to_array(self):
+        '''Copy of the points with all columns, as pcl.PointCloud.to_array;
+        XYZ and RGB for a pcl.PointCloudXYZRGB parent.'''
+        return self.parent.to_array()[self.indices]
+
+    @property
+    def srs(self):
+        return self.parent.srs
+
+    @property
+    def offset(self):
+        return self.parent.offset
+
+    def extract(self, indices):
+        '''Subset of this subset, as pcl.PointCloud.extract.'''
+        return PointSubset(self, indices)
+
+    def mask(self, mask):
+        '''Subset of the points where mask is True.'''
+        return PointSubset(self, np.flatnonzero(mask))
+
+    def materialize(self):
+        '''A new pcl.PointCloud with the points, and the registration of the
+        parent.'''
+        pointcloud = self.parent.extract(self.indices)
+        if is_registered(self.parent):
+            force_srs(pointcloud, same_as=self.parent)
+        return pointcloud
+
+
+def materialize(pointcloud):
+    """The pcl.PointCloud of a pointcloud or PointSubset."""
+    if isinstance(pointcloud, PointSubset):
+        return pointcloud.materialize()
+    return pointcloud
@@ -9,9 +9,14 @@ import pcl
 import os
 import numpy as np
 import time
+from itertools import islice
 from patty.srs import force_srs, is_registered
-
-from sklearn.decomposition import PCA
+from patty.moments import DEFAULT_CHUNK_SIZE, Moments, iter_chunks
+from patty.instrument import timed
+from patty.subset import PointSubset
+from patty.voxelgrid import voxel_downsample
+from patty.sampling import (BernoulliSampler, poisson_disk_sample,
+                            reservoir_sample)
 
 
 def _check_readable(filepath):
@@ -53,7 +58,8 @@ def clone(pc):
     return cp
 
 
-def load(path, format=None, load_rgb=True):
+@timed()
+def load(path, format=None, load_rgb=True, side_outputs=()):
     """
     Read a pointcloud file.
 
@@ -69,21 +75,36 @@ def load(path, format=None, load_rgb=True):
         load_rgb : bool
             Whether RGB is loaded for PLY and PCD files. For LAS files, RGB is
             always read.
+        side_outputs : sequence, optional
+            Objects with a method update(chunk, start), that is called with
+            the points as they are read: chunk is a float64 array of the
+            absolute XYZ coordinates (and the RGB colors, if present) of the
+            points start, start + 1, ... For LAS files this happens while
+            decoding, without another pass over the points. See for instance
+            patty.segmentation.RedPointCollector.
 
     Returns:
         pc : pcl.PointCloud
     """
     if format == 'las' or format is None and path.endswith('.las'):
-        pc = _load_las(path)
+        return _load_las(path, side_outputs)
     elif format == 'las' or format is None and path.endswith('.csv'):
         pc = _load_csv(path)
     else:
         _check_readable(path)
         pc = pcl.load(path, format=format, loadRGB=load_rgb)
 
+    if side_outputs:
+        points = np.array(point_array(pc), dtype=np.float64)
+        if is_registered(pc):
+            points[:, 0:3] += pc.offset
+        for output in side_outputs:
+            output.update(points, 0)
+
     return pc
 
 
+@timed()
 def save(cloud, path, format=None, binary=False, las_header=None):
     """Save a pointcloud to file.
 
@@ -116,14 +137,14 @@ def save(cloud, path, format=None, binary=False, las_header=None):
         pcl.save(cloud, path, format=format, binary=binary)
 
 
-def _load_las(lasfile):
+def _load_las(lasfile, side_outputs=()):
     """Read a LAS file
 
     Returns:
         registered pointcloudxyzrgb
 
     The pointcloud has color and XYZ coordinates, and the offset and precision
-    set.
+    set. The side outputs are updated chunk by chunk, see load().
     """
     _check_readable(lasfile)
 
@@ -136,11 +157,12 @@ def _load_las(lasfile):
         n_points = las.header.get_count()
         precise_points = np.zeros((n_points, 6), dtype=np.float64)
 
-        for i, point in enumerate(las):
-            precise_points[i] = (point.x, point.y, point.z,
-                                 point.color.red / 256,
-                                 point.color.green / 256,
-                                 point.color.blue / 256)
+        start = 0
+        for chunk in _iter_las_chunks(las):
+            precise_points[start:start + len(chunk)] = chunk
+            for output in side_outputs:
+                output.update(chunk, start)
+            start += len(chunk)
 
         # reduce the offset to decrease floating point errors
         bbox = BoundingBox(points=precise_points[:, 0:3])
@@ -157,6 +179,152 @@ def _load_las(lasfile):
     return pointcloud
 
 
+def _iter_las_chunks(las, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the points of an open LAS file in chunks of np.array([N, 6]),
+    float64, with the absolute XYZ coordinates and the color."""
+    points = iter(las)
+    while True:
+        chunk = [(point.x, point.y, point.z,
+                  point.color.red / 256,
+                  point.color.green / 256,
+                  point.color.blue / 256)
+                 for point in islice(points, chunk_size)]
+        if len(chunk) == 0:
+            return
+        yield np.array(chunk, dtype=np.float64)
+
+
+@timed()
+def load_las_sample(lasfile, fraction, seed=0,
+                    chunk_size=DEFAULT_CHUNK_SIZE, side_outputs=()):
+    """Read a random sample of the points of a LAS file.
+
+    The file is read chunk by chunk, and every point is kept with
+    probability fraction, so the memory use is set by the size of the
+    sample, not of the file.
+
+    Arguments:
+        lasfile : string
+            Filename.
+        fraction : float
+            Fraction of the points to keep, in [0, 1].
+        seed : int
+            Seed of the random number generator.
+        side_outputs : sequence, optional
+            Updated with the sampled points, see load().
+
+    Returns:
+        registered pointcloudxyzrgb
+
+    The offset is the center of the bounding box in the LAS header.
+    """
+    _check_readable(lasfile)
+    sampler = BernoulliSampler(fraction, seed)
+
+    las = None
+    try:
+        las = liblas.file.File(lasfile)
+        lsrs = las.header.get_srs().get_wkt()
+        offset = (np.array(las.header.min, dtype=np.float64) +
+                  np.array(las.header.max, dtype=np.float64)) / 2.0
+
+        samples = [np.zeros((0, 6), dtype=np.float32)]
+        start = 0
+        for chunk in _iter_las_chunks(las, chunk_size):
+            sample = chunk[sampler.mask(chunk)]
+            for output in side_outputs:
+                output.update(sample, start)
+            start += len(sample)
+
+            sample[:, 0:3] -= offset
+            samples.append(sample.astype(np.float32))
+
+        pointcloud = pcl.PointCloudXYZRGB(np.vstack(samples))
+        force_srs(pointcloud, srs=lsrs, offset=offset)
+
+    finally:
+        if las is not None:
+            las.close()
+
+    return pointcloud
+
+
+@timed()
+def transform_las(source, target, transform, source_offset, target_offset,
+                  srs=None, precision=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Apply a transform to the points of a LAS file, and write the result
+    to a new LAS file, chunk by chunk.
+
+    The transform acts on coordinates relative to an offset, as the points
+    of a registered pointcloud; for absolute coordinates p the result is
+
+        transform * (p - source_offset) + target_offset
+
+    Use this to apply a registration found on a sample of a large file
+    (see load_las_sample) to all its points.
+
+    Arguments:
+        source : string
+            Filename of the LAS file to read.
+        target : string
+            Filename of the LAS file to write.
+        transform : np.array([4,4]) or patty.Affine
+        source_offset, target_offset : np.array([3])
+        srs : string, optional
+            Spatial reference system (WKT) of the result; default the one
+            of the source file.
+        precision : np.array([3]), optional
+            Precision of the coordinates in the output, see make_las_header.
+    """
+    _check_readable(source)
+    _check_writable(target)
+
+    matrix = np.asarray(transform, dtype=np.float64)
+    source_offset = np.asarray(source_offset, dtype=np.float64)
+    target_offset = np.asarray(target_offset, dtype=np.float64)
+
+    las = None
+    out = None
+    try:
+        las = liblas.file.File(source)
+        if srs is None:
+            srs = las.header.get_srs().get_wkt()
+
+        header = _las_header(srs, target_offset, precision)
+
+        # the bounding box of the transformed corners of the source
+        # bounding box contains all transformed points
+        lower = np.array(las.header.min, dtype=np.float64)
+        upper = np.array(las.header.max, dtype=np.float64)
+        corners = np.array([[x, y, z] for x in (lower[0], upper[0])
+                            for y in (lower[1], upper[1])
+                            for z in (lower[2], upper[2])])
+        corners = (np.dot(corners - source_offset, matrix[0:3, 0:3].T) +
+                   matrix[0:3, 3])
+        header.min = corners.min(axis=0) + target_offset
+        header.max = corners.max(axis=0) + target_offset
+
+        out = liblas.file.File(target, mode="w", header=header)
+        for chunk in _iter_las_chunks(las, chunk_size):
+            xyz = (np.dot(chunk[:, 0:3] - source_offset, matrix[0:3, 0:3].T) +
+                   matrix[0:3, 3])
+            xyz /= header.scale
+            for i in range(len(chunk)):
+                point = liblas.point.Point()
+                point.x, point.y, point.z = xyz[i]
+                red, grn, blu = chunk[i, 3:6]
+                point.color = liblas.color.Color(
+                    red=int(red) * 256,
+                    green=int(grn) * 256,
+                    blue=int(blu) * 256)
+                out.write(point)
+    finally:
+        if out is not None:
+            out.close()
+        if las is not None:
+            las.close()
+
+
 def _load_csv(path, delimiter=','):
     """
     Load a set of points from a CSV file as a pointcloud
@@ -193,17 +361,53 @@ def _save_csv(path, pc, delimiter=', '):
     np.savetxt(path, np.asarray(pc) + offset, delimiter=delimiter)
 
 
-def extract_mask(pointcloud, mask):
+def point_array(pointcloud):
+    """All columns of the points as an array: XYZ and RGB for a
+    pcl.PointCloudXYZRGB, for which np.asarray gives only the XYZ view.
+
+    Arguments:
+        pointcloud : pcl.PointCloud, patty.subset.PointSubset or np.array
+    Returns:
+        points : np.array([N, 3]) or np.array([N, 6])
+    """
+    if hasattr(pointcloud, 'to_array'):
+        return pointcloud.to_array()
+    return np.asarray(pointcloud)
+
+
+def extract_mask(pointcloud, mask, view=False):
     """Extract all points in a mask into a new pointcloud.
 
     Arguments:
-        pointcloud : pcl.PointCloud
+        pointcloud : pcl.PointCloud or patty.subset.PointSubset
             Input pointcloud.
         mask : numpy.ndarray of bool
             mask for which points from the pointcloud to include.
+        view : Boolean, default False
+            Return a PointSubset on the input instead of copying the points;
+            always the case when the input is a PointSubset.
     Returns:
         pointcloud with the same registration (if any) as the original one."""
-    pointcloud_new = pointcloud.extract(np.where(mask)[0])
+    return extract_indices(pointcloud, np.flatnonzero(mask), view=view)
+
+
+def extract_indices(pointcloud, indices, view=False):
+    """Extract the points at the given indices into a new pointcloud.
+
+    Arguments:
+        pointcloud : pcl.PointCloud or patty.subset.PointSubset
+            Input pointcloud.
+        indices : numpy.ndarray of int
+            indices of the points to include.
+        view : Boolean, default False
+            Return a PointSubset on the input instead of copying the points;
+            always the case when the input is a PointSubset.
+    Returns:
+        pointcloud with the same registration (if any) as the original one."""
+    if view or isinstance(pointcloud, PointSubset):
+        return PointSubset(pointcloud, indices)
+
+    pointcloud_new = pointcloud.extract(indices)
     if is_registered(pointcloud):
         force_srs(pointcloud_new, same_as=pointcloud)
     return pointcloud_new
@@ -226,6 +430,22 @@ def make_las_header(pointcloud):
         header : liblas.header.Header
             Header for writing the pointcloud to a LAS file.
     """
+    srs = None
+    if is_registered(pointcloud) and hasattr(pointcloud, 'srs'):
+        srs = pointcloud.srs.ExportToWkt()
+
+    head = _las_header(srs, getattr(pointcloud, 'offset', None),
+                       getattr(pointcloud, 'precision', None))
+
+    pc_array = np.asarray(pointcloud)[:, 0:3]
+    head.min = pc_array.min(axis=0) + head.offset
+    head.max = pc_array.max(axis=0) + head.offset
+    return head
+
+
+def _las_header(srs=None, offset=None, precision=None):
+    """LAS header with color, the SRS (as WKT), offset and precision;
+    without bounding box."""
     schema = liblas.schema.Schema()
     schema.time = False
     schema.color = True
@@ -237,31 +457,28 @@ def make_las_header(pointcloud):
     head.major_version = 1
     head.minor_version = 2
 
-    if is_registered(pointcloud):
+    if srs is not None:
         try:
             lsrs = liblas.srs.SRS()
-            lsrs.set_wkt(pointcloud.srs.ExportToWkt())
+            lsrs.set_wkt(srs)
             head.set_srs(lsrs)
         except liblas.core.LASException:
             pass
 
-    if hasattr(pointcloud, 'offset'):
-        head.offset = pointcloud.offset
+    if offset is not None:
+        head.offset = offset
     else:
         head.offset = np.zeros(3)
 
     # FIXME: need extra precision to reduce floating point errors. We don't
     # know exactly why this works. It might reduce precision on the top of
     # the float, but reduces an error of one bit for the last digit.
-    if not hasattr(pointcloud, 'precision'):
+    if precision is None:
         precision = np.array([0.01, 0.01, 0.01], dtype=np.float64)
     else:
-        precision = np.array(pointcloud.precision, dtype=np.float64)
+        precision = np.array(precision, dtype=np.float64)
     head.scale = precision * 0.5
 
-    pc_array = np.asarray(pointcloud)
-    head.min = pc_array.min(axis=0) + head.offset
-    head.max = pc_array.max(axis=0) + head.offset
     return head
 
 
@@ -289,7 +506,7 @@ def _save_las(lasfile, pointcloud, header=None):
     else:
         do_rgb = False
 
-    precise_points = np.array(pointcloud, dtype=np.float64)
+    precise_points = np.array(pointcloud, dtype=np.float64)[:, 0:3]
     precise_points /= header.scale
 
     las = None
@@ -319,7 +536,12 @@ class BoundingBox(object):
 
     Constructor usage: either set points (any object that is converted to an
     NxD array by np.asarray, with D the number of dimensions) or a fixed min
-    and max.
+    and max. To grow a box chunk by chunk, start from BoundingBox.empty()
+    and call update().
+
+    Queries take one position or an array of points; of the points only the
+    first (up to three) coordinates are compared, so XYZRGB arrays can be
+    passed directly.
     '''
 
     def __init__(self, points=None, min=None, max=None):
@@ -335,6 +557,17 @@ class BoundingBox(object):
 
         self._reset()
 
+    @classmethod
+    def empty(cls, dim=3):
+        '''A box that contains nothing, to update() with points.'''
+        return cls(min=np.full(dim, np.inf), max=np.full(dim, -np.inf))
+
+    @classmethod
+    def from_header(cls, header):
+        '''The box of a LAS file from its liblas header, in absolute
+        coordinates.'''
+        return cls(min=header.min, max=header.max)
+
     def __str__(self):
         return 'BoundingBox <%s - %s>' % (self.min, self.max)
 
@@ -349,7 +582,7 @@ class BoundingBox(object):
     @min.setter
     def min(self, new_min):
         self._reset()
-        self.min = new_min
+        self._min = np.asarray(new_min, dtype=np.float64)
 
     @property
     def max(self):
@@ -358,7 +591,7 @@ class BoundingBox(object):
     @max.setter
     def max(self, new_max):
         self._reset()
-        self.max = new_max
+        self._max = np.asarray(new_max, dtype=np.float64)
 
     @property
     def center(self):
@@ -379,9 +612,70 @@ class BoundingBox(object):
         ''' Length of the diagonal of the box. '''
         return np.linalg.norm(self.size)
 
+    @property
+    def is_empty(self):
+        ''' Whether the box contains no position at all. '''
+        return bool(np.any(self.min > self.max))
+
+    def update(self, points):
+        '''Grow the box to contain points, np.array([N, D]); returns the
+        box itself.'''
+        points = np.asarray(points)
+        if len(points):
+            self.min = np.minimum(self.min, points.min(axis=0))
+            self.max = np.maximum(self.max, points.max(axis=0))
+        return self
+
+    def union(self, other):
+        ''' Smallest box containing both boxes. '''
+        return BoundingBox(min=np.minimum(self.min, other.min),
+                           max=np.maximum(self.max, other.max))
+
+    def intersection(self, other):
+        ''' Box of the positions in both boxes; may be empty. '''
+        return BoundingBox(min=np.maximum(self.min, other.min),
+                           max=np.minimum(self.max, other.max))
+
+    def _contains(self, pos, dims):
+        pos = np.asarray(pos)
+        dims = min(dims, len(self.min))
+        inside = ((pos[..., 0:dims] >= self.min[0:dims]) &
+                  (pos[..., 0:dims] <= self.max[0:dims]))
+        return np.all(inside, axis=-1)
+
     def contains(self, pos):
-        ''' Whether the bounding box contains given position. '''
-        return np.all((pos[0:3] >= self.min) & (pos[0:3] <= self.max))
+        ''' Whether the bounding box contains given position; for an array
+        of points, a mask with one Boolean per point. '''
+        return self._contains(pos, 3)
+
+    def contains_xy(self, pos):
+        ''' As contains, comparing only the x and y coordinates. '''
+        return self._contains(pos, 2)
+
+    def crop(self, pointcloud, xy_only=False, absolute=False):
+        '''The points of pointcloud within the box, as a new pointcloud
+        with the same registration.
+
+        Arguments:
+            pointcloud : pcl.PointCloud
+            xy_only : Boolean, compare only x and y
+            absolute : Boolean, the box is in absolute coordinates (for
+                       instance from_header), not relative to the offset
+                       of the pointcloud
+        '''
+        dims = 2 if xy_only else 3
+        box = self
+        if absolute and hasattr(pointcloud, 'offset'):
+            n = min(3, len(self.min))
+            offset = np.asarray(pointcloud.offset, dtype=np.float64)[0:n]
+            box = BoundingBox(min=self.min[0:n] - offset,
+                              max=self.max[0:n] - offset)
+
+        points = np.asarray(pointcloud)
+        mask = np.concatenate([np.zeros(0, dtype=bool)] +
+                              [box._contains(chunk, dims)
+                               for chunk in iter_chunks(points)])
+        return extract_mask(pointcloud, mask)
 
 
 def log(*args, **kwargs):
@@ -390,44 +684,71 @@ def log(*args, **kwargs):
 
 
 def measure_length(pointcloud):
-    """Returns the length of a point cloud in its longest direction."""
+    """Returns the length of a point cloud in its longest direction.
+
+    Uses two read-only passes over the points: one to find the principal
+    axis, one to find the extent along it.
+    """
     if len(pointcloud) < 2:
         return 0
 
-    pca = PCA(n_components=1)
     pc_array = np.asarray(pointcloud)
-    pca.fit(pc_array)
-    primary_axis = np.dot(pc_array, np.transpose(pca.components_))[:, 0]
-    return np.max(primary_axis) - np.min(primary_axis)
+    moments = Moments(pc_array)
+    _, axes = moments.principal_axes()
 
+    low, high = np.inf, -np.inf
+    for chunk in iter_chunks(pc_array):
+        projection = np.dot(chunk - moments.mean, axes[0])
+        low = min(low, projection.min())
+        high = max(high, projection.max())
+    return high - low
 
-def downsample_voxel(pc, voxel_size=0.01):
+
+@timed()
+def downsample_voxel(pc, voxel_size=0.01, return_counts=False):
     '''Downsample a pointcloud using a voxel grid filter.
     Resulting pointcloud has the same SRS and offset as the input.
 
+    Every voxel with points is replaced by the centroid of its points, with
+    their mean color; see patty.voxelgrid. The voxel grid uses 64-bit keys,
+    so large extents with small voxels do not overflow.
+
     Arguments:
         pc         : pcl.PointCloud
                      Original pointcloud
         float      : voxel_size
                      Grid spacing for the voxel grid
+        return_counts : Boolean, default False
+                     Also return the number of points per voxel, for
+                     instance to use as density weights.
     Returns:
         pc : pcl.PointCloud
              filtered pointcloud
+        counts : np.array([K])
+             number of original points per point of pc; if return_counts
     '''
-    pc_filter = pc.make_voxel_grid_filter()
-    pc_filter.set_leaf_size(voxel_size, voxel_size, voxel_size)
-    newpc = pc_filter.filter()
+    # with the colors of a pcl.PointCloudXYZRGB, see point_array
+    means, counts = voxel_downsample(point_array(pc), voxel_size)
+    if means.shape[1] > 3:
+        # mean color, as integer channel values
+        means[:, 3:] = np.round(means[:, 3:])
 
+    newpc = type(pc)(means.astype(np.float32))
     force_srs(newpc, same_as=pc)
 
+    if return_counts:
+        return newpc, counts
     return newpc
 
 
+@timed()
 def downsample_random(pc, fraction, random_seed=None):
     """Randomly downsample pointcloud to a fraction of its size.
 
     Returns a pointcloud of size fraction * len(pc), rounded to the nearest
     integer.  Resulting pointcloud has the same SRS and offset as the input.
+    The points are drawn chunk-wise by reservoir sampling, see
+    patty.sampling.ReservoirSampler, and keep their order.
 
     Use random_seed=k for some integer k to get reproducible results.
     Arguments:
@@ -444,10 +765,38 @@ def downsample_random(pc, fraction, random_seed=None):
     if not 0 < fraction <= 1:
         raise ValueError("Expected fraction in (0,1], got %r" % fraction)
 
-    rng = np.random.RandomState(random_seed)
-
     k = max(int(round(fraction * len(pc))), 1)
-    sample = rng.choice(len(pc), k, replace=False)
+    sample = reservoir_sample(np.asarray(pc), k, seed=random_seed)
+    new_pc = pc.extract(sample)
+
+    force_srs(new_pc, same_as=pc)
+
+    return new_pc
+
+
+@timed()
+def downsample_poisson(pc, radius, random_seed=None):
+    """Downsample pointcloud to points at least radius apart.
+
+    Unlike downsample_random, the result covers the pointcloud evenly;
+    dense parts are thinned most. Resulting pointcloud has the same SRS and
+    offset as the input, see patty.sampling.PoissonDiskSampler.
+
+    Arguments:
+        pc : pcl.PointCloud
+            Input pointcloud.
+        radius : float
+            Minimum distance between the points of the result.
+        random_seed : int, optional
+            Seed to use in random number generator.
+
+    Returns:
+        pcl.Pointcloud
+    """
+    if not radius > 0:
+        raise ValueError("Expected positive radius, got %r" % radius)
+
+    sample = poisson_disk_sample(np.asarray(pc), radius, seed=random_seed)
     new_pc = pc.extract(sample)
 
     force_srs(new_pc, same_as=pc)
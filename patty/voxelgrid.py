@@ -0,0 +1,123 @@
+"""
+Voxel grid downsampling on 64-bit voxel keys.
+
+Points are assigned to cubic voxels; each voxel is reduced to the centroid
+(and mean of any further columns, like the color) of its points, and the
+number of points it holds. The voxel index along each axis is packed into a
+single 64-bit key, 21 bits per axis, which allows over two million voxels
+along every axis (100 km at 5 cm). Points are grouped by sorting the keys,
+chunk by chunk, so large pointclouds can be reduced with bounded temporary
+memory.
+"""
+import numpy as np
+
+from patty.moments import DEFAULT_CHUNK_SIZE, iter_chunks
+
+BITS_PER_AXIS = 21
+MAX_VOXELS_PER_AXIS = 2 ** BITS_PER_AXIS
+
+
+def voxel_keys(points, origin, voxel_size):
+    """64-bit key of the voxel of every point.
+
+    Arguments:
+        points : np.array([N, >=3])
+        origin : np.array([3]), corner of voxel (0, 0, 0); no point may be
+                 below it
+        voxel_size : float
+
+    Returns:
+        keys : np.array([N]), int64
+    """
+    index = np.floor((np.asarray(points)[:, 0:3] - origin) /
+                     voxel_size).astype(np.int64)
+    if len(index) and (index.min() < 0 or
+                       index.max() >= MAX_VOXELS_PER_AXIS):
+        raise ValueError("Points outside the voxel grid; extent too large "
+                         "for voxel size %s" % voxel_size)
+    return ((index[:, 0] << (2 * BITS_PER_AXIS)) |
+            (index[:, 1] << BITS_PER_AXIS) | index[:, 2])
+
+
+def _reduce(keys, counts, sums):
+    """Combine the entries with equal keys, sorted by key."""
+    order = np.argsort(keys, kind='mergesort')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return (keys[starts], np.add.reduceat(counts[order], starts),
+            np.add.reduceat(sums[order], starts))
+
+
+class VoxelGrid(object):
+    '''Accumulator of the points per voxel.
+
+    Points are added chunk-wise with update(); each chunk is reduced to its
+    voxels at once, and the voxels of all chunks are combined by result().
+    Sums are kept in float64.
+
+    Constructor usage: VoxelGrid(voxel_size, origin), with origin the
+    corner of the grid, for instance the minimum of the points.
+
+    Example:
+
+        grid = VoxelGrid(0.05, points[:, 0:3].min(axis=0))
+        for chunk in chunks:
+            grid.update(chunk)
+        means, counts = grid.result()
+    '''
+
+    def __init__(self, voxel_size, origin):
+        self.voxel_size = voxel_size
+        self.origin = np.asarray(origin, dtype=np.float64)[0:3]
+        self._parts = []
+
+    def update(self, points):
+        '''Add points, np.array([N, D]) with D >= 3; all columns are
+        averaged per voxel.'''
+        points = np.asarray(points)
+        if len(points) == 0:
+            return
+        keys = voxel_keys(points, self.origin, self.voxel_size)
+        self._parts.append(_reduce(keys, np.ones(len(keys), dtype=np.int64),
+                                   points.astype(np.float64)))
+
+    def result(self):
+        '''Mean of the points, and the number of points, per voxel.
+
+        Returns:
+            means : np.array([K, D]), float64, sorted by voxel key
+            counts : np.array([K]), int64
+        '''
+        if len(self._parts) == 0:
+            return np.zeros((0, 3)), np.zeros(0, dtype=np.int64)
+        if len(self._parts) > 1:
+            keys, counts, sums = zip(*self._parts)
+            self._parts = [_reduce(np.concatenate(keys),
+                                   np.concatenate(counts),
+                                   np.concatenate(sums))]
+        _, counts, sums = self._parts[0]
+        return sums / counts[:, np.newaxis], counts
+
+
+def voxel_downsample(points, voxel_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Means and counts per voxel of points, see VoxelGrid.
+
+    The grid starts at the minimum of the points.
+
+    Arguments:
+        points : np.array([N, >=3])
+        voxel_size : float
+
+    Returns:
+        means : np.array([K, D]), float64
+        counts : np.array([K]), int64
+    """
+    points = np.asarray(points)
+    if len(points) == 0:
+        return (np.zeros((0, points.shape[1])),
+                np.zeros(0, dtype=np.int64))
+
+    grid = VoxelGrid(voxel_size, points[:, 0:3].min(axis=0))
+    for chunk in iter_chunks(points, chunk_size):
+        grid.update(chunk)
+    return grid.result()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python2.7
+"""Register many sites against one drivemap.
+
+The drivemap is read, and its spatial index built, only once. The sites are
+registered in parallel worker processes, each with a time limit. One row per
+site is written to the results table (CSV).
+
+Usage:
+  batch_registration.py [-h] [-j <jobs>] [-t <timeout>] [-d <sample>] [-m <dist>] [-v <voxel>] [-i <icp>] [-a <align>] [-C <dir>] [-D <dir>] [-M <file>] [-T] [-P <dir>] [-S <stages>] [-U] <manifest> <drivemap> <results>
+
+Positional arguments:
+  manifest     CSV file with a header and one row per site, with columns
+               source, footprint, upfile and output (as for registration.py;
+               upfile may be empty). An optional column name names the site.
+  drivemap     Target LAS file to map the sources to
+  results      CSV file to write the results table to
+
+Options:
+  -j <jobs>     Number of sites registered in parallel [default: 4].
+  -t <timeout>  Time limit per site in seconds [default: 3600].
+  -d <sample>   Downsample source pointcloud to a percentage of number of
+                points [default: 0.1].
+  -m <dist>     Downsample source pointcloud to points at least this distance
+                apart (Poisson-disk sampling) instead; keeps the coverage of
+                sparse parts.
+  -v <voxel>    Downsample source pointcloud using voxel filter to speedup ICP
+                [default: 0.05].
+  -i <icp>      ICP engine for fine registration, gicp or icp [default: gicp]
+  -a <align>    Footprint alignment for coarse registration, pca or chamfer
+                [default: pca]
+  -C <dir>      Cache the results of the initial registration, the red stick
+                scale and the pointcloud boundary in this directory, and
+                reuse them when rerun on the same sites.
+  -D <dir>      Write intermediate pointclouds (debug artifacts) to a
+                subdirectory per site of this directory; default from the
+                PATTY_DEBUG_DIR environment variable, or disabled.
+  -M <file>     Append the timings and point counts of the pipeline stages
+                of all sites to this file (JSON lines), and log a summary
+                table at the end; default from the PATTY_METRICS
+                environment variable.
+  -T            With -M, also trace the memory allocated per stage (peak
+                and largest allocations, with tracemalloc); slows down the
+                run.
+  -P <dir>      Profile the pipeline stages with cProfile, and write a
+                .pstats file and a text summary per stage to this directory;
+                default from the PATTY_PROFILE environment variable.
+  -S <stages>   With -P, profile only these stages (comma separated), eg.
+                coarse_registration,dbscan_labels,fine_attempt.
+  -U            Dont trust the upvector completely and estimate it in
+                this script, too
+"""
+
+from __future__ import print_function
+from docopt import docopt
+
+import csv
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+import numpy as np
+from patty.utils import (load, save, log)
+from patty.srs import (set_srs, force_srs)
+from patty.debug import configure_debug, flush_debug
+from patty.instrument import (configure_metrics, metrics_summary,
+                              read_metrics)
+from patty.profiling import configure_profiling
+from patty.cache import StageCache, cached
+from patty.segmentation import RedPointCollector
+
+from patty.registration import (
+    DrivemapIndex,
+    coarse_registration,
+    fine_registration,
+    get_stick_scale,
+    initial_registration,
+    )
+
+RESULT_FIELDS = [
+    'name', 'source', 'output', 'status', 'error',
+    'success', 'fitness', 'stick_scale', 'stick_confidence',
+    'time_load', 'time_initial', 'time_stickscale', 'time_coarse',
+    'time_fine', 'time_save', 'time_total', 'transform',
+]
+
+# Seconds to wait for the result of a worker that has exited
+RESULT_GRACE = 5.0
+
+
+def read_manifest(path):
+    """Read the sites from the manifest, as a list of dicts."""
+    with open(path) as f:
+        sites = [dict((key.strip(), (value or '').strip())
+                      for key, value in row.items())
+                 for row in csv.DictReader(f)]
+
+    for i, site in enumerate(sites):
+        for column in ('source', 'footprint', 'output'):
+            if not site.get(column):
+                raise ValueError("Manifest row %s has no %s" % (i + 1, column))
+        if not site.get('name'):
+            site['name'] = os.path.splitext(
+                os.path.basename(site['source']))[0]
+    return sites
+
+
+def read_up(up_file):
+    """Read the up vector from a json file, None when not possible."""
+    try:
+        with open(up_file) as f:
+            dic = json.load(f)
+        return np.array(dic['estimatedUpDirection'])
+    except Exception:
+        return None
+
+
+def register_site(site, index, options):
+    """Register one site against the drivemap index.
+
+    Returns a dict with the RESULT_FIELDS."""
+    result = dict((field, '') for field in RESULT_FIELDS)
+    result.update(name=site['name'], source=site['source'],
+                  output=site['output'])
+
+    start = time.time()
+    timings = {}
+
+    def stage(name, begin):
+        timings['time_' + name] = time.time() - begin
+        return time.time()
+
+    begin = time.time()
+    footprint = load(site['footprint'])
+    force_srs(footprint, srs="EPSG:32633")
+    set_srs(footprint, same_as=index.pointcloud)
+    reds = RedPointCollector()
+    pointcloud = load(site['source'], side_outputs=[reds])
+    up = read_up(site.get('upfile'))
+    cache = None
+    if options['cache_dir']:
+        cache = StageCache(options['cache_dir'])
+    begin = stage('load', begin)
+
+    initial_registration(pointcloud, up, index,
+                         trust_up=options['trust_up'], cache=cache)
+    begin = stage('initial', begin)
+
+    scale, confidence = cached(
+        cache, lambda: get_stick_scale(pointcloud, red_indices=reds.indices),
+        'stick_scale', pointcloud)
+    begin = stage('stickscale', begin)
+
+    center = coarse_registration(pointcloud, index, footprint,
+                                 options['downsample'],
+                                 stick_scale=(scale, confidence),
+                                 cache=cache, align_method=options['align'],
+                                 min_distance=options['min_distance'])
+    begin = stage('coarse', begin)
+
+    transf, success, fitness = fine_registration(
+        pointcloud, index, center, voxelsize=options['voxel'], n_jobs=1,
+        method=options['method'], footprint=footprint)
+    begin = stage('fine', begin)
+
+    save(pointcloud, site['output'])
+    stage('save', begin)
+
+    result.update(timings)
+    result.update(status='done', success=success, fitness=fitness,
+                  stick_scale=scale, stick_confidence=confidence,
+                  time_total=time.time() - start,
+                  transform=' '.join(repr(float(x)) for x in np.ravel(transf)))
+    return result
+
+
+def _site_worker(site, index, options, connection):
+    """Run register_site in a worker process, and send the result over
+    connection.
+
+    The debug artifacts, metrics and profiles are configured from the
+    options, as a spawned worker does not inherit the configuration of the
+    main process."""
+    if options['debug_dir']:
+        # name the debug artifacts after the site
+        configure_debug(os.path.join(options['debug_dir'], site['name']),
+                        run=site['name'])
+    if options['metrics']:
+        configure_metrics(options['metrics'], run=site['name'],
+                          trace_memory=options['trace_memory'])
+    if options['profile']:
+        configure_profiling(options['profile'], stages=options['stages'],
+                            run=site['name'])
+    try:
+        result = register_site(site, index, options)
+    except Exception:
+        result = _failed(site, 'error',
+                         traceback.format_exc().strip().split('\n')[-1])
+    flush_debug()
+    connection.send(result)
+    connection.close()
+
+
+def _failed(site, status, error):
+    result = dict((field, '') for field in RESULT_FIELDS)
+    result.update(name=site['name'], source=site['source'],
+                  output=site['output'], status=status, error=error)
+    return result
+
+
+def _receive(connection, timeout=0.0):
+    """The result sent over connection, or None when there is none within
+    timeout seconds, or the worker closed it without sending one."""
+    try:
+        if connection.poll(timeout):
+            return connection.recv()
+    except (EOFError, IOError):
+        pass
+    return None
+
+
+def run_batch(sites, index, options, n_jobs=4, timeout=3600.0):
+    """Register the sites in at most n_jobs worker processes.
+
+    The drivemap index is passed to every worker, with what was built in
+    this process (the KD-tree and normals for icp, see DrivemapIndex.build):
+    with the fork start method the workers inherit it, with spawn it is
+    pickled per worker; either way the workers do not rebuild it. Each
+    worker sends its result over its own pipe, so a worker that exceeds the
+    timeout can be terminated without affecting the others. Returns the
+    results in the order of the sites."""
+    pending = list(enumerate(sites))
+    running = {}
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < n_jobs:
+            number, site = pending.pop(0)
+            log("Starting site %s: %s" % (number, site['name']))
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_site_worker, args=(site, index, options, sender))
+            process.start()
+            # only the worker writes; closing our end lets recv() see EOF
+            sender.close()
+            running[number] = (process, receiver, time.time())
+
+        finished = False
+        for number in list(running):
+            process, receiver, started = running[number]
+            result = _receive(receiver)
+            if result is None and not process.is_alive():
+                # the result may still be on its way
+                result = _receive(receiver, RESULT_GRACE)
+                if result is None:
+                    process.join()
+                    result = _failed(sites[number], 'crashed',
+                                     'exit code %s' % process.exitcode)
+            elif result is None and time.time() - started > timeout:
+                log("Timeout for site %s, terminating" % number)
+                process.terminate()
+                result = _failed(sites[number], 'timeout',
+                                 'exceeded %s s' % timeout)
+            if result is not None:
+                process.join()
+                receiver.close()
+                del running[number]
+                results[number] = result
+                log("Finished site %s: %s" % (number, result['status']))
+                finished = True
+
+        if not finished:
+            time.sleep(0.1)
+
+    return [results[number] for number in range(len(sites))]
+
+
+def write_results(path, results):
+    """Write the results table as CSV."""
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+
+
+if __name__ == '__main__':
+
+    args = docopt(__doc__)
+
+    sites = read_manifest(args['<manifest>'])
+    options = {
+        'downsample': float(args['-d']),
+        'min_distance': float(args['-m']) if args['-m'] else None,
+        'voxel': float(args['-v']),
+        'method': args['-i'],
+        'align': args['-a'],
+        'trust_up': not args['-U'],
+        'debug_dir': args['-D'] or os.environ.get('PATTY_DEBUG_DIR'),
+        'cache_dir': args['-C'],
+        'metrics': args['-M'] or os.environ.get('PATTY_METRICS'),
+        'profile': args['-P'] or os.environ.get('PATTY_PROFILE'),
+        'stages': args['-S'] or os.environ.get('PATTY_PROFILE_STAGES'),
+        'trace_memory': args['-T'] or None,
+    }
+    if options['debug_dir']:
+        configure_debug(options['debug_dir'])
+    if options['metrics']:
+        configure_metrics(options['metrics'],
+                          trace_memory=options['trace_memory'])
+    if options['profile']:
+        configure_profiling(options['profile'], stages=options['stages'])
+
+    log("Reading drivemap", args['<drivemap>'])
+    drivemap = load(args['<drivemap>'])
+    force_srs(drivemap, srs="EPSG:32633")
+
+    log("Building drivemap index")
+    index = DrivemapIndex(drivemap).build(options['method'])
+    if options['cache_dir']:
+        # hash the drivemap once, instead of in every worker
+        index.content_digest
+
+    log("Registering %s sites" % len(sites))
+    results = run_batch(sites, index, options, n_jobs=int(args['-j']),
+                        timeout=float(args['-t']))
+    write_results(args['<results>'], results)
+
+    n_done = sum(1 for result in results if result['status'] == 'done')
+    log("Registered %s of %s sites" % (n_done, len(sites)))
+
+    if options['metrics']:
+        log("Timings per stage, all sites\n" +
+            metrics_summary(read_metrics(options['metrics'])))
@@ -18,7 +18,8 @@ Options:
 from docopt import docopt
 import sys
 
-from patty.segmentation import segment_dbscan
+from patty.segmentation import (cluster_statistics, dbscan_labels,
+                                segment_dbscan)
 from patty.utils import load, save
 
 if __name__ == '__main__':
@@ -34,12 +35,16 @@ if __name__ == '__main__':
         pc = load(args['<file>'])
     print("%d points" % len(pc))
 
-    clusters = segment_dbscan(pc, epsilon=eps, minpoints=minpoints,
-                              rgb_weight=rgb_weight)
+    labels = dbscan_labels(pc, epsilon=eps, minpoints=minpoints,
+                           rgb_weight=rgb_weight)
+    stats = cluster_statistics(pc, labels)
 
     n_outliers = len(pc)
+    clusters = segment_dbscan(pc, epsilon=eps, minpoints=minpoints,
+                              labels=labels)
     for i, cluster in enumerate(clusters):
-        print("%d points in cluster %d" % (len(cluster), i))
+        print("%d points in cluster %d, length %.3f, centroid %s" % (
+            stats.count[i], i, stats.length[i], stats.centroid[i]))
         filename = '%s/cluster%d.%s' % (args['--output_dir'], i,
                                         args['--format'])
         save(cluster, filename)
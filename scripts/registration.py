@@ -2,7 +2,7 @@
 """Registration script.
 
 Usage:
-  registration.py [-h] [-d <sample>] [-U] [-u <upfile>] [-c <camfile>] <source> <drivemap> <footprint> <output>
+  registration.py [-h] [-d <sample>] [-m <dist>] [-p <proxy>] [-i <icp>] [-a <align>] [-C <dir>] [-D <dir>] [-M <file>] [-T] [-P <dir>] [-S <stages>] [-U] [-u <upfile>] [-c <camfile>] <source> <drivemap> <footprint> <output>
 
 Positional arguments:
   source       Source LAS file
@@ -13,9 +13,34 @@ Positional arguments:
 Options:
   -d <sample>  Downsample source pointcloud to a percentage of number of points
                [default: 0.1].
+  -m <dist>    Downsample source pointcloud to points at least this distance
+               apart (Poisson-disk sampling) instead; keeps the coverage of
+               sparse parts.
   -v <voxel>   Downsample source pointcloud using voxel filter to speedup ICP
                [default: 0.05]
   -s <scale>   User override for initial scale factor
+  -p <proxy>   Register a random sample of this fraction of the source points
+               only, and apply the resulting transform to the source file
+               chunk by chunk; keeps the memory use low for large LAS files.
+  -i <icp>     ICP engine for fine registration, gicp or icp [default: gicp]
+  -a <align>   Footprint alignment for coarse registration, pca or chamfer
+               [default: pca]
+  -C <dir>     Cache the results of the initial registration, the red stick
+               scale and the pointcloud boundary in this directory, and reuse
+               them when rerun on the same input.
+  -D <dir>     Write intermediate pointclouds (debug artifacts) to this
+               directory; default from the PATTY_DEBUG_DIR environment
+               variable, or disabled.
+  -M <file>    Append the timings and point counts of the pipeline stages to
+               this file (JSON lines), and log a summary table at the end;
+               default from the PATTY_METRICS environment variable.
+  -T           With -M, also trace the memory allocated per stage (peak and
+               largest allocations, with tracemalloc); slows down the run.
+  -P <dir>     Profile the pipeline stages with cProfile, and write a .pstats
+               file and a text summary per stage to this directory; default
+               from the PATTY_PROFILE environment variable.
+  -S <stages>  With -P, profile only these stages (comma separated), eg.
+               coarse_registration,dbscan_labels,fine_attempt.
   -U           Dont trust the upvector completely and estimate it in
                this script, too
   -u <upfile>  Json file containing the up vector relative to the pointcloud.
@@ -28,12 +53,20 @@ from docopt import docopt
 import numpy as np
 import os
 import json
-from patty.utils import (load, save, log)
+from patty import Affine
+from patty.utils import (load, save, log, load_las_sample, transform_las)
 from patty.srs import (set_srs, force_srs)
+from patty.debug import configure_debug, debug_save
+from patty.instrument import (configure_metrics, metrics_enabled,
+                              metrics_summary)
+from patty.profiling import configure_profiling
+from patty.cache import StageCache, cached
+from patty.segmentation import RedPointCollector
 
 from patty.registration import (
     coarse_registration,
     fine_registration,
+    get_stick_scale,
     initial_registration,
     )
 
@@ -60,6 +93,10 @@ if __name__ == '__main__':
     except KeyError:
         Downsample = 0.1
 
+    Min_distance = None
+    if args['-m']:
+        Min_distance = float(args['-m'])
+
     try:
         Voxel = float(args['-v'])
     except KeyError:
@@ -70,6 +107,20 @@ if __name__ == '__main__':
     except:
         Initial_scale = None
 
+    if args['-D']:
+        configure_debug(args['-D'])
+
+    if args['-M']:
+        configure_metrics(args['-M'], trace_memory=args['-T'] or None)
+
+    if args['-P']:
+        configure_profiling(args['-P'], stages=args['-S'] or
+                            os.environ.get('PATTY_PROFILE_STAGES'))
+
+    Cache = None
+    if args['-C']:
+        Cache = StageCache(args['-C'])
+
     assert os.path.exists(sourcefile), sourcefile + ' does not exist'
     assert os.path.exists(drivemapfile), drivemapfile + ' does not exist'
     assert os.path.exists(footprintcsv), footprintcsv + ' does not exist'
@@ -89,8 +140,19 @@ if __name__ == '__main__':
     force_srs(footprint, srs="EPSG:32633")
     set_srs(footprint, same_as=drivemap)
 
-    log("Reading object", sourcefile)
-    pointcloud = load(sourcefile)
+    # find the red stick points while reading
+    Reds = RedPointCollector()
+
+    Proxy = args['-p']
+    if Proxy is not None:
+        log("Reading sample of object", sourcefile, Proxy)
+        pointcloud = load_las_sample(sourcefile, float(Proxy),
+                                     side_outputs=[Reds])
+        # initial_registration replaces the offset
+        source_offset = np.array(pointcloud.offset)
+    else:
+        log("Reading object", sourcefile)
+        pointcloud = load(sourcefile, side_outputs=[Reds])
 
     Up = None
     try:
@@ -101,11 +163,30 @@ if __name__ == '__main__':
     except:
         log("Cannot parse upfile, skipping")
 
+    Transform = Affine()
     initial_registration(pointcloud, Up, drivemap,
-                         trust_up=Trust_up, initial_scale=Initial_scale)
-    save(pointcloud, "initial.las")
-    center = coarse_registration(pointcloud, drivemap, footprint, Downsample)
-    save(pointcloud, "coarse.las")
-    fine_registration(pointcloud, drivemap, center, voxelsize=Voxel)
+                         trust_up=Trust_up, initial_scale=Initial_scale,
+                         cache=Cache, affine=Transform)
+    debug_save("initial", pointcloud)
+    stick_scale = cached(
+        Cache, lambda: get_stick_scale(pointcloud, red_indices=Reds.indices),
+        'stick_scale', pointcloud)
+    center = coarse_registration(pointcloud, drivemap, footprint, Downsample,
+                                 stick_scale=stick_scale, cache=Cache,
+                                 align_method=args['-a'], affine=Transform,
+                                 min_distance=Min_distance)
+    debug_save("coarse", pointcloud)
+    fine_registration(pointcloud, drivemap, center, voxelsize=Voxel,
+                      method=args['-i'], footprint=footprint,
+                      affine=Transform)
+    log("Registration transform", Transform.matrix.tolist())
+
+    if Proxy is not None:
+        log("Transforming", sourcefile)
+        transform_las(sourcefile, foutLas, Transform, source_offset,
+                      pointcloud.offset, srs=pointcloud.srs.ExportToWkt())
+    else:
+        save(pointcloud, foutLas)
 
-    save(pointcloud, foutLas)
+    if metrics_enabled():
+        log("Timings per stage\n" + metrics_summary())
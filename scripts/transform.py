@@ -6,6 +6,8 @@ The transformations (if given) are applied in the following order:
 2. scaling
 3. offset
 
+They are composed into a single transform, that is applied in one pass.
+
 Usage:
   transform.py [-o <origin>] [-r <rot>] [-t <translate>] [-s <scaling>] <source> <target>
 
@@ -26,6 +28,7 @@ from __future__ import print_function
 from docopt import docopt
 
 import numpy as np
+from patty import Affine
 from patty.utils import load, save
 
 
@@ -37,6 +40,7 @@ if __name__ == '__main__':
     args = docopt(__doc__)
 
     pc = load(args['<source>'])
+    transform = Affine()
 
     try:
         offset = csv_read(args['-o'])
@@ -45,20 +49,21 @@ if __name__ == '__main__':
 
     try:
         matrix = csv_read(args['-r'])
-        pc.rotate(matrix, origin=offset)
+        transform.rotate(matrix, origin=offset)
     except Exception as e:
         print('Problem with rotate: ', e)
 
     try:
         factor = csv_read(args['-s'])
-        pc.scale(factor, origin=offset)
+        transform.scale(factor, origin=offset)
     except Exception as e:
         print('Problem with scale: ', e)
 
     try:
         vector = csv_read(args['-t'])
-        pc.translate(vector)
+        transform.translate(vector)
     except Exception as e:
         print('Problem with translate: ', e)
 
+    transform.apply(pc)
     save(pc, args['<target>'])
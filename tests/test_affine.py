@@ -0,0 +1,65 @@
+import numpy as np
+import pcl
+from patty import Affine
+
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from nose.tools import assert_is
+import unittest
+
+from helpers import rotation_around_axis
+
+
+class TestAffine(unittest.TestCase):
+
+    def setUp(self):
+        self.points = np.random.RandomState(0).rand(100, 3) * 10
+        self.rotation = rotation_around_axis([1, 2, 3], 0.4)
+        self.origin = np.array([1.0, 2.0, 3.0])
+
+    def test_chain(self):
+        '''A chain of steps applies as the steps one after the other'''
+        affine = Affine().rotate(self.rotation, origin=self.origin)
+        affine.scale(2.0, origin=self.origin).translate([1, 0, -1])
+
+        expected = np.dot(self.points - self.origin, self.rotation.T)
+        expected = 2.0 * expected + self.origin + [1, 0, -1]
+        assert_array_almost_equal(affine.transform_points(self.points),
+                                  expected)
+
+        # as pcl.PointCloud.transform
+        assert_array_almost_equal(
+            Affine().transform(affine).transform_points(self.points),
+            expected)
+        assert_array_almost_equal(
+            affine.inverse().transform_points(expected), self.points)
+
+    def test_apply(self):
+        '''apply transforms the xyz columns in-place, chunk-wise'''
+        colors = np.ones((len(self.points), 3))
+        points = np.hstack([self.points, colors])
+
+        affine = Affine().rotate(self.rotation).translate([5, 5, 5])
+        expected = affine.transform_points(points)
+
+        result = affine.apply(points, chunk_size=7)
+        assert_is(result, points)
+        assert_array_almost_equal(points[:, 0:3], expected)
+        assert_array_equal(points[:, 3:6], colors)
+
+    def test_apply_pointcloud(self):
+        '''apply on a pointcloud'''
+        pc = pcl.PointCloud(self.points.astype(np.float32))
+        affine = Affine().scale(0.5, origin=self.origin)
+        expected = affine.transform_points(self.points)
+
+        affine.apply(pc)
+        assert_array_almost_equal(np.asarray(pc), expected, decimal=5)
+
+    def test_transformed_bounds(self):
+        '''Bounds of the transformed points'''
+        affine = Affine().rotate(self.rotation, origin=self.origin)
+        transformed = affine.transform_points(self.points)
+
+        lower, upper = affine.transformed_bounds(self.points, chunk_size=13)
+        assert_array_almost_equal(lower, transformed.min(axis=0))
+        assert_array_almost_equal(upper, transformed.max(axis=0))
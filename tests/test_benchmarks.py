@@ -0,0 +1,65 @@
+import tempfile
+import shutil
+
+from benchmarks.data import make_site
+from benchmarks.suite import BENCHMARKS, compare, measure, run_benchmarks
+from patty.segmentation import get_red_mask
+
+from numpy.testing import assert_array_equal, assert_equal
+from nose.tools import assert_greater, assert_in, assert_not_in
+
+
+def test_make_site():
+    '''Sites are reproducible, with a red stick'''
+    points, footprint = make_site(5000)
+    assert_equal(points.shape, (5000, 6))
+    assert_array_equal(points, make_site(5000)[0])
+    assert_equal(get_red_mask(points).sum(), 50)
+    assert_equal(footprint.shape, (4, 3))
+
+
+def test_measure():
+    '''Benchmarks record the time and throughput'''
+    workdir = tempfile.mkdtemp()
+    try:
+        results = run_benchmarks(['red_mask', 'downsample_voxel'],
+                                 [2000, 1000], workdir, repeat=1)
+    finally:
+        shutil.rmtree(workdir)
+
+    assert_equal([(r['benchmark'], r['size']) for r in results],
+                 [('red_mask', 1000), ('red_mask', 2000),
+                  ('downsample_voxel', 1000), ('downsample_voxel', 2000)])
+    for result in results:
+        assert_not_in('error', result)
+        assert_greater(result['points_per_second'], 0)
+
+    benchmark = BENCHMARKS['dbscan_labels'](1000, None)
+    benchmark.setup()
+    assert_equal(measure(benchmark, repeat=1)['size'], 1000)
+
+
+def test_compare():
+    '''Slower or larger benchmarks are regressions, beyond the noise'''
+    baseline = [
+        {'benchmark': 'red_mask', 'size': 10, 'seconds': 1.0},
+        {'benchmark': 'red_mask', 'size': 20, 'seconds': 1.0},
+        {'benchmark': 'red_mask', 'size': 30, 'seconds': 0.001},
+        {'benchmark': 'dbscan_labels', 'size': 10, 'seconds': 1.0,
+         'traced_peak_mb': 10.0},
+    ]
+    results = [
+        {'benchmark': 'red_mask', 'size': 10, 'seconds': 1.2},
+        {'benchmark': 'red_mask', 'size': 20, 'seconds': 2.0},
+        {'benchmark': 'red_mask', 'size': 30, 'seconds': 0.005},
+        {'benchmark': 'dbscan_labels', 'size': 10, 'seconds': 1.0,
+         'traced_peak_mb': 30.0},
+        {'benchmark': 'downsample_voxel', 'size': 10, 'seconds': 9.0},
+    ]
+    report, regressions = compare(results, baseline, threshold=0.5)
+
+    assert_equal(len(report), 4)
+    assert_equal(len(regressions), 2)
+    assert_in('red_mask', regressions[0])
+    assert_in(' 20 ', regressions[0])
+    assert_in('dbscan_labels', regressions[1])
@@ -0,0 +1,68 @@
+import numpy as np
+import pcl
+from patty import BoundingBox, force_srs
+
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+from nose.tools import assert_equal, assert_false, assert_true
+
+
+def test_setters():
+    '''Setting min or max updates the derived properties'''
+    bb = BoundingBox(min=[0, 0, 0], max=[1, 1, 1])
+    assert_array_equal(bb.center, [0.5, 0.5, 0.5])
+
+    bb.max = [3, 3, 3]
+    assert_array_equal(bb.center, [1.5, 1.5, 1.5])
+    assert_array_equal(bb.size, [3, 3, 3])
+
+
+def test_contains():
+    bb = BoundingBox(min=[0, 0, 0], max=[1, 1, 1])
+    assert_true(bb.contains(np.array([0.5, 0.5, 0.5])))
+    assert_false(bb.contains(np.array([0.5, 0.5, 2])))
+
+    points = np.array([[0.5, 0.5, 0.5, 255, 0, 0],
+                       [0.5, 0.5, 2.0, 255, 0, 0],
+                       [2.0, 0.5, 0.5, 255, 0, 0]])
+    assert_array_equal(bb.contains(points), [True, False, False])
+    assert_array_equal(bb.contains_xy(points), [True, True, False])
+
+
+def test_update_union_intersection():
+    points = np.random.RandomState(0).randn(100, 3)
+    bb = BoundingBox.empty()
+    assert_true(bb.is_empty)
+    for chunk in (points[:30], points[30:0], points[30:]):
+        bb.update(chunk)
+
+    expected = BoundingBox(points)
+    assert_array_equal(bb.min, expected.min)
+    assert_array_equal(bb.max, expected.max)
+
+    other = BoundingBox(min=[0, 0, 0], max=[10, 10, 10])
+    union = bb.union(other)
+    assert_array_equal(union.min, expected.min)
+    assert_array_equal(union.max, [10, 10, 10])
+
+    intersection = bb.intersection(other)
+    assert_array_equal(intersection.min, [0, 0, 0])
+    assert_array_equal(intersection.max, expected.max)
+    assert_true(bb.intersection(BoundingBox(min=[20, 20, 20],
+                                            max=[30, 30, 30])).is_empty)
+
+
+def test_crop():
+    '''Cropping keeps the registration, and can use absolute coordinates'''
+    pc = pcl.PointCloud(np.array([[0, 0, 0], [1, 1, 1], [2, 2, 2]],
+                                 dtype=np.float32))
+    force_srs(pc, srs="EPSG:32633", offset=[100, 200, 0])
+
+    cropped = BoundingBox(min=[0.5, 0.5, 0.5], max=[3, 3, 3]).crop(pc)
+    assert_equal(len(cropped), 2)
+    assert_array_almost_equal(cropped.offset, pc.offset)
+
+    absolute = BoundingBox(min=[99, 199, 5], max=[101.5, 201.5, 6])
+    assert_equal(len(absolute.crop(pc, absolute=True)), 0)
+    assert_array_equal(np.asarray(absolute.crop(pc, xy_only=True,
+                                                absolute=True)),
+                       [[0, 0, 0], [1, 1, 1]])
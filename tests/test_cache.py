@@ -0,0 +1,80 @@
+import os
+import shutil
+import time
+from tempfile import mkdtemp
+
+import numpy as np
+import pcl
+from patty import force_srs
+from patty.cache import StageCache, cached
+
+from numpy.testing import assert_array_equal
+from nose.tools import assert_equal, assert_is_none, assert_not_equal
+import unittest
+
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp(prefix='patty-analytics')
+        self.cache = StageCache(os.path.join(self.tempdir, 'cache'))
+        self.pc = pcl.PointCloud(np.array([[1, 2, 3], [4, 5, 6]],
+                                          dtype=np.float32))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_get_put(self):
+        '''Stored values are returned on a hit, the default on a miss'''
+        key = self.cache.key('stage', self.pc, eps=0.1)
+        assert_is_none(self.cache.get(key))
+
+        self.cache.put(key, np.eye(4))
+        assert_array_equal(self.cache.get(key), np.eye(4))
+
+    def test_key(self):
+        '''Keys depend on the contents, offset and parameters'''
+        key = self.cache.key('stage', self.pc, eps=0.1)
+        assert_equal(key, self.cache.key('stage', self.pc, eps=0.1))
+        assert_not_equal(key, self.cache.key('other', self.pc, eps=0.1))
+        assert_not_equal(key, self.cache.key('stage', self.pc, eps=0.2))
+
+        np.asarray(self.pc)[0, 0] = 7
+        changed = self.cache.key('stage', self.pc, eps=0.1)
+        assert_not_equal(key, changed)
+
+        force_srs(self.pc, offset=[10, 20, 30])
+        assert_not_equal(changed, self.cache.key('stage', self.pc, eps=0.1))
+
+    def test_cached(self):
+        '''cached() calls the function only on a miss'''
+        calls = []
+
+        def function():
+            calls.append(1)
+            return None
+
+        for _ in range(2):
+            assert_is_none(cached(self.cache, function, 'stage', self.pc))
+        assert_equal(len(calls), 1)
+
+        cached(None, function, 'stage', self.pc)
+        assert_equal(len(calls), 2)
+
+    def test_evict(self):
+        '''The least recently used entries are removed first'''
+        value = np.zeros(1000)
+        for name in ('a', 'b', 'c'):
+            self.cache.put(name, value)
+        size = os.path.getsize(self.cache._path('a'))
+
+        # make 'a' the most recently used
+        now = time.time()
+        for age, name in enumerate(('a', 'c', 'b')):
+            os.utime(self.cache._path(name), (now - age, now - age))
+
+        self.cache.max_bytes = 2 * size
+        self.cache.evict()
+        assert_is_none(self.cache.get('b'))
+        assert_array_equal(self.cache.get('a'), value)
+        assert_array_equal(self.cache.get('c'), value)
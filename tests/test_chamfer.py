@@ -0,0 +1,103 @@
+import numpy as np
+import pcl
+from patty.registration import align_footprints
+from patty.registration.chamfer import (chamfer_cost, distance_field,
+                                        match_chamfer, polygon_outline)
+
+from numpy.testing import assert_almost_equal, assert_array_almost_equal
+from nose.tools import assert_less
+
+from helpers import make_triangle, make_tri_pyramid_footprint
+from test_orientation import l_shape
+import unittest
+
+
+def test_distance_field():
+    '''Distances to the nearest footprint point, in meters'''
+    fixed = l_shape()
+    field = distance_field(fixed, cellsize=0.05)
+    assert_less(chamfer_cost(field, fixed), 0.05)
+    assert_almost_equal(chamfer_cost(field, np.array([[2.0, -0.5]])), 0.5,
+                        decimal=1)
+
+    # distances are truncated
+    assert_almost_equal(chamfer_cost(field, np.array([[2.0, -0.5]]),
+                                     max_distance=0.2), 0.2)
+
+
+def test_polygon_outline():
+    '''Points along the edges of a polygon, closing it if needed'''
+    square = np.array([[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]],
+                      dtype=np.float64)
+    outline = polygon_outline(square, spacing=0.5)
+    assert_array_almost_equal(outline, [
+        [0, 0, 1], [0.5, 0, 1], [1, 0, 1], [1, 0.5, 1],
+        [1, 1, 1], [0.5, 1, 1], [0, 1, 1], [0, 0.5, 1]])
+
+    # an already closed polygon gives the same outline
+    closed = np.vstack([square, square[0:1]])
+    assert_array_almost_equal(polygon_outline(closed, spacing=0.5), outline)
+
+
+def test_match_chamfer():
+    '''Recover a small rotation, scaling and translation'''
+    fixed = l_shape()
+    center = fixed.mean(axis=0)
+
+    angle = 0.05
+    rotation = np.array([[np.cos(angle), -np.sin(angle)],
+                         [np.sin(angle), np.cos(angle)]])
+    loose = 1.05 * np.dot(fixed - center, rotation.T) + center + [0.1, -0.1]
+
+    rot_matrix, scale, translation, cost = match_chamfer(loose, fixed, center)
+    placed = (scale * np.dot(loose - center, rot_matrix[0:2, 0:2].T) +
+              center + translation[0:2])
+
+    assert_array_almost_equal(placed, fixed, decimal=1)
+    assert_less(cost, 0.03)
+
+
+class TestAlignFootprints(unittest.TestCase):
+
+    def setUp(self):
+        self.fixed = np.hstack([l_shape(), np.zeros((len(l_shape()), 1))])
+        # an outlier cluster pulls the center of mass and extent away
+        outliers = np.array([[5.0, 3.5, 0.0]] * 20)
+        self.loose = np.vstack([self.fixed + [0.2, 0.1, 0], outliers])
+
+    def test_chamfer_footprint_corners(self):
+        '''A footprint of only its corners is matched along its edges'''
+        corners = make_tri_pyramid_footprint(2, 4, 1, 1, 2, 0)
+        xs, ys = make_triangle(2.0, 4.0, 1.0, 2.0, 0.05)
+        outline = np.vstack([xs, ys, np.zeros(len(xs))]).T
+
+        angle = 0.1
+        rotation = np.array([[np.cos(angle), -np.sin(angle), 0],
+                             [np.sin(angle), np.cos(angle), 0],
+                             [0, 0, 1]])
+        loose = np.dot(outline, rotation.T) + [0.3, -0.2, 0]
+        loose_pc = pcl.PointCloud(loose.astype(np.float32))
+        fixed_pc = pcl.PointCloud(corners.astype(np.float32))
+
+        align_footprints(loose_pc, fixed_pc, method='chamfer',
+                         fixed_polygon=True)
+
+        assert_array_almost_equal(np.asarray(loose_pc)[:, 0:2],
+                                  outline[:, 0:2], decimal=1)
+
+    def test_chamfer(self):
+        '''Chamfer refinement places the footprint despite outliers'''
+        loose_pc = pcl.PointCloud(self.loose.astype(np.float32))
+        fixed_pc = pcl.PointCloud(self.fixed.astype(np.float32))
+
+        rot_matrix, rot_center, scale, translation = align_footprints(
+            loose_pc, fixed_pc, method='chamfer')
+
+        points = np.asarray(loose_pc)[:len(self.fixed)]
+        assert_array_almost_equal(points[:, 0:2], self.fixed[:, 0:2],
+                                  decimal=1)
+
+        # the returned transform is the one applied to loose_pc
+        expected = (scale * np.dot(self.loose - rot_center, rot_matrix.T) +
+                    rot_center + translation)
+        assert_array_almost_equal(np.asarray(loose_pc), expected, decimal=4)
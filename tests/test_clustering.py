@@ -1,9 +1,12 @@
 import pcl
 from patty.segmentation.dbscan import (get_largest_dbscan_clusters,
-                                       _get_top_labels, dbscan_labels)
+                                       _get_top_labels, dbscan_labels,
+                                       cluster_indices, group_labels,
+                                       segment_dbscan)
 import numpy as np
 import unittest
 from nose.tools import assert_equal, assert_equals
+from numpy.testing import assert_array_equal
 
 
 def test_largest_dbscan_clusters():
@@ -68,3 +71,64 @@ class Dbscan_labels(unittest.TestCase):
         labels = dbscan_labels(self.pc, 0.1, 1, rgb_weight=1)
         labelcount = len(np.unique(labels))
         assert_equals(labelcount, 2)
+
+
+def test_group_labels():
+    '''group_labels returns sorted index ranges per label, without noise'''
+    labels = np.array([2, 0, -1, 2, 0, 1, -1, 2])
+    unique_labels, order, bounds = group_labels(labels)
+
+    assert_array_equal(unique_labels, [0, 1, 2])
+    assert_array_equal(bounds, [0, 2, 3, 6])
+    assert_array_equal(order[bounds[0]:bounds[1]], [1, 4])
+    assert_array_equal(order[bounds[1]:bounds[2]], [5])
+    assert_array_equal(order[bounds[2]:bounds[3]], [0, 3, 7])
+
+    unique_labels, order, bounds = group_labels(labels, skip_noise=False)
+    assert_array_equal(unique_labels, [-1, 0, 1, 2])
+    assert_array_equal(order[bounds[0]:bounds[1]], [2, 6])
+
+
+def test_cluster_indices_empty():
+    '''cluster_indices yields nothing for empty or all-noise labels'''
+    assert_equal(list(cluster_indices(np.array([], dtype=int))), [])
+    assert_equal(list(cluster_indices(np.array([-1, -1]))), [])
+
+
+def test_segment_dbscan():
+    '''segment_dbscan yields every clustered point exactly once'''
+    pc = get_one_big_and_10_small_clusters()
+    clusters = list(segment_dbscan(pc, 3., 5))
+    labels = dbscan_labels(pc, 3., 5)
+
+    assert_equal(len(clusters), len(np.unique(labels[labels != -1])))
+    assert_equal(sum(len(cluster) for cluster in clusters),
+                 np.sum(labels != -1))
+
+
+def test_segment_dbscan_labels():
+    '''segment_dbscan with given labels extracts the clusters in the order
+    of cluster_indices'''
+    pc = get_one_big_and_10_small_clusters()
+    labels = dbscan_labels(pc, 3., 5)
+    clusters = list(segment_dbscan(pc, 3., 5, labels=labels))
+
+    for cluster, (_, indices) in zip(clusters, cluster_indices(labels)):
+        assert_array_equal(np.asarray(cluster),
+                           np.asarray(pc)[indices])
+
+
+def test_dbscan_labels_xyzrgb():
+    '''Without rgb_weight, colors are ignored and all algorithms give the
+    same labels'''
+    rng = np.random.RandomState(0)
+    points = np.zeros((2000, 6), dtype=np.float32)
+    points[:, 0:3] = rng.rand(2000, 3) * 10
+    points[:, 3:6] = rng.randint(0, 256, size=(2000, 3))
+    pc = pcl.PointCloudXYZRGB(points)
+
+    expected = dbscan_labels(pcl.PointCloud(points[:, 0:3]), 0.5, 5,
+                             algorithm='ball_tree')
+    for algorithm in ('spatial_index', 'kd_tree', 'ball_tree'):
+        assert_array_equal(dbscan_labels(pc, 0.5, 5, algorithm=algorithm),
+                           expected)
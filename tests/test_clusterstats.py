@@ -0,0 +1,50 @@
+import numpy as np
+from patty.segmentation import cluster_statistics
+from patty.utils import measure_length
+
+from numpy.testing import (assert_array_almost_equal, assert_array_equal,
+                           assert_almost_equal)
+from nose.tools import assert_equal
+
+
+def _make_clusters():
+    rng = np.random.RandomState(0)
+    line = np.zeros((50, 3))
+    line[:, 0] = np.linspace(-2, 3, 50)
+    blob = rng.randn(30, 3) * [0.1, 1.0, 0.1] + [10, 10, 0]
+    noise = rng.rand(5, 3) * 100
+    points = np.vstack([line, blob, noise])
+    labels = np.hstack([np.zeros(50), np.ones(30), -np.ones(5)])
+    return points, labels.astype(int), line, blob
+
+
+def test_cluster_statistics():
+    '''cluster_statistics matches per-cluster computations'''
+    points, labels, line, blob = _make_clusters()
+    stats = cluster_statistics(points, labels)
+
+    assert_array_equal(stats.labels, [0, 1])
+    assert_array_equal(stats.count, [50, 30])
+    assert_array_almost_equal(stats.centroid[1], blob.mean(axis=0))
+    assert_array_almost_equal(stats.covariance[1],
+                              np.cov(blob.T, bias=True))
+    assert_array_almost_equal(stats.bbox_min[0], [-2, 0, 0])
+    assert_array_almost_equal(stats.bbox_max[0], [3, 0, 0])
+
+    assert_almost_equal(stats.length[0], 5.0)
+    assert_almost_equal(stats.length[1], measure_length(blob))
+    assert_almost_equal(abs(stats.axes[0, 0, 0]), 1.0)
+
+
+def test_cluster_statistics_single_point():
+    '''A single point cluster has zero length'''
+    stats = cluster_statistics(np.array([[1., 2., 3.]]), np.array([4]))
+    assert_array_equal(stats.labels, [4])
+    assert_almost_equal(stats.length[0], 0.0)
+
+
+def test_cluster_statistics_noise_only():
+    '''Noise only gives empty statistics'''
+    stats = cluster_statistics(np.zeros((3, 3)), -np.ones(3, dtype=int))
+    assert_equal(len(stats.labels), 0)
+    assert_equal(stats.centroid.shape, (0, 3))
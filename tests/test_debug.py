@@ -0,0 +1,50 @@
+import os
+import shutil
+from tempfile import mkdtemp
+
+import numpy as np
+import pcl
+from patty import force_srs
+from patty.debug import (configure_debug, debug_enabled, debug_save,
+                         flush_debug)
+
+from numpy.testing import assert_array_almost_equal
+from nose.tools import assert_equal, assert_false, assert_true
+import unittest
+
+
+class TestDebugArtifacts(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp(prefix='patty-analytics')
+        self.pc = pcl.PointCloud(np.array([[1, 2, 3], [4, 5, 6]],
+                                          dtype=np.float32))
+        force_srs(self.pc, offset=[10, 20, 30])
+
+    def tearDown(self):
+        configure_debug(None)
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_disabled(self):
+        '''Nothing is written when debug artifacts are disabled'''
+        configure_debug(None)
+        assert_false(debug_enabled())
+        debug_save('nothing', self.pc)
+        flush_debug()
+        assert_equal(os.listdir(self.tempdir), [])
+
+    def test_save(self):
+        '''debug_save writes a snapshot of the points and offset'''
+        directory = os.path.join(self.tempdir, 'artifacts')
+        configure_debug(directory, run='site1')
+        assert_true(debug_enabled())
+
+        debug_save('bound', self.pc)
+        np.asarray(self.pc)[:] = 0
+        flush_debug()
+
+        filename = 'site1.%d.bound.npz' % os.getpid()
+        assert_equal(os.listdir(directory), [filename])
+        data = np.load(os.path.join(directory, filename))
+        assert_array_almost_equal(data['points'], [[1, 2, 3], [4, 5, 6]])
+        assert_array_almost_equal(data['offset'], [10, 20, 30])
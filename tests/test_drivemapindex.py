@@ -0,0 +1,108 @@
+import os
+import pickle
+import shutil
+from tempfile import mkdtemp
+
+import numpy as np
+import pcl
+from patty import force_srs
+from patty.cache import StageCache
+from patty.registration import DrivemapIndex
+from patty.segmentation import boundary_of_drivemap
+
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from nose.tools import (assert_equal, assert_is_none, assert_is_not_none,
+                        assert_not_equal)
+import unittest
+
+
+class TestDrivemapIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        points = np.zeros((500, 6), dtype=np.float32)
+        points[:, 0:2] = rng.rand(500, 2) * 10
+        points[:, 2] = rng.rand(500) * 3 + 1
+        self.drivemap = pcl.PointCloudXYZRGB(points)
+        force_srs(self.drivemap, srs="EPSG:32633", offset=[100, 200, 0])
+        self.footprint = pcl.PointCloud(np.array(
+            [[2, 2, 0], [8, 2, 0], [8, 8, 0], [2, 8, 0]], dtype=np.float32))
+        self.tempdir = mkdtemp(prefix='patty-analytics')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_index(self):
+        '''DrivemapIndex holds the basemap height and normals'''
+        index = DrivemapIndex(self.drivemap).build()
+        assert_equal(len(index), 500)
+        assert_array_almost_equal(index.basemap_height,
+                                  np.asarray(self.drivemap)[:, 2].min())
+        assert_equal(index.normals.shape, (500, 3))
+        assert_array_almost_equal(np.linalg.norm(index.normals, axis=1),
+                                  np.ones(500))
+
+    def test_build_gicp(self):
+        '''Building for gicp computes no KD-tree or normals'''
+        index = DrivemapIndex(self.drivemap).build('gicp')
+        assert_is_none(index._tree)
+        assert_is_none(index._covariances)
+        assert_is_none(index._normals)
+
+    def test_save_load(self):
+        '''A saved and loaded index gives the same data and pointcloud'''
+        index = DrivemapIndex(self.drivemap).build()
+        path = os.path.join(self.tempdir, 'index.npz')
+        index.save(path)
+
+        loaded = DrivemapIndex.load(path)
+        assert_array_equal(loaded.points, index.points)
+        assert_array_almost_equal(loaded.normals, index.normals)
+        assert_array_almost_equal(loaded.pointcloud.offset, [100, 200, 0])
+        assert_array_equal(np.asarray(loaded.pointcloud),
+                           np.asarray(self.drivemap))
+
+    def test_save_load_unbuilt(self):
+        '''An index saved before its normals are computed computes them
+        after loading'''
+        path = os.path.join(self.tempdir, 'index.npz')
+        DrivemapIndex(self.drivemap).save(path)
+
+        loaded = DrivemapIndex.load(path)
+        assert_is_none(loaded._normals)
+        assert_array_almost_equal(loaded.normals,
+                                  DrivemapIndex(self.drivemap).normals)
+
+    def test_pickle(self):
+        '''Pickling keeps the KD-tree, and drops the pointcloud'''
+        index = DrivemapIndex(self.drivemap)
+        index.tree
+        state = index.__getstate__()
+        assert_is_none(state['_pointcloud'])
+
+        copy = pickle.loads(pickle.dumps(index))
+        assert_is_not_none(copy._tree)
+        assert_array_equal(copy.tree.query([[5, 5, 2]])[1],
+                           index.tree.query([[5, 5, 2]])[1])
+
+    def test_content_digest(self):
+        '''Cache keys use the digest of the index, computed once'''
+        index = DrivemapIndex(self.drivemap)
+        digest = index.content_digest
+        assert_equal(digest, DrivemapIndex(self.drivemap).content_digest)
+        assert_equal(digest, pickle.loads(pickle.dumps(index))._digest)
+
+        cache = StageCache(os.path.join(self.tempdir, 'cache'))
+        key = cache.key('stage', index)
+        assert_equal(key, cache.key('stage', DrivemapIndex(self.drivemap)))
+
+        # the points are not hashed again
+        index._digest = 'other'
+        assert_not_equal(key, cache.key('stage', index))
+
+    def test_boundary_of_drivemap(self):
+        '''boundary_of_drivemap gives the same result for an index'''
+        expected = boundary_of_drivemap(self.drivemap, self.footprint)
+        actual = boundary_of_drivemap(DrivemapIndex(self.drivemap),
+                                      self.footprint)
+        assert_array_equal(np.asarray(actual), np.asarray(expected))
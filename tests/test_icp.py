@@ -0,0 +1,54 @@
+import numpy as np
+from patty.registration import point_to_plane_icp
+from patty.registration.icp import local_covariances, normals_from_covariances
+
+from numpy.testing import assert_array_almost_equal
+from nose.tools import assert_true, assert_false, assert_less
+
+from helpers import rotation_around_axis
+
+
+def _make_corner(n=40, size=2.0):
+    '''Three orthogonal planes meeting in the origin'''
+    rng = np.random.RandomState(0)
+    u, v = [a.ravel() for a in np.meshgrid(np.linspace(0, size, n),
+                                           np.linspace(0, size, n))]
+    zero = np.zeros_like(u)
+    points = np.vstack([np.column_stack([u, v, zero]),
+                        np.column_stack([u, zero, v]),
+                        np.column_stack([zero, u, v])])
+    return points + rng.randn(*points.shape) * 0.001
+
+
+def test_normals():
+    '''Normals of a plane point along its normal direction'''
+    corner = _make_corner(n=20)
+    floor = corner[:400]
+    normals = normals_from_covariances(local_covariances(floor, k=8))
+    assert_array_almost_equal(np.abs(normals[:, 2]), np.ones(len(floor)),
+                              decimal=2)
+
+
+def test_point_to_plane_icp():
+    '''ICP recovers a small rigid motion'''
+    target = _make_corner()
+    rotation = rotation_around_axis([1, 2, 3], 0.05)
+    translation = np.array([0.05, -0.04, 0.03])
+    source = np.dot(target, rotation.T) + translation
+
+    converged, transf, estimate, fitness = point_to_plane_icp(
+        source, target, max_correspondence_distance=0.5)
+
+    assert_true(converged)
+    assert_array_almost_equal(transf[0:3, 0:3], rotation.T, decimal=3)
+    assert_array_almost_equal(np.asarray(estimate), target, decimal=2)
+    assert_less(fitness, 1e-4)
+
+
+def test_point_to_plane_icp_budget():
+    '''A zero time budget stops ICP before convergence'''
+    target = _make_corner(n=10)
+    converged, transf, _, _ = point_to_plane_icp(target + 0.01, target,
+                                                 time_budget=0.0)
+    assert_false(converged)
+    assert_array_almost_equal(transf, np.eye(4))
@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pcl
+from patty import downsample_voxel
+from patty.instrument import (configure_metrics, count, metrics_records,
+                              metrics_summary, read_metrics, span, timed)
+from patty.memory import tracing_available
+
+from nose.plugins.skip import SkipTest
+from nose.tools import (assert_equal, assert_greater, assert_in, assert_less,
+                        assert_true)
+
+
+@timed('double')
+def _double(pointcloud):
+    count('calls')
+    return pcl.PointCloud(np.vstack([np.asarray(pointcloud)] * 2))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'metrics.jsonl')
+        configure_metrics(self.path, run='test')
+        self.pc = pcl.PointCloud(np.zeros((10, 3), dtype=np.float32))
+
+    def tearDown(self):
+        configure_metrics(enabled=False)
+        shutil.rmtree(self.directory)
+
+    def test_nested_spans(self):
+        '''Spans nest, and record point counts and counters'''
+        with span('outer') as s:
+            s.set(tiles=3)
+            _double(self.pc)
+
+        records = read_metrics(self.path)
+        assert_equal([r['span'] for r in records], ['outer/double', 'outer'])
+        assert_equal(records[0]['points_in'], 10)
+        assert_equal(records[0]['points_out'], 20)
+        assert_equal(records[0]['counters'], {'calls': 1})
+        assert_equal(records[1]['tiles'], 3)
+        assert_true(records[1]['seconds'] >= records[0]['seconds'])
+
+        summary = metrics_summary(records)
+        assert_in('outer/double', summary)
+        assert_in('calls', summary)
+
+    def test_errors(self):
+        '''Spans are recorded when an exception is raised'''
+        try:
+            with span('failing'):
+                raise ValueError()
+        except ValueError:
+            pass
+        assert_equal(read_metrics(self.path)[-1]['error'], 'ValueError')
+
+    def test_pipeline_function(self):
+        '''Pipeline functions are instrumented'''
+        downsample_voxel(self.pc, 0.1)
+        record = metrics_records()[-1]
+        assert_equal(record['span'], 'downsample_voxel')
+        assert_equal(record['points_in'], 10)
+        assert_equal(record['points_out'], 1)
+
+        # numpy values in the fields are written as JSON
+        with span('numpy', size=np.float32(1.5), shape=np.array([1, 2])):
+            pass
+        with open(self.path) as f:
+            record = json.loads(f.readlines()[-1])
+        assert_equal(record['shape'], [1, 2])
+
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        if not tracing_available():
+            raise SkipTest("tracemalloc.reset_peak needs Python 3.9+")
+        configure_metrics(trace_memory=True)
+
+    def tearDown(self):
+        configure_metrics(enabled=False, trace_memory=False)
+
+    def test_traced_peak(self):
+        '''Peaks of nested spans, and the largest allocations'''
+        with span('outer'):
+            with span('allocate'):
+                # 80 MB, freed before the end of the span
+                np.ones(10 * 1024 * 1024).sum()
+            with span('small'):
+                pass
+            kept = np.ones(1024 * 1024)
+
+        records = dict((r['span'], r) for r in metrics_records()[-3:])
+        assert_greater(records['outer/allocate']['traced_peak_mb'], 79)
+        assert_less(records['outer/small']['traced_peak_mb'], 1)
+        assert_greater(records['outer']['traced_peak_mb'], 79)
+        assert_greater(records['outer']['rss_mb'], 0)
+
+        # the 8 MB array is still allocated at the end of the span
+        site, size = records['outer']['largest_allocations'][0]
+        assert_in('test_instrument.py', site)
+        assert_greater(size, 7.9)
+        assert_equal(len(kept), 1024 * 1024)
+
+
+def test_disabled():
+    '''Nothing is recorded when disabled'''
+    configure_metrics(enabled=False)
+    before = len(metrics_records())
+    with span('nothing') as s:
+        s.set(x=1)
+        count('y')
+    _double(pcl.PointCloud(np.zeros((1, 3), dtype=np.float32)))
+    assert_equal(len(metrics_records()), before)
@@ -0,0 +1,48 @@
+import numpy as np
+from patty import Moments
+
+from numpy.testing import assert_array_almost_equal, assert_almost_equal
+from nose.tools import assert_equal, assert_raises
+
+
+def _points():
+    rng = np.random.RandomState(0)
+    return rng.randn(1000, 3) * [5.0, 2.0, 0.1] + [100.0, -20.0, 3.0]
+
+
+def test_moments():
+    '''Moments matches numpy mean and covariance'''
+    points = _points()
+    moments = Moments(points, chunk_size=77)
+
+    assert_equal(moments.count, 1000)
+    assert_array_almost_equal(moments.mean, points.mean(axis=0))
+    assert_array_almost_equal(moments.covariance,
+                              np.cov(points.T, bias=True))
+
+
+def test_moments_merge():
+    '''Merging accumulators equals accumulating all points at once'''
+    points = _points()
+    first = Moments(points[:300])
+    second = Moments(dim=3).update(points[300:650]).update(points[650:])
+    first.merge(second)
+    first.merge(Moments(dim=3))
+
+    assert_equal(first.count, 1000)
+    assert_array_almost_equal(first.mean, points.mean(axis=0))
+    assert_array_almost_equal(first.covariance, np.cov(points.T, bias=True))
+
+
+def test_principal_axes():
+    '''Principal axes are sorted by variance'''
+    variances, axes = Moments(_points()).principal_axes()
+
+    assert_array_almost_equal(np.abs(axes), np.eye(3), decimal=1)
+    assert_almost_equal(variances[0] / 25.0, 1.0, decimal=1)
+    assert_equal(list(variances), sorted(variances, reverse=True))
+
+
+def test_moments_needs_dimension():
+    '''Moments needs either points or a dimension'''
+    assert_raises(TypeError, Moments)
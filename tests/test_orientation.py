@@ -0,0 +1,46 @@
+import numpy as np
+from patty.registration import score_rotations
+from patty.registration.orientation import occupancy_grid, best_orientations
+
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from nose.tools import assert_equal
+
+
+def l_shape(step=0.05):
+    '''Outline of an L-shaped footprint, 4 by 3 meters'''
+    corners = np.array([[0, 0], [4, 0], [4, 1], [1, 1], [1, 3], [0, 3],
+                        [0, 0]], dtype=np.float64)
+    points = []
+    for start, end in zip(corners[:-1], corners[1:]):
+        n = int(np.ceil(np.linalg.norm(end - start) / step))
+        t = np.linspace(0, 1, n, endpoint=False)[:, np.newaxis]
+        points.append(start + t * (end - start))
+    return np.vstack(points)
+
+
+def test_occupancy_grid():
+    '''Cells holding points are set, points outside the grid are ignored'''
+    points = np.array([[0.1, 0.1], [0.15, 0.12], [1.9, 0.5], [5.0, 5.0]])
+    grid = occupancy_grid(points, np.array([0.0, 0.0]), 1.0, (2, 2))
+    assert_array_equal(grid, [[1, 0], [1, 0]])
+
+
+def test_score_rotations():
+    '''The rotation that undoes a quarter turn scores best'''
+    fixed = l_shape()
+    center = fixed.mean(axis=0)
+
+    turn = np.array([[0, 1], [-1, 0]])  # clockwise quarter turn
+    loose = np.dot(fixed - center, turn.T) + center + [0.3, -0.2]
+
+    angles = np.arange(4) * np.pi / 2
+    scores, shifts = score_rotations(loose, fixed, center, angles,
+                                     cellsize=0.1)
+
+    assert_equal(best_orientations(scores, keep=1), [1])
+    assert_array_almost_equal(shifts[1], [-0.2, -0.3], decimal=1)
+
+
+def test_best_orientations():
+    '''Best scores first, ties in order'''
+    assert_equal(best_orientations([0.2, 0.9, 0.5, 0.9], keep=3), [1, 3, 2])
@@ -0,0 +1,64 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pcl
+from patty import downsample_voxel
+from patty.instrument import timed
+from patty.profiling import configure_profiling, profiled
+
+from nose.tools import assert_equal, assert_in
+
+
+@timed('outer_stage')
+def _outer(pointcloud):
+    return downsample_voxel(pointcloud, 0.5)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pc = pcl.PointCloud(np.random.rand(100, 3).astype(np.float32))
+
+    def tearDown(self):
+        configure_profiling(None)
+        shutil.rmtree(self.directory)
+
+    def _files(self):
+        return sorted(name.split('.', 2)[2]
+                      for name in os.listdir(self.directory))
+
+    def test_nested_stages(self):
+        '''One profile per call of a stage; nested stages are separate'''
+        configure_profiling(self.directory, run='test')
+        _outer(self.pc)
+        _outer(self.pc)
+
+        assert_equal(self._files(), [
+            'downsample_voxel.0.pstats', 'downsample_voxel.0.txt',
+            'downsample_voxel.1.pstats', 'downsample_voxel.1.txt',
+            'outer_stage.0.pstats', 'outer_stage.0.txt',
+            'outer_stage.1.pstats', 'outer_stage.1.txt'])
+
+        name = [n for n in os.listdir(self.directory)
+                if n.endswith('downsample_voxel.0.pstats')][0]
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        functions = [function for _, _, function in stats.stats]
+        assert_in('voxel_downsample', functions)
+
+    def test_selected_stages(self):
+        configure_profiling(self.directory, stages='outer_stage')
+        _outer(self.pc)
+        with profiled('not_selected'):
+            pass
+        assert_equal(self._files(), ['outer_stage.0.pstats',
+                                     'outer_stage.0.txt'])
+
+        # the text summary is sorted by cumulative time
+        name = [n for n in os.listdir(self.directory) if n.endswith('.txt')]
+        with open(os.path.join(self.directory, name[0])) as f:
+            assert_in('cumulative', f.read())
@@ -5,12 +5,14 @@ from tempfile import mkdtemp
 import numpy as np
 import pcl
 
-from patty import utils
+from patty import utils, Affine
+from patty.registration.registration import _accept_attempt
 from patty.utils import downsample_voxel
 
 from helpers import make_tri_pyramid_with_base
 
 from sklearn.utils.extmath import cartesian
+from nose.tools import assert_equal, assert_false
 import unittest
 
 
@@ -102,3 +104,19 @@ class TestRegistrationPipeline(unittest.TestCase):
         # array_in_margin(target.mean(axis=0), actual.mean(axis=0), [1, 1, 1],
         #                 "Middle point of registered cloud does not"
         #                 " match expectation")
+
+
+def test_accept_attempt_cumulative_translation():
+    '''ICP levels that each move less than 5 m, but together more, are
+    rejected'''
+    start = Affine().rotate(np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]]),
+                            origin=[100, 200, 0]).matrix
+    step = Affine().translate([3, 0, 0]).matrix
+
+    once = np.dot(step, start)
+    assert_equal(_accept_attempt(0, once, start, 0.1), (True, 0.1))
+
+    twice = np.dot(step, once)
+    success, fitness = _accept_attempt(0, twice, start, 0.1)
+    assert_false(success)
+    assert_equal(fitness, 1e30)
@@ -0,0 +1,83 @@
+import numpy as np
+import pcl
+from patty import utils
+from patty.sampling import (BernoulliSampler, ReservoirSampler,
+                            poisson_disk_sample, reservoir_sample)
+from scipy.spatial import cKDTree
+
+from numpy.testing import assert_array_equal
+from nose.tools import assert_equal, assert_greater, assert_less
+
+
+def _sample_chunks(sampler, points, chunk_size):
+    for start in range(0, len(points), chunk_size):
+        sampler.update(points[start:start + chunk_size], start)
+    return sampler.result()
+
+
+def test_bernoulli_sampler():
+    '''Per chunk seeding gives reproducible samples'''
+    chunks = [np.zeros((1000, 3))] * 5
+    masks = [BernoulliSampler(0.2, seed=1).mask(chunk) for chunk in chunks]
+    sampler = BernoulliSampler(0.2, seed=1)
+    again = [sampler.mask(chunk) for chunk in chunks]
+
+    assert_array_equal(masks[0], again[0])
+    assert_greater(np.count_nonzero(again[0] != again[1]), 0)
+    assert_less(abs(np.mean(again) - 0.2), 0.03)
+
+
+def test_reservoir_sampler():
+    '''Exact sample size, uniform over the chunks'''
+    points = np.arange(3000, dtype=float).reshape(-1, 3)
+
+    indices, sample = _sample_chunks(ReservoirSampler(100, seed=3), points,
+                                     chunk_size=128)
+    assert_equal(len(indices), 100)
+    assert_equal(len(np.unique(indices)), 100)
+    assert_array_equal(sample, points[indices])
+    assert_array_equal(indices, np.sort(indices))
+
+    # reproducible
+    assert_array_equal(reservoir_sample(points, 100, seed=3, chunk_size=128),
+                       indices)
+
+    # all points, when asking for more
+    assert_array_equal(reservoir_sample(points, 5000), np.arange(1000))
+
+    # uniform: every point is equally likely to be drawn
+    counts = np.zeros(len(points))
+    for seed in range(200):
+        counts[reservoir_sample(points, 100, seed=seed, chunk_size=300)] += 1
+    assert_less(abs(counts[:500].mean() - counts[500:].mean()), 2)
+
+
+def test_poisson_disk_sample():
+    '''Samples are at least radius apart and cover sparse regions'''
+    rng = np.random.RandomState(0)
+    dense = rng.rand(20000, 3) * [1, 1, 0.01]
+    sparse = rng.rand(200, 3) * [1, 1, 0.01] + [2, 0, 0]
+    points = np.vstack([dense, sparse])
+
+    radius = 0.1
+    indices = poisson_disk_sample(points, radius, seed=0, chunk_size=3000)
+    sample = points[indices]
+
+    distances, _ = cKDTree(sample).query(sample, k=2)
+    assert_greater(distances[:, 1].min(), radius)
+
+    # every point has a sample nearby
+    distances, _ = cKDTree(sample).query(points)
+    assert_less(distances.max(), 2 * radius)
+
+    # the dense part does not dominate
+    in_sparse = np.count_nonzero(indices >= len(dense))
+    assert_greater(in_sparse, 0.5 * np.count_nonzero(indices < len(dense)))
+
+
+def test_downsample_poisson():
+    pc = pcl.PointCloud((np.random.rand(1000, 3)).astype(np.float32))
+    sample = utils.downsample_poisson(pc, 0.2, random_seed=0)
+
+    assert_greater(len(sample), 1)
+    assert_less(len(sample), 100)
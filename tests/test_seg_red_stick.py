@@ -1,7 +1,14 @@
+import colorsys
+import os
+import shutil
+from tempfile import mkdtemp
+
 import numpy as np
 import pcl
-from patty.segmentation.segRedStick import get_red_mask
-from numpy.testing import assert_almost_equal
+from patty.utils import load
+from patty.segmentation.segRedStick import (get_red_mask, is_red,
+                                            RedPointCollector)
+from numpy.testing import assert_almost_equal, assert_array_equal
 
 
 def test_centered_line_on_x_axis():
@@ -19,3 +26,54 @@ def test_centered_line_on_x_axis():
 
     # Assert
     assert_almost_equal(sum(reds), expected)
+
+    # the same for the points as array
+    assert_array_equal(get_red_mask(ar), reds)
+
+
+def test_is_red_matches_colorsys():
+    '''is_red gives the same result as colorsys, also for grey and black'''
+    colors = np.random.RandomState(0).randint(0, 256, (1000, 3))
+    colors[:10] = colors[:10, [0]]
+    colors[10:20] = 0
+    colors = colors.astype(np.float32)
+
+    expected = []
+    for red, grn, blu in colors:
+        hue, sat, _ = colorsys.rgb_to_hsv(red, grn, blu)
+        expected.append(hue > 0.9 and sat > 0.5)
+
+    assert_array_equal(is_red(colors), expected)
+
+
+def test_red_point_collector():
+    '''Red points are collected chunk by chunk, with their indices'''
+    ar = np.asarray([[0, 0, 0, 210, 25, 30],
+                     [1, 1, 1, 0, 0, 150],
+                     [2, 2, 2, 200, 20, 40],
+                     [3, 3, 3, 0, 150, 70]], dtype=np.float64)
+
+    collector = RedPointCollector()
+    collector.update(ar[0:3], 0)
+    collector.update(ar[3:4], 3)
+    collector.update(ar[0:0], 4)
+
+    assert_array_equal(collector.indices, [0, 2])
+    assert_array_equal(collector.points, [[0, 0, 0], [2, 2, 2]])
+
+
+def test_red_point_collector_load():
+    '''Red points are collected from a colored file that is not LAS'''
+    ar = np.asarray([[0, 0, 0, 210, 25, 30],
+                     [1, 1, 1, 0, 0, 150],
+                     [2, 2, 2, 200, 20, 40]], dtype=np.float32)
+    tempdir = mkdtemp(prefix='patty-analytics')
+    try:
+        path = os.path.join(tempdir, 'reds.pcd')
+        pcl.save(pcl.PointCloudXYZRGB(ar), path)
+
+        collector = RedPointCollector()
+        load(path, side_outputs=[collector])
+        assert_array_equal(collector.indices, [0, 2])
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
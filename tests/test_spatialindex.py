@@ -0,0 +1,50 @@
+import numpy as np
+import pcl
+from patty import Affine
+from patty.segmentation import dbscan_labels
+from patty.spatialindex import invalidate_spatial_index, spatial_index
+from sklearn.cluster import dbscan
+
+from numpy.testing import assert_array_equal
+from nose.tools import assert_is, assert_is_not
+
+
+def _pointcloud():
+    points = np.random.RandomState(0).rand(500, 3).astype(np.float32)
+    return pcl.PointCloud(points)
+
+
+def test_reuse():
+    '''The tree is built once for unchanged points'''
+    pc = _pointcloud()
+    tree = spatial_index(pc)
+    assert_is(spatial_index(pc), tree)
+
+
+def test_invalidation():
+    '''Points moved by patty, or invalidated explicitly, get a new tree'''
+    pc = _pointcloud()
+    tree = spatial_index(pc)
+
+    Affine().translate([1, 0, 0]).apply(pc)
+    moved = spatial_index(pc)
+    assert_is_not(moved, tree)
+    assert_array_equal(moved.data[0], np.asarray(pc, dtype=np.float64)[0])
+
+    np.asarray(pc)[0, 0] += 1
+    invalidate_spatial_index(pc)
+    changed = spatial_index(pc)
+    assert_is_not(changed, moved)
+    assert_array_equal(changed.data[0], np.asarray(pc, dtype=np.float64)[0])
+
+
+def test_dbscan_labels():
+    '''DBSCAN on the cached tree gives the same clusters as sklearn'''
+    pc = _pointcloud()
+    points = np.asarray(pc)
+    points[1] = points[0]  # duplicate points are neighbors too
+
+    _, expected = dbscan(points, eps=0.1, min_samples=5)
+    assert_array_equal(dbscan_labels(pc, 0.1, 5), expected)
+    assert_array_equal(dbscan_labels(pc, 0.1, 5, algorithm='spatial_index'),
+                       expected)
@@ -4,7 +4,7 @@ from patty.segmentation import get_red_mask
 from patty import load, extract_mask
 from nose_parameterized import parameterized
 
-from nose.tools import assert_greater, assert_less
+from nose.tools import assert_equal, assert_greater, assert_less
 
 from helpers import make_red_stick, _add_noise
 import pcl
@@ -59,6 +59,19 @@ def test_stickscale(noise):
     assert_with_error(confidence, 1.0)
 
 
+def test_stickscale_red_indices():
+    '''Known red indices give the same estimate as searching them'''
+    s1 = make_red_stick([0, 0, 0], [0, 1, 0])
+    s2 = make_red_stick([1, 2, 0], [1, 1, 0])
+    s3 = make_red_stick([3, 3, 0], [3, 4, 0])
+    data = np.array(np.concatenate((s1, s2, s3), axis=0), dtype=np.float32)
+    pc = pcl.PointCloudXYZRGB(data)
+
+    red_indices = np.flatnonzero(get_red_mask(pc))
+    assert_equal(get_stick_scale(pc, red_indices=red_indices),
+                 get_stick_scale(pc))
+
+
 @parameterized.expand([
     (500, 3, 1.0),
     (100, 3, 1.0 / 5.0),
@@ -0,0 +1,56 @@
+import numpy as np
+import pcl
+from patty import PointSubset, extract_mask, force_srs, is_registered
+
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+from nose.tools import assert_equal, assert_false, assert_true
+
+
+def _registered_cloud():
+    pc = pcl.PointCloud(np.arange(30, dtype=np.float32).reshape(-1, 3))
+    force_srs(pc, srs="EPSG:32633", offset=[100, 200, 0])
+    return pc
+
+
+def test_chained_views():
+    '''Masks on a subset refer to the original pointcloud'''
+    pc = _registered_cloud()
+    points = np.asarray(pc)
+
+    subset = extract_mask(pc, points[:, 0] > 5, view=True)
+    assert_equal(len(subset), 8)
+    assert_true(subset.parent is pc)
+    assert_true(is_registered(subset))
+
+    subsubset = extract_mask(subset, np.asarray(subset)[:, 1] < 20)
+    assert_true(subsubset.parent is pc)
+    assert_array_equal(subsubset.indices, [2, 3, 4, 5, 6])
+    assert_array_equal(np.asarray(subsubset), points[2:7])
+
+    # no copy: changes to the parent show up
+    points[2, 0] = -1
+    assert_equal(np.asarray(subsubset)[0, 0], -1)
+
+
+def test_materialize():
+    pc = _registered_cloud()
+    subset = PointSubset(pc, [1, 3]).extract([1])
+
+    materialized = subset.materialize()
+    assert_array_equal(np.asarray(materialized), np.asarray(pc)[[3]])
+    assert_array_almost_equal(materialized.offset, pc.offset)
+
+
+def test_unregistered():
+    pc = pcl.PointCloud(np.zeros((3, 3), dtype=np.float32))
+    assert_false(is_registered(PointSubset(pc, [0])))
+
+
+def test_to_array_colors():
+    '''to_array of a subset of a colored cloud has the colors'''
+    points = np.arange(18, dtype=np.float32).reshape(-1, 6)
+    pc = pcl.PointCloudXYZRGB(points)
+
+    subset = PointSubset(pc, [2, 0])
+    assert_array_equal(subset.to_array(), points[[2, 0]])
+    assert_array_equal(np.asarray(subset), np.asarray(pc)[[2, 0]])
@@ -3,7 +3,7 @@ from tempfile import NamedTemporaryFile
 
 import pcl
 import numpy as np
-from patty import utils
+from patty import utils, Affine
 
 from numpy.testing import assert_array_almost_equal
 from nose.tools import assert_equal, assert_raises
@@ -81,3 +81,32 @@ def test_downsample_random():
     assert_raises(ValueError, utils.downsample_random, pc, 2)
 
     assert_equal(len(utils.downsample_random(pc, .39)), 4)
+
+
+def test_las_sample_and_transform():
+    '''Read a sample of a LAS file, and transform it chunk by chunk'''
+    pc = pcl.PointCloud(100)
+    pc_arr = np.asarray(pc)
+    pc_arr[:] = np.random.randn(*pc_arr.shape)
+
+    with NamedTemporaryFile(suffix='.las') as source, \
+            NamedTemporaryFile(suffix='.las') as target:
+        utils.save(pc, source.name)
+
+        sample = utils.load_las_sample(source.name, 1.0, chunk_size=7)
+        assert_array_almost_equal(
+            np.asarray(sample)[:, 0:3] + sample.offset, pc_arr, 2)
+
+        assert_equal(len(utils.load_las_sample(source.name, 0.0)), 0)
+
+        rotation = [[0, -1, 0], [1, 0, 0], [0, 0, 1]]
+        transform = Affine().rotate(rotation).translate([1, 2, 3])
+        target_offset = np.array([10.0, 20.0, 30.0])
+        utils.transform_las(source.name, target.name, transform,
+                            sample.offset, target_offset, chunk_size=7)
+
+        result = utils.load(target.name)
+        expected = (transform.transform_points(pc_arr - sample.offset) +
+                    target_offset)
+        assert_array_almost_equal(
+            np.asarray(result)[:, 0:3] + result.offset, expected, 2)
@@ -2,8 +2,11 @@ import logging
 import pcl
 import numpy as np
 from helpers import make_tri_pyramid_with_base
+from patty import utils, VoxelGrid
+from patty.voxelgrid import voxel_downsample
 
-from nose.tools import assert_greater
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from nose.tools import assert_greater, assert_raises
 
 logging.basicConfig(level=logging.INFO)
 
@@ -37,3 +40,56 @@ def test_filter():
     assert_greater(len(pc), len(pc2))
     assert_greater(len(pc3), len(pc2))
     assert_greater(len(pc), len(pc4))
+
+
+def _brute_force_voxels(points, origin, voxel_size):
+    '''Means and counts per voxel, with a dict'''
+    voxels = {}
+    for point in points:
+        key = tuple(np.floor((point[0:3] - origin) / voxel_size).astype(int))
+        voxels.setdefault(key, []).append(point)
+    keys = sorted(voxels)
+    return (np.array([np.mean(voxels[key], axis=0) for key in keys]),
+            np.array([len(voxels[key]) for key in keys]))
+
+
+def test_voxel_grid():
+    '''Means and counts per voxel do not depend on the chunking'''
+    points = np.random.RandomState(0).rand(1000, 6) * [3, 3, 3, 255, 255, 255]
+    origin = points[:, 0:3].min(axis=0)
+    expected_means, expected_counts = _brute_force_voxels(points, origin, 0.5)
+
+    for chunk_size in (1000, 77):
+        means, counts = voxel_downsample(points, 0.5, chunk_size=chunk_size)
+        assert_array_almost_equal(means, expected_means)
+        assert_array_equal(counts, expected_counts)
+
+    grid = VoxelGrid(0.5, origin)
+    grid.update(points[:500])
+    grid.update(points[500:])
+    means, counts = grid.result()
+    assert_array_equal(counts, expected_counts)
+
+
+def test_voxel_grid_large_extent():
+    '''Small voxels over tens of kilometers'''
+    points = np.array([[0, 0, 0], [0.01, 0.01, 0.01], [50000, 40000, 100]])
+    means, counts = voxel_downsample(points, 0.05)
+    assert_array_equal(counts, [2, 1])
+    assert_array_almost_equal(means[1], [50000, 40000, 100])
+
+    assert_raises(ValueError, voxel_downsample, points, 0.01)
+
+
+def test_downsample_voxel():
+    '''Centroid and mean color per voxel, with counts'''
+    points = np.array([[0, 0, 0, 10, 20, 30],
+                       [0.5, 0.5, 0.5, 20, 30, 41],
+                       [2, 2, 2, 0, 0, 0]], dtype=np.float32)
+    pc = pcl.PointCloudXYZRGB(points)
+
+    filtered, counts = utils.downsample_voxel(pc, 1.0, return_counts=True)
+    assert_array_equal(counts, [2, 1])
+    assert_array_almost_equal(filtered.to_array(),
+                              [[0.25, 0.25, 0.25, 15, 25, 36],
+                               [2, 2, 2, 0, 0, 0]])